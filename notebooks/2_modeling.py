@@ -85,9 +85,11 @@ import shap
 
 # Local imports
 from src.modeling import (
+    load_split,
     get_baseline_models,
     train_and_evaluate,
     weighted_median_absolute_error,
+    CompactForestRegressor,
     save_model,
     load_model,
     save_metrics,
@@ -131,13 +133,14 @@ from src.display import (
 #     <h1 style="margin:0px">Data Loading</h1>
 # </div>
 # <div style="background-color:#fff6e4; padding:15px; border:3px solid #f5ecda; border-radius:6px;">
-#     📌 Load the model-ready data from the <code>.parquet</code> files into Pandas DataFrames.
+#     📌 Load the model-ready X features, y target variable, and sample weights (w) from the <code>.parquet</code> files. The splits are cached as memory-mapped <code>.npy</code> files keyed by the Parquet md5 (shared with the training scripts), so reloading is near-instant.
 # </div>
 
 # %%
-df_train_preprocessed = pd.read_parquet("../data/training_data_model_ready.parquet")
-df_val_preprocessed = pd.read_parquet("../data/validation_data_model_ready.parquet")
-df_test_preprocessed = pd.read_parquet("../data/test_data_model_ready.parquet")
+FEATURE_CACHE_DIR = "../data/feature_cache"
+X_train_preprocessed, y_train, w_train = load_split("../data/training_data_model_ready.parquet", cache_dir=FEATURE_CACHE_DIR)
+X_val_preprocessed, y_val, w_val = load_split("../data/validation_data_model_ready.parquet", cache_dir=FEATURE_CACHE_DIR)
+X_test_preprocessed, y_test, w_test = load_split("../data/test_data_model_ready.parquet", cache_dir=FEATURE_CACHE_DIR)
 
 # %% [markdown]
 # <div style="background-color:#fff6e4; padding:15px; border-width:3px; border-color:#f5ecda; border-style:solid; border-radius:6px"> 
@@ -185,9 +188,9 @@ def inspect_df(df):
 
 data_inspection = pd.DataFrame(
     {
-        "Training": inspect_df(df_train_preprocessed),
-        "Validation": inspect_df(df_val_preprocessed),
-        "Test": inspect_df(df_test_preprocessed),
+        "Training": inspect_df(pd.concat([X_train_preprocessed, y_train, w_train], axis=1)),
+        "Validation": inspect_df(pd.concat([X_val_preprocessed, y_val, w_val], axis=1)),
+        "Test": inspect_df(pd.concat([X_test_preprocessed, y_test, w_test], axis=1)),
     },
     index=[
         "Shape",
@@ -202,27 +205,6 @@ data_inspection = pd.DataFrame(
 )
 display(data_inspection.style.pipe(add_table_caption, "Data Inspection"))
 
-# %% [markdown]
-# <div style="background-color:#fff6e4; padding:15px; border-width:3px; border-color:#f5ecda; border-style:solid; border-radius:6px"> 
-#     📌 Split the preprocessed data into X features, y target variable, and sample weights (w).
-# </div>
-
-# %%
-X_train_preprocessed = df_train_preprocessed.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-y_train = df_train_preprocessed[TARGET_COLUMN]
-w_train = df_train_preprocessed[WEIGHT_COLUMN]
-
-X_val_preprocessed = df_val_preprocessed.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-y_val = df_val_preprocessed[TARGET_COLUMN]
-w_val = df_val_preprocessed[WEIGHT_COLUMN]
-
-X_test_preprocessed = df_test_preprocessed.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-y_test = df_test_preprocessed[TARGET_COLUMN]
-w_test = df_test_preprocessed[WEIGHT_COLUMN]
-
-# Delete redundant DataFrames to free up memory
-del df_train_preprocessed, df_val_preprocessed, df_test_preprocessed
-
 # %% [markdown]
 # <div style="background-color:#2c699d; color:white; padding:15px; border-radius:6px;">
 #     <h1 style="margin:0px">Baseline Models</h1>
@@ -464,8 +446,8 @@ model_name_map = {
 baseline_models_to_evaluate = ["median", "lr", "en", "tree", "rf", "xgb", "svm"]
 log_metrics = {}
 for model in baseline_models_to_evaluate:
-    # Load predicted values from .joblib file (use load_model for binary files)
-    y_val_pred = load_model(f"../models/{model}_baseline_predictions.joblib", verbose=False)
+    # Load predicted values from .npy file (use load_model for memory-mapped arrays)
+    y_val_pred = load_model(f"../models/{model}_baseline_predictions.npy", verbose=False)
     
     # Log-transform predictions (they were inverse-transformed to dollars by TransformedTargetRegressor)
     y_val_pred_log = np.log1p(y_val_pred)
@@ -1046,7 +1028,7 @@ print(f"Example: {en_param_list[0]}")
 
 # %% [markdown]
 # <div style="background-color:#fff6e4; padding:15px; border-width:3px; border-color:#f5ecda; border-style:solid; border-radius:6px">
-#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.joblib</code>, and full tuning history as <code>.json</code>).
+#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.npy</code>, and full tuning history as <code>.json</code>).
 # </div>
 
 # %%
@@ -1159,8 +1141,8 @@ def tune_elastic_net(X_train, y_train, X_val, y_val, w_train, w_val, param_list,
     save_metrics(get_core_model_params(best_en_result["fitted_model"]), "../models/en_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/en_tuned_params.json'")
     
-    save_model(best_en_result["y_val_pred"], "../models/en_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/en_tuned_predictions.joblib'")
+    save_model(best_en_result["y_val_pred"], "../models/en_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/en_tuned_predictions.npy'")
     
     print("\n✅ Elastic Net hyperparameter tuning complete.")
     
@@ -1223,7 +1205,7 @@ print(f"Example: {rf_param_list[0]}")
 
 # %% [markdown]
 # <div style="background-color:#fff6e4; padding:15px; border-width:3px; border-color:#f5ecda; border-style:solid; border-radius:6px">
-#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.joblib</code>, and full tuning history as <code>.json</code>).
+#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.npy</code>, and full tuning history as <code>.json</code>).
 # </div>
 
 # %%
@@ -1319,7 +1301,7 @@ def tune_random_forest(X_train, y_train, X_val, y_val, w_train, w_val, param_lis
     save_metrics(rf_tuning_metrics, "../models/rf_tuning_history.json", verbose=False)
     print("  Saved tuned random forest history to 'models/rf_tuning_history.json'")
     
-    save_model(best_rf_result["fitted_model"], "../models/rf_tuned_model.joblib", verbose=False)
+    save_model(CompactForestRegressor.from_model(best_rf_result["fitted_model"]), "../models/rf_tuned_model.joblib", verbose=False)
     print("  Saved best model to 'models/rf_tuned_model.joblib'")
     
     save_metrics({ "Random Forest (Tuned)": {
@@ -1336,8 +1318,8 @@ def tune_random_forest(X_train, y_train, X_val, y_val, w_train, w_val, param_lis
     save_metrics(get_core_model_params(best_rf_result["fitted_model"]), "../models/rf_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/rf_tuned_params.json'")
     
-    save_model(best_rf_result["y_val_pred"], "../models/rf_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/rf_tuned_predictions.joblib'")
+    save_model(best_rf_result["y_val_pred"], "../models/rf_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/rf_tuned_predictions.npy'")
     
     print("\n✅ Random Forest hyperparameter tuning complete.")
     
@@ -1404,7 +1386,7 @@ print(f"Example: {xgb_param_list[0]}")
 
 # %% [markdown]
 # <div style="background-color:#fff6e4; padding:15px; border-width:3px; border-color:#f5ecda; border-style:solid; border-radius:6px">
-#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.joblib</code>, and full tuning history as <code>.json</code>).
+#     📌 Perform randomized search and persist model artifacts (best model weights as <code>.joblib</code>, metrics as <code>.json</code>, parameters as <code>.json</code>, predictions as <code>.npy</code>, and full tuning history as <code>.json</code>).
 # </div>
 
 # %%
@@ -1501,8 +1483,8 @@ def tune_xgboost(X_train, y_train, X_val, y_val, w_train, w_val, param_list, ran
     save_metrics(xgb_tuning_metrics, "../models/xgb_tuning_history.json", verbose=False)
     print("  Saved tuned XGBoost history to 'models/xgb_tuning_history.json'")
     
-    save_model(best_xgb_results["fitted_model"], "../models/xgb_tuned_model.joblib", verbose=False)
-    print("  Saved best model to 'models/xgb_tuned_model.joblib'")
+    save_model(best_xgb_results["fitted_model"], "../models/xgb_tuned_model.ubj", verbose=False)
+    print("  Saved best model to 'models/xgb_tuned_model.ubj'")
     
     save_metrics({ "XGBoost (Tuned)": {
         "val_mdae": best_xgb_results["val_mdae"],
@@ -1518,8 +1500,8 @@ def tune_xgboost(X_train, y_train, X_val, y_val, w_train, w_val, param_list, ran
     save_metrics(get_core_model_params(best_xgb_results["fitted_model"]), "../models/xgb_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/xgb_tuned_params.json'")
     
-    save_model(best_xgb_results["y_val_pred"], "../models/xgb_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/xgb_tuned_predictions.joblib'")
+    save_model(best_xgb_results["y_val_pred"], "../models/xgb_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/xgb_tuned_predictions.npy'")
     
     print("\n✅ XGBoost hyperparameter tuning complete.")
     
@@ -1727,9 +1709,9 @@ display(
 # Load predictions of all tuned models (on validation data)
 print("Loading tuned model predictions...")
 tuned_model_predictions = {
-    "Elastic Net (Tuned)": load_model("../models/en_tuned_predictions.joblib", verbose=False),
-    "Random Forest (Tuned)": load_model("../models/rf_tuned_predictions.joblib", verbose=False),
-    "XGBoost (Tuned)": load_model("../models/xgb_tuned_predictions.joblib", verbose=False)
+    "Elastic Net (Tuned)": load_model("../models/en_tuned_predictions.npy", verbose=False),
+    "Random Forest (Tuned)": load_model("../models/rf_tuned_predictions.npy", verbose=False),
+    "XGBoost (Tuned)": load_model("../models/xgb_tuned_predictions.npy", verbose=False)
 }
 
 # Display predicted cost ranges by model
@@ -1932,9 +1914,9 @@ df_raw_val["AGE_GRP"] = pd.cut(df_raw_val["AGE23X"], bins=age_bins, labels=age_l
 # Load predictions of all tuned models (on validation data)
 print("Loading tuned model predictions...")
 tuned_model_predictions = {
-    "Elastic Net (Tuned)": load_model("../models/en_tuned_predictions.joblib", verbose=False),
-    "Random Forest (Tuned)": load_model("../models/rf_tuned_predictions.joblib", verbose=False),
-    "XGBoost (Tuned)": load_model("../models/xgb_tuned_predictions.joblib", verbose=False)
+    "Elastic Net (Tuned)": load_model("../models/en_tuned_predictions.npy", verbose=False),
+    "Random Forest (Tuned)": load_model("../models/rf_tuned_predictions.npy", verbose=False),
+    "XGBoost (Tuned)": load_model("../models/xgb_tuned_predictions.npy", verbose=False)
 }
 print(f"  Loaded predictions for {len(tuned_model_predictions)} tuned models on the validation set")
 
@@ -2450,8 +2432,8 @@ def train_xgboost_quantile():
     # --- 5. Model Persistence ---
     print("Step 5: Persisting model results...")
     # 5.1. Save fitted model as .joblib file
-    save_model(xgb_quantile_model, "../models/xgb_quantile_model.joblib", verbose=False)
-    print("  Saved XGBoost quantile regression model to 'models/xgb_quantile_model.joblib'")
+    save_model(xgb_quantile_model, "../models/xgb_quantile_model.ubj", verbose=False)
+    print("  Saved XGBoost quantile regression model to 'models/xgb_quantile_model.ubj'")
 
     # 5.2. Save evaluation metrics as JSON
     xgb_quantile_metrics = {
@@ -2480,9 +2462,9 @@ def train_xgboost_quantile():
     save_metrics(xgb_quantile_params, "../models/xgb_quantile_params.json", verbose=False)
     print("  Saved hyperparameters of XGBoost quantile regression to 'models/xgb_quantile_params.json'")
 
-    # 5.4. Save predicted values as .joblib file
-    save_model(y_val_pred, "../models/xgb_quantile_predictions.joblib", verbose=False)
-    print("  Saved predicted values of XGBoost quantile regression to 'models/xgb_quantile_predictions.joblib'")
+    # 5.4. Save predicted values as .npy file
+    save_model(y_val_pred, "../models/xgb_quantile_predictions.npy", verbose=False)
+    print("  Saved predicted values of XGBoost quantile regression to 'models/xgb_quantile_predictions.npy'")
 
     print("\n✅ XGBoost quantile regression complete.")
 
@@ -2533,14 +2515,14 @@ def train_xgboost_quantile():
 
 # %%
 # Load model 
-xgb_quantile_model = load_model("../models/xgb_quantile_model.joblib", verbose=False)
+xgb_quantile_model = load_model("../models/xgb_quantile_model.ubj", verbose=False)
 
 # Predict on training data
 y_train_quantile_pred_raw = xgb_quantile_model.predict(X_train_preprocessed)
 y_train_quantile_pred = postprocess_quantile_predictions(y_train_quantile_pred_raw)
 
 # Load predictions on validation data
-y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.joblib", verbose=False)
+y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.npy", verbose=False)
 
 quantiles = [0.25, 0.50, 0.75, 0.90]
 pinball_results = []
@@ -3266,8 +3248,8 @@ display(
 
 # %%
 # Load predictions 
-xgb_tuned_pred = load_model("../models/xgb_tuned_predictions.joblib", verbose=False)
-y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.joblib", verbose=False)
+xgb_tuned_pred = load_model("../models/xgb_tuned_predictions.npy", verbose=False)
+y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.npy", verbose=False)
 y_val_pred_q50 = y_val_quantile_pred[:, 1]  # q50 is at index 1
 
 # Plot heteroscedasticity of quantile vs. point-estimate model side-by-side
@@ -3501,7 +3483,7 @@ print("Recovering raw validation features...")
 df_raw_val, y_val_audit, w_val_audit = prepare_human_readable_split_data(VAL_MODEL_READY_DATA_PATH, "validation")
 
 print("Loading XGBoost quantile predictions...")
-y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.joblib", verbose=False)
+y_val_quantile_pred = load_model("../models/xgb_quantile_predictions.npy", verbose=False)
 y_val_pred_q25_audit, y_val_pred_q50_audit, y_val_pred_q75_audit, y_val_pred_q90_audit = [
     pd.Series(values, index=y_val_audit.index)
     for values in y_val_quantile_pred.T
@@ -4084,7 +4066,7 @@ plot_quantile_subgroup_predictions(
 # </div>
 
 # %%
-xgb_quantile_final_model = load_model("../models/xgb_quantile_model.joblib")
+xgb_quantile_final_model = load_model("../models/xgb_quantile_model.ubj")
 
 y_test_quantile_pred_raw = xgb_quantile_final_model.predict(X_test_preprocessed)
 y_test_quantile_pred = postprocess_quantile_predictions(y_test_quantile_pred_raw)
@@ -4871,7 +4853,7 @@ plot_quantile_subgroup_predictions(
 #     <br><br>
 #     <strong>App/API Implementation Plan</strong>
 #     <ol>
-#         <li><strong>Create Artifacts:</strong> Use <code>scripts/preprocess.py</code> to create <code>data/training_data_preprocessor_input.parquet</code> and <code>models/preprocessor.joblib</code>. Use <code>scripts/train_xgboost_quantile.py</code> to create <code>models/xgb_quantile_model.joblib</code>. Use <code>scripts/build_app_artifacts.py</code> to create <code>app/data/shap_background.parquet</code> and <code>app/data/shap_metadata.json</code>.</li>
+#         <li><strong>Create Artifacts:</strong> Use <code>scripts/preprocess.py</code> to create <code>data/training_data_preprocessor_input.parquet</code> and <code>models/preprocessor.joblib</code>. Use <code>scripts/train_xgboost_quantile.py</code> to create <code>models/xgb_quantile_model.ubj</code>. Use <code>scripts/build_app_artifacts.py</code> to create <code>app/data/shap_background.parquet</code> and <code>app/data/shap_metadata.json</code>.</li>
 #         <li><strong>During Application Startup:</strong> Load the preprocessor, quantile model, and SHAP background. Build the explainer once.</li>
 #         <li><strong>At Inference Time:</strong> Map the user inputs to the preprocessor inputs. Predict all quantiles using the fitted preprocessor and model, postprocess them, and compute permutation SHAP for q50. Rank contributions by absolute value and select the five largest. Apply medical-cost inflation to predictions, comparison benchmarks, and the selected SHAP contributions.</li>
 #     </ol>
@@ -4909,7 +4891,7 @@ X_test_preprocessor_input = pd.read_parquet(
 )
 
 preprocessor = load_model("../models/preprocessor.joblib", verbose=False)
-xgb_quantile_model = load_model("../models/xgb_quantile_model.joblib", verbose=False)
+xgb_quantile_model = load_model("../models/xgb_quantile_model.ubj", verbose=False)
 
 
 # %%
@@ -17,11 +17,12 @@ Approach:
   3.  Batched LLM Inference: Send profiles in batches to the Gemini API with structured JSON 
       output. The script supports a "Run & Resume" strategy to stay within daily free-tier 
       limits (e.g., 20 requests per day for Gemini 3 Flash). It automatically detects previous 
-      progress from 'models/llm_benchmark_predictions.joblib' and picks up where it left off.
+      progress from 'models/llm_benchmark_predictions.parquet' (indexed by DUPERSID) and picks up
+      where it left off.
   4.  Metric Computation: Compute weighted metrics (MdAE, MAE, R²) on the total 
       accumulated progress.
   5.  Persistence: Save evaluation metrics as JSON, LLM parameters (including system prompt) 
-      as JSON, and the (updated) predictions as a joblib file.
+      as JSON, and the (updated) predictions as a Parquet file indexed by DUPERSID.
   6.  MLflow Tracking: Log hyperparameters, weighted performance metrics, and 
       inference metadata to a local MLflow server for head-to-head comparison 
       against specialized ML models.
@@ -58,7 +59,7 @@ from src.constants import (
     MARRY31X_TRANSITION_CODES, EMPST31_TRANSITION_CODES,
     MARRY31X_COLLAPSE_MAP, EMPST31_COLLAPSE_MAP,
 )
-from src.modeling import RAW_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_metrics, save_model, load_model
+from src.modeling import RAW_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_metrics, save_model, load_model, resolve_tracking_uri
 
 # Suppress benign MLflow warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
@@ -425,7 +426,7 @@ def main():
 
     # --- MLflow Setup ---
     print("Step 0: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")  # Points to running MLflow UI server
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # MLflow UI server (or local fallback store if it is not running)
     mlflow.set_experiment("LLM Benchmarks")
     print(f"  Set up 'LLM Benchmarks' experiment in MLflow with URI '{mlflow.get_tracking_uri()}'")
 
@@ -463,15 +464,20 @@ def main():
         all_predictions = np.full(len(profiles), np.nan)  # Initialize with NaNs
         
         # Resume Logic: Load existing progress if available
-        predictions_path = "models/llm_benchmark_predictions.joblib"
-        if os.path.exists(predictions_path):
-            existing_preds = load_model(predictions_path, verbose=False)
-            if len(existing_preds) == len(profiles):
-                all_predictions = existing_preds
-                n_previously_done = np.count_nonzero(~np.isnan(all_predictions))
-                print(f"  Resuming: Found {n_previously_done:,} existing predictions in '{predictions_path}'")
+        predictions_path = "models/llm_benchmark_predictions.parquet"
+        legacy_predictions_path = "models/llm_benchmark_predictions.joblib"
+        if os.path.exists(predictions_path) or os.path.exists(legacy_predictions_path):
+            existing_preds = load_model(predictions_path, verbose=False)  # Falls back to the legacy .joblib array
+            if isinstance(existing_preds, pd.DataFrame):
+                # Align by DUPERSID: rows without a previous prediction stay NaN and are queried
+                all_predictions = existing_preds["y_pred"].reindex(common_ids).to_numpy(dtype=float)
+            elif len(existing_preds) == len(profiles):
+                all_predictions = np.array(existing_preds, dtype=float)
             else:
                 print(f"  ⚠️ Existing predictions file size mismatch. Starting fresh.")
+            n_previously_done = np.count_nonzero(~np.isnan(all_predictions))
+            if n_previously_done:
+                print(f"  Resuming: Found {n_previously_done:,} existing predictions in '{predictions_path}'")
 
         total_time = 0
         requests_sent = 0
@@ -579,9 +585,9 @@ def main():
         save_metrics(params_dict, "models/llm_benchmark_params.json", verbose=False)
         print(f"  Saved LLM parameters to 'models/llm_benchmark_params.json'")
         
-        # 5.3. Save LLM predictions as .joblib
-        save_model(y_llm_pred, "models/llm_benchmark_predictions.joblib", verbose=False)
-        print(f"  Saved LLM predictions to 'models/llm_benchmark_predictions.joblib'")
+        # 5.3. Save LLM predictions as .parquet (indexed by DUPERSID)
+        save_model(pd.Series(y_llm_pred, index=common_ids, name="y_pred"), predictions_path, verbose=False)
+        print(f"  Saved LLM predictions to '{predictions_path}'")
 
     print("\n✅ LLM benchmark complete.")
 
@@ -0,0 +1,135 @@
+"""
+Benchmark of TPE model-based search against the randomized search used for tuning.
+
+This script measures how many TPE trials are needed to match the best validation
+MdAE that the 50-iteration randomized search found for each tuned model
+(Elastic Net, Random Forest, XGBoost). The randomized search results are read from
+the tuning histories written by the tuning scripts, so the random search is not rerun.
+
+Workflow:
+  1.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  2.  Reference Loading: Read the best validation MdAE and the trial at which it was
+      found from each randomized search history.
+  3.  TPE Search: Run the TPE sampler (src/tuning.py) on the same search space
+      (src/params.py) with N_WORKERS asynchronous parallel workers, and record the
+      first trial that matches the randomized search's best validation MdAE.
+  4.  Persistence: Save the benchmark results as JSON.
+
+Artifacts:
+  - models/sampler_benchmark.json: Trials-to-match and best MdAE per model and sampler.
+
+Usage:
+    1. Run the tuning scripts with SEARCH_SAMPLER = "random" (src/params.py).
+    2. Run: ./.venv-train/Scripts/python scripts/benchmark_samplers.py
+"""
+
+# Standard library imports
+import os
+import time
+
+# Third-party imports
+import numpy as np
+from sklearn.linear_model import ElasticNet
+from sklearn.preprocessing import PolynomialFeatures
+from sklearn.pipeline import Pipeline
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.compose import TransformedTargetRegressor
+from xgboost import XGBRegressor
+
+# Local imports
+from src.constants import RANDOM_STATE
+from src.modeling import load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_metrics, load_metrics
+from src.params import EN_PARAM_DISTRIBUTIONS, EN_N_ITER, RF_PARAM_DISTRIBUTIONS, RF_N_ITER, XGB_PARAM_DISTRIBUTIONS, XGB_N_ITER
+from src.tuning import get_param_sampler
+
+
+# =========================
+# Configuration
+# =========================
+
+N_WORKERS = 2  # Concurrent TPE trials (each trial gets an equal share of CPU cores)
+BENCHMARK_MODELS = {
+    # model_id: (display name, search space, trial budget)
+    "en": ("Elastic Net", EN_PARAM_DISTRIBUTIONS, EN_N_ITER),
+    "rf": ("Random Forest", RF_PARAM_DISTRIBUTIONS, RF_N_ITER),
+    "xgb": ("XGBoost", XGB_PARAM_DISTRIBUTIONS, XGB_N_ITER),
+}
+
+
+def build_model(model_id, params, n_jobs):
+    """Build the same log-target model as the corresponding tuning script."""
+    if model_id == "en":
+        regressor = Pipeline([
+            ("polynomials", PolynomialFeatures(degree=2, include_bias=False)),
+            ("model", ElasticNet(random_state=RANDOM_STATE, max_iter=2000))
+        ]).set_params(**params)
+    elif model_id == "rf":
+        regressor = RandomForestRegressor(criterion="absolute_error", n_jobs=n_jobs, random_state=RANDOM_STATE, **params)
+    else:
+        regressor = XGBRegressor(objective="reg:absoluteerror", tree_method="hist", n_jobs=n_jobs, random_state=RANDOM_STATE, **params)
+    return TransformedTargetRegressor(regressor=regressor, func=np.log1p, inverse_func=np.expm1)
+
+
+def main():
+    # --- 1. Preprocessed Data Loading ---
+    print("Step 1: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+
+    benchmark_results = {}
+    for step, (model_id, (model_name, param_distributions, n_trials)) in enumerate(BENCHMARK_MODELS.items(), start=1):
+        # --- 2. Reference Loading ---
+        print(f"Step 2.{step}: Loading randomized search reference for {model_name}...")
+        history = load_metrics(f"models/{model_id}_tuning_history.json", verbose=False)
+        if not history:
+            print(f"  ⚠️ No tuning history found in 'models/{model_id}_tuning_history.json'. Skipping {model_name}.")
+            continue
+        random_mdaes = [trial["val_mdae"] for trial in history]
+        random_best_mdae = min(random_mdaes)
+        random_trials_to_best = int(np.argmin(random_mdaes)) + 1
+        print(f"  Random search best MdAE: {random_best_mdae:.2f} (found at trial {random_trials_to_best}/{len(history)})")
+
+        # --- 3. TPE Search ---
+        print(f"Step 3.{step}: Running TPE search for {model_name} ({n_trials} trials, {N_WORKERS} workers)...")
+
+        def objective(params):
+            model = build_model(model_id, params, n_jobs)
+            weight_key = "model__sample_weight" if model_id == "en" else "sample_weight"
+            model.fit(X_train, y_train, **{weight_key: w_train_norm})
+            return weighted_median_absolute_error(y_val, model.predict(X_val), sample_weight=w_val)
+
+        sampler = get_param_sampler(param_distributions, n_iter=n_trials, sampler="tpe", random_state=RANDOM_STATE)
+        search_start = time.time()
+        tpe_trials = sampler.optimize(objective, n_trials, n_workers=N_WORKERS)
+        search_time = time.time() - search_start
+
+        # Trials are counted in completion order (what an asynchronous search would have finished)
+        tpe_mdaes = [trial["value"] for trial in tpe_trials]
+        matched = [i for i, mdae in enumerate(tpe_mdaes) if mdae <= random_best_mdae]
+        tpe_trials_to_match = matched[0] + 1 if matched else None
+        benchmark_results[model_name] = {
+            "n_trials": n_trials,
+            "random_best_val_mdae": random_best_mdae,
+            "random_trials_to_best": random_trials_to_best,
+            "tpe_best_val_mdae": min(tpe_mdaes),
+            "tpe_trials_to_match": tpe_trials_to_match,
+            "tpe_best_params": sampler.best_trial["params"],
+            "tpe_search_time": search_time,
+            "n_workers": N_WORKERS,
+        }
+        match_label = f"{tpe_trials_to_match} trials" if tpe_trials_to_match else "not matched"
+        print(f"  TPE best MdAE: {min(tpe_mdaes):.2f} | Matched random search best: {match_label} | Search time: {search_time:.0f} s")
+
+    # --- 4. Persistence ---
+    print("Step 4: Persisting benchmark results...")
+    save_metrics(benchmark_results, "models/sampler_benchmark.json", verbose=False)
+    print("  Saved sampler benchmark to 'models/sampler_benchmark.json'")
+
+    print("\n✅ Sampler benchmark complete.")
+
+
+if __name__ == "__main__":
+    main()
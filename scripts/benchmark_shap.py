@@ -0,0 +1,304 @@
+"""
+Benchmark of SHAP background sizes and evaluation budgets for the q50 cost-driver explanations.
+
+The technical specifications require background_n and max_evals to be chosen empirically:
+the smallest configuration that meets the latency target while keeping the user-facing
+explanations stable against a reference configuration with a larger background and a higher
+evaluation budget. This script runs that benchmark with the batched permutation explainer
+(PermutationShapExplainer in src/explainability.py) and the partition mode (PartitionShapExplainer:
+Owen values of the binarized feature hierarchy), reports latency and top-driver agreement of
+both modes against the flat permutation reference, and records the selected configuration in the
+SHAP metadata artifact.
+
+Workflow:
+  1.  Data and Artifact Loading: Load the preprocessor-input training and validation data,
+      the fitted preprocessor, and the XGBoost quantile model.
+  2.  Backgrounds: Build one survey-weighted background per method (weighted resampling or
+      k-medoids summarization, see build_shap_background) and size, and validate its SHAP
+      baseline against the weighted training baseline (max. 10% difference).
+  3.  Benchmark: Explain a fixed set of N_PROFILES validation profiles with every candidate
+      configuration (permutation mode per max_evals, partition mode with its fixed coalitions)
+      and the reference configuration in parallel worker processes (one
+      XGBoost thread each). Every worker times one first explanation separately, then each
+      profile individually for steady-state latency.
+  4.  Evaluation: Compare every candidate with the reference: p50/p90/p95 latency, top-5
+      driver overlap, sign stability of material drivers, SHAP dollar drift, baseline drift,
+      and additivity error (src/explainability.py acceptance criteria). Explain the same profiles
+      with the hybrid TreeSHAP explainer and report its fidelity against the reference: the app
+      may switch to it only if its top-5 drivers agree (switch_allowed).
+  5.  Selection & Persistence: Print the results table, select the smallest passing
+      configuration (fewest synthetic rows per explanation), and write the benchmark results
+      and the selected configuration. scripts/build_app_artifacts.py (dvc repro app_artifacts)
+      builds the SHAP background and metadata of the selection.
+
+Artifacts:
+  - models/shap_benchmark.json: Reference timing, metrics of every candidate configuration, and the TreeSHAP fidelity report.
+  - app/data/shap_selection.json: Selected explanation mode, background method and size, max_evals, and
+    configuration benchmark (Git-tracked input of the app_artifacts DVC stage).
+
+Usage:
+    Run: ./.venv-train/Scripts/python scripts/benchmark_shap.py
+"""
+
+# Standard library imports
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from src.constants import RANDOM_STATE, WEIGHT_COLUMN
+from src.explainability import (
+    SHAP_INPUT_FEATURES,
+    SHAP_TOP_K,
+    SHAP_MIN_TOP_K_MATCHES,
+    SHAP_MIN_TOP_K_MATCH_ROW_SHARE,
+    SHAP_MATERIAL_CONTRIBUTION_MIN_2023_USD,
+    SHAP_MEDIAN_TOP_K_ABS_DELTA_MAX_2023_USD,
+    SHAP_ADDITIVITY_ABS_ERROR_MAX_2023_USD,
+    SHAP_EXPLANATION_MODES,
+    TreeShapExplainer,
+    create_shap_explainer,
+    predict_median_cost,
+    build_shap_background,
+    validate_shap_background,
+    estimate_mask_evaluations,
+    build_owen_coalitions,
+    summarize_shap_configuration,
+    evaluate_tree_shap_fidelity,
+)
+from src.modeling import TRAIN_PREPROCESSOR_INPUT_DATA_PATH, VAL_PREPROCESSOR_INPUT_DATA_PATH, load_model, save_metrics
+
+
+# =========================
+# Configuration
+# =========================
+
+PREPROCESSOR_PATH = "models/preprocessor.joblib"
+QUANTILE_MODEL_PATH = "models/xgb_quantile_model.ubj"
+BENCHMARK_RESULTS_PATH = "models/shap_benchmark.json"
+SHAP_SELECTION_PATH = Path("app/data/shap_selection.json")
+
+N_PROFILES = 100  # Fixed validation profiles explained by every configuration (plus one first-inference profile)
+MASKS_PER_ROUND = 2 * len(SHAP_INPUT_FEATURES) + 1  # One forward and one backward pass plus the fully masked state
+BACKGROUND_METHODS = ["resample", "kmedoids"]  # build_shap_background methods
+BACKGROUND_GRID = [25, 50, 100, 200, 300]
+MAX_EVALS_GRID = [rounds * MASKS_PER_ROUND for rounds in [3, 6, 12]]
+EXPLANATION_MODES = list(SHAP_EXPLANATION_MODES)  # "permutation" (MAX_EVALS_GRID) and "partition" (fixed coalitions)
+PARTITION_COALITIONS = len(build_owen_coalitions()[0])  # Distinct coalitions per partition-mode explanation
+REFERENCE_BACKGROUND = ("resample", 500)  # (method, background_n), explained in permutation mode
+REFERENCE_MAX_EVALS = 24 * MASKS_PER_ROUND
+P95_LATENCY_MAX_S = 1.0  # NFR-04 budget of the complete prediction request (upper bound for SHAP alone)
+N_WORKERS = None  # Parallel configurations (None: CPU count; each worker uses one XGBoost thread)
+
+
+def explain_profiles(explanation_mode, preprocessor, model, background, background_weights, max_evals, X_first_inference, X_profiles):
+    """
+    Explain the benchmark profiles with one configuration (runs in a worker process).
+
+    Returns:
+        dict: first_inference_latency_s, values, base_values, and per-profile latencies.
+    """
+    model.regressor_.get_booster().set_param({"nthread": 1})  # Parallel workers must not share cores
+    explainer = create_shap_explainer(explanation_mode, preprocessor, model, background, background_weights, max_evals=max_evals, seed=RANDOM_STATE)
+
+    start_time = time.perf_counter()
+    explainer.explain(X_first_inference)
+    first_inference_latency = time.perf_counter() - start_time
+
+    values, base_values, latencies = [], [], []
+    for x in X_profiles:
+        start_time = time.perf_counter()
+        explanation = explainer.explain(x[None, :])
+        latencies.append(time.perf_counter() - start_time)
+        values.append(explanation["values"][0])
+        base_values.append(explanation["base_values"][0])
+
+    return {
+        "first_inference_latency_s": first_inference_latency,
+        "values": np.vstack(values),
+        "base_values": np.asarray(base_values),
+        "latencies": np.asarray(latencies),
+    }
+
+
+def write_json(path, payload):
+    """Write a UTF-8 JSON artifact with stable formatting."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(payload, file, indent=2)
+        file.write("\n")
+
+
+def main():
+    # --- 1. Data and Artifact Loading ---
+    print("Step 1: Loading preprocessor-input data, preprocessor, and quantile model...")
+    df_train = pd.read_parquet(TRAIN_PREPROCESSOR_INPUT_DATA_PATH, columns=SHAP_INPUT_FEATURES + [WEIGHT_COLUMN])
+    X_val = pd.read_parquet(VAL_PREPROCESSOR_INPUT_DATA_PATH, columns=SHAP_INPUT_FEATURES)
+    preprocessor = load_model(PREPROCESSOR_PATH, verbose=False)
+    model = load_model(QUANTILE_MODEL_PATH, verbose=False)
+    print(f"  Loaded '{TRAIN_PREPROCESSOR_INPUT_DATA_PATH}' with {len(df_train):,} rows and '{VAL_PREPROCESSOR_INPUT_DATA_PATH}' with {len(X_val):,} rows")
+
+    # Fixed profile set: the first row is only used to time the first explanation after building an explainer
+    X_sample = X_val.sample(n=N_PROFILES + 1, random_state=RANDOM_STATE)
+    X_first_inference, X_profiles = X_sample.iloc[[0]].to_numpy(), X_sample.iloc[1:]
+    profile_predictions = predict_median_cost(preprocessor, model, X_profiles)
+
+    # --- 2. Backgrounds ---
+    print("Step 2: Building and validating SHAP backgrounds...")
+    training_baseline = np.average(predict_median_cost(preprocessor, model, df_train), weights=df_train[WEIGHT_COLUMN])
+    backgrounds, background_validations = {}, {}
+    for background_key in [(method, background_n) for method in BACKGROUND_METHODS for background_n in BACKGROUND_GRID] + [REFERENCE_BACKGROUND]:
+        method, background_n = background_key
+        background, background_weights = build_shap_background(df_train, df_train[WEIGHT_COLUMN], background_n, method=method, preprocessor=preprocessor, model=model)
+        background_baseline = np.average(predict_median_cost(preprocessor, model, background), weights=background_weights)
+        backgrounds[background_key] = (background, background_weights)
+        background_validations[background_key] = validation = validate_shap_background(background_baseline, training_baseline)
+        print(f"    {method:<8} {background_n:>4} rows → Baseline: ${background_baseline:,.2f} ({validation['relative_difference']:+.1%}) | {'passed' if validation['passed'] else 'failed'}")
+    if not background_validations[REFERENCE_BACKGROUND]["passed"]:
+        raise ValueError("The reference SHAP background failed baseline validation.")
+
+    # --- 3. Benchmark ---
+    reference_configuration = ("permutation", *REFERENCE_BACKGROUND, REFERENCE_MAX_EVALS)
+    candidate_configurations = [
+        (explanation_mode, method, background_n, max_evals)
+        for explanation_mode in EXPLANATION_MODES
+        for method in BACKGROUND_METHODS
+        for background_n in BACKGROUND_GRID
+        for max_evals in (MAX_EVALS_GRID if explanation_mode == "permutation" else [PARTITION_COALITIONS])
+    ]
+    configurations = [reference_configuration] + [
+        configuration for configuration in candidate_configurations if background_validations[configuration[1:3]]["passed"]
+    ]
+    n_workers = N_WORKERS or min(len(configurations), os.cpu_count() or 1)
+    print(f"Step 3: Explaining {N_PROFILES} profiles with {len(configurations)} configurations in {n_workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            configuration: executor.submit(
+                explain_profiles, configuration[0], preprocessor, model, *backgrounds[configuration[1:3]], configuration[3], X_first_inference, X_profiles.to_numpy()
+            )
+            for configuration in configurations
+        }
+        explanations = {configuration: future.result() for configuration, future in futures.items()}
+
+    # --- 4. Evaluation ---
+    print("Step 4: Evaluating candidates against the reference...")
+    reference_explanation = explanations[reference_configuration]
+    reference = {
+        "explanation_mode": "permutation",
+        "background_method": REFERENCE_BACKGROUND[0],
+        "background_n": REFERENCE_BACKGROUND[1],
+        "max_evals": REFERENCE_MAX_EVALS,
+        "background_baseline_2023_usd": background_validations[REFERENCE_BACKGROUND]["background_baseline_2023_usd"],
+        "first_inference_latency_s": reference_explanation["first_inference_latency_s"],
+        **{f"p{q}_latency_s": float(np.percentile(reference_explanation["latencies"], q)) for q in (50, 90, 95)},
+    }
+    benchmark_results = []
+    for explanation_mode, method, background_n, max_evals in candidate_configurations:
+        rounds, masks = estimate_mask_evaluations(max_evals) if explanation_mode == "permutation" else (None, max_evals)
+        result = {
+            "explanation_mode": explanation_mode,
+            "background_method": method,
+            "background_n": background_n,
+            "max_evals": max_evals,
+            "estimated_rounds": rounds,
+            "estimated_synthetic_rows": masks * background_n,
+            "background_baseline_relative_difference": background_validations[(method, background_n)]["relative_difference"],
+            "background_validation_passed": background_validations[(method, background_n)]["passed"],
+        }
+        explanation = explanations.get((explanation_mode, method, background_n, max_evals))
+        if explanation is not None:
+            result["first_inference_latency_s"] = explanation["first_inference_latency_s"]
+            result.update(summarize_shap_configuration(
+                explanation["values"], explanation["base_values"], profile_predictions, explanation["latencies"],
+                reference_explanation["values"], reference_explanation["base_values"],
+            ))
+        result["passed"] = bool(
+            result["background_validation_passed"]
+            and result.get("explanation_stability_passed", False)
+            and result.get("additivity_passed", False)
+            and result.get("p95_latency_s", np.inf) <= P95_LATENCY_MAX_S
+        )
+        benchmark_results.append(result)
+
+    tree_explainer = TreeShapExplainer(preprocessor, model)
+    tree_explanations, tree_latencies = [], []
+    for x in X_profiles.to_numpy():
+        start_time = time.perf_counter()
+        tree_explanations.append(tree_explainer.explain(x[None, :]))
+        tree_latencies.append(time.perf_counter() - start_time)
+    tree_shap_fidelity = evaluate_tree_shap_fidelity(
+        np.vstack([explanation["values"] for explanation in tree_explanations]),
+        np.concatenate([explanation["postprocessing_adjustments"] for explanation in tree_explanations]),
+        np.asarray(tree_latencies),
+        reference_explanation["values"],
+    )
+    print(f"  Hybrid TreeSHAP → p95 latency: {tree_shap_fidelity['p95_latency_s']:.4f}s | "
+          f"Profiles with >= {SHAP_MIN_TOP_K_MATCHES} of the reference top-{SHAP_TOP_K}: {tree_shap_fidelity['share_rows_with_min_top_k_matches']:.0%} | "
+          f"Sign reversals: {tree_shap_fidelity['material_sign_reversal_count']} | Switch allowed: {tree_shap_fidelity['switch_allowed']}")
+
+    # --- 5. Selection & Persistence ---
+    print("Step 5: Selecting the smallest passing configuration...")
+    table_columns = [
+        "explanation_mode", "background_method", "background_n", "max_evals", "estimated_synthetic_rows", "p50_latency_s", "p90_latency_s", "p95_latency_s",
+        "share_rows_with_min_top_k_matches", "material_sign_reversal_count", "median_matched_top_k_abs_delta_2023_usd",
+        "median_baseline_abs_delta_2023_usd", "p95_additivity_abs_error_2023_usd", "passed",
+    ]
+    df_results = pd.DataFrame(benchmark_results).reindex(columns=table_columns)
+    df_results = df_results.sort_values(["estimated_synthetic_rows", "p95_latency_s"], na_position="last")
+    print(f"  Reference: {REFERENCE_BACKGROUND[1]} rows ({REFERENCE_BACKGROUND[0]}), max_evals={REFERENCE_MAX_EVALS} → p50/p90/p95 latency: "
+          f"{reference['p50_latency_s']:.3f}s / {reference['p90_latency_s']:.3f}s / {reference['p95_latency_s']:.3f}s")
+    print(df_results.to_string(index=False, float_format=lambda x: f"{x:,.3f}"))
+    print("  Partition vs. permutation mode (share of profiles with >= 4 of the reference top-5 drivers | p95 latency in s):")
+    df_modes = df_results.pivot_table(
+        index=["background_method", "background_n"],
+        columns=["explanation_mode", "max_evals"],
+        values=["share_rows_with_min_top_k_matches", "p95_latency_s"],
+    )
+    print(df_modes.to_string(float_format=lambda x: f"{x:,.3f}"))
+    save_metrics({"reference": reference, "candidates": benchmark_results, "tree_shap_fidelity": tree_shap_fidelity}, BENCHMARK_RESULTS_PATH, verbose=False)
+    print(f"  Saved SHAP benchmark to '{BENCHMARK_RESULTS_PATH}'")
+
+    df_passed = df_results[df_results["passed"]]
+    if df_passed.empty:
+        raise ValueError("No SHAP configuration passed the acceptance criteria. Review the benchmark table or extend the grid.")
+    selected = benchmark_results[df_passed.index[0]]
+    configuration_benchmark = {
+        "profiles": f"{N_PROFILES} validation rows (MEPS 2023 (HC-251), validation split)",
+        "reference": {key: reference[key] for key in ["explanation_mode", "background_method", "background_n", "max_evals"]},
+        "acceptance_criteria": {
+            "top_k": SHAP_TOP_K,
+            "min_top_k_matches": SHAP_MIN_TOP_K_MATCHES,
+            "min_top_k_match_row_share": SHAP_MIN_TOP_K_MATCH_ROW_SHARE,
+            "material_contribution_min_2023_usd": SHAP_MATERIAL_CONTRIBUTION_MIN_2023_USD,
+            "median_top_k_abs_delta_max_2023_usd": SHAP_MEDIAN_TOP_K_ABS_DELTA_MAX_2023_USD,
+            "p95_additivity_abs_error_max_2023_usd": SHAP_ADDITIVITY_ABS_ERROR_MAX_2023_USD,
+            "p95_latency_max_s": P95_LATENCY_MAX_S,
+        },
+        "candidates": len(benchmark_results),
+        "passed": len(df_passed),
+        "selected": selected,
+        "tree_shap_fidelity": tree_shap_fidelity,
+    }
+    shap_selection = {
+        "source": "scripts/benchmark_shap.py",
+        "explanation_mode": selected["explanation_mode"],
+        "background_method": selected["background_method"],
+        "background_n": selected["background_n"],
+        "max_evals": selected["max_evals"],
+        "configuration_benchmark": configuration_benchmark,
+    }
+    write_json(SHAP_SELECTION_PATH, shap_selection)
+    print(f"  Selected {selected['explanation_mode']} mode, {selected['background_method']} background_n={selected['background_n']}, max_evals={selected['max_evals']} (p95 latency: {selected['p95_latency_s']:.3f}s)")
+    print(f"  Saved '{SHAP_SELECTION_PATH}' (run 'dvc repro app_artifacts' to build the SHAP background and metadata)")
+
+    print("\n✅ SHAP configuration benchmark complete.")
+
+
+if __name__ == "__main__":
+    main()
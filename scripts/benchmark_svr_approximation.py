@@ -0,0 +1,93 @@
+"""
+Benchmark of the approximate-kernel SVM baseline against the exact-kernel SVR as the training set grows.
+
+The exact SVR baseline scales quadratically to cubically with training rows, which will not hold
+up once several MEPS years are pooled. This script fits both variants from get_baseline_models
+(src/modeling.py) on growing stratified subsamples of the training data and records fit time and
+validation MdAE, so the number of Nystroem components can be chosen for the expected data size.
+
+Workflow:
+  1.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  2.  Benchmark: For each training size in ROW_COUNTS, fit the exact SVR and the approximate
+      SVM for each value in N_COMPONENTS on the same stratified subsample (fixed rows per size)
+      and evaluate on the full validation set. The exact SVR is skipped above EXACT_SVR_MAX_ROWS.
+  3.  Persistence: Save the benchmark results as JSON.
+
+Artifacts:
+  - models/svr_approximation_benchmark.json: Fit time and validation MdAE per training size and model.
+
+Usage:
+    Run: ./.venv-train/Scripts/python scripts/benchmark_svr_approximation.py
+"""
+
+# Standard library imports
+import time
+
+# Local imports
+from src.modeling import load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, get_baseline_models, get_train_metrics_indices, train_and_evaluate, save_metrics
+
+
+# =========================
+# Configuration
+# =========================
+
+ROW_COUNTS = [2_000, 4_000, 8_000, 16_000, None]  # Training rows per benchmark step (None: full training set)
+N_COMPONENTS = [250, 500, 1000, 2000]  # Nystroem components of the approximate SVM
+EXACT_SVR_MAX_ROWS = None  # Skip the exact SVR above this training size (None: no limit)
+
+
+def main():
+    # --- 1. Preprocessed Data Loading ---
+    print("Step 1: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+
+    # --- 2. Benchmark ---
+    print("Step 2: Benchmarking exact vs. approximate-kernel SVM...")
+    benchmark_results = []
+    for n_rows in ROW_COUNTS:
+        # Stratified subsample preserves the zero-inflated cost distribution at every size
+        indices = get_train_metrics_indices(y_train, "subsample", n_samples=n_rows or len(y_train))
+        if indices is not None:
+            X_subset, y_subset, w_subset = X_train.iloc[indices], y_train.iloc[indices], w_train.iloc[indices]
+        else:
+            X_subset, y_subset, w_subset = X_train, y_train, w_train
+        n_rows = len(y_subset)
+
+        models = {}
+        if EXACT_SVR_MAX_ROWS is None or n_rows <= EXACT_SVR_MAX_ROWS:
+            models[("Support Vector Machine", None)] = get_baseline_models()["Support Vector Machine"]
+        for n_components in N_COMPONENTS:
+            if n_components < n_rows:
+                models[("Approximate SVM", n_components)] = get_baseline_models(svr_approx_n_components=n_components)["Approximate SVM"]
+
+        for (model_name, n_components), model in models.items():
+            start_time = time.time()
+            result = train_and_evaluate(model, X_subset, y_subset, X_val, y_val, w_subset, w_val, calculate_train_metrics=False)
+            wall_time = time.time() - start_time
+            benchmark_results.append({
+                "model": model_name,
+                "n_components": n_components,
+                "n_rows": n_rows,
+                "training_time": result["training_time"],
+                "wall_time": wall_time,
+                "val_mdae": result["val_mdae"],
+                "val_mae": result["val_mae"],
+                "val_r2": result["val_r2"],
+            })
+            label = model_name if n_components is None else f"{model_name} ({n_components})"
+            print(f"    {n_rows:>7,} rows | {label:<24} → MdAE: {result['val_mdae']:8.2f} | Training Time: {result['training_time']:.2f}s")
+
+    # --- 3. Persistence ---
+    print("Step 3: Persisting benchmark results...")
+    save_metrics(benchmark_results, "models/svr_approximation_benchmark.json", verbose=False)
+    print("  Saved SVR approximation benchmark to 'models/svr_approximation_benchmark.json'")
+
+    print("\n✅ SVR approximation benchmark complete.")
+
+
+if __name__ == "__main__":
+    main()
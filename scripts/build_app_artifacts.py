@@ -1,13 +1,18 @@
-"""Build cost benchmarks and prediction metadata artifacts for app deployment.
+"""Build cost benchmarks, prediction metadata, and SHAP background artifacts for app deployment.
+
+The SHAP background uses the method, size, explanation mode, and max_evals selected by
+scripts/benchmark_shap.py in app/data/shap_selection.json (Git-tracked; the defaults of
+src/explainability.py until the benchmark is rerun). The baseline error of every background
+method and size is printed for comparison.
 
 Run after XGBoost quantile regression model training:
     .venv-train/Scripts/python scripts/build_app_artifacts.py
+    DVC: ./.venv-train/Scripts/dvc.exe repro app_artifacts
 """
 
 import json
 from pathlib import Path
 
-import joblib
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
@@ -19,17 +24,36 @@ from src.constants import (
     TARGET_COLUMN,
     WEIGHT_COLUMN,
 )
-from src.modeling import RAW_DATA_PATH, VAL_MODEL_READY_DATA_PATH
+from src.explainability import (
+    SHAP_INPUT_FEATURES,
+    SHAP_BACKGROUND_METHODS,
+    SHAP_BACKGROUND_METHOD,
+    SHAP_BACKGROUND_N,
+    SHAP_MAX_EVALS,
+    SHAP_EXPLANATION_MODE,
+    build_shap_background,
+    create_shap_metadata,
+    predict_median_cost,
+    save_shap_background,
+    validate_shap_background,
+)
+from src.modeling import RAW_DATA_PATH, TRAIN_PREPROCESSOR_INPUT_DATA_PATH, VAL_MODEL_READY_DATA_PATH, load_model
 from src.stats import create_stratification_bins, weighted_quantile
 
 APP_DATA_DIR = Path("app/data")
 COST_BENCHMARKS_PATH = APP_DATA_DIR / "cost_benchmarks.json"
 PREDICTION_METADATA_PATH = APP_DATA_DIR / "prediction_metadata.json"
-QUANTILE_PREDICTIONS_PATH = Path("models/xgb_quantile_predictions.joblib")
+SHAP_METADATA_PATH = APP_DATA_DIR / "shap_metadata.json"
+SHAP_BACKGROUND_PATH = APP_DATA_DIR / "shap_background.parquet"
+SHAP_SELECTION_PATH = APP_DATA_DIR / "shap_selection.json"
+PREPROCESSOR_PATH = Path("models/preprocessor.joblib")
+QUANTILE_MODEL_PATH = Path("models/xgb_quantile_model.ubj")
+QUANTILE_PREDICTIONS_PATH = Path("models/xgb_quantile_predictions.npy")
 
 AGE_BENCHMARK_BINS = [18, 35, 50, 65, 86]
 AGE_BENCHMARK_LABELS = ["18-34", "35-49", "50-64", "65+"]
 HIGH_PREDICTED_UNCERTAINTY_QUANTILE_LEVEL = 0.80
+SHAP_BACKGROUND_SIZE_GRID = [25, 50, 100, 200, 300, 500]
 
 
 def write_json(path, payload):
@@ -104,7 +128,7 @@ def build_prediction_metadata(validation_weights, quantile_predictions):
     )
     return {
         "schema_version": 1,
-        "model_artifact": "models/xgb_quantile_model.joblib",
+        "model_artifact": "models/xgb_quantile_model.ubj",
         "data_source": "MEPS 2023 (HC-251), validation split",
         "currency_year": 2023,
         "high_predicted_uncertainty": {
@@ -115,6 +139,76 @@ def build_prediction_metadata(validation_weights, quantile_predictions):
     }
 
 
+def report_shap_background_baselines(df_train_input, preprocessor, model, training_baseline):
+    """Baseline relative difference of every SHAP background method and size in SHAP_BACKGROUND_SIZE_GRID."""
+    report = []
+    for method in SHAP_BACKGROUND_METHODS:
+        for background_n in SHAP_BACKGROUND_SIZE_GRID:
+            background, background_weights = build_shap_background(
+                df_train_input,
+                df_train_input[WEIGHT_COLUMN],
+                background_n,
+                method=method,
+                preprocessor=preprocessor,
+                model=model,
+            )
+            background_baseline = np.average(
+                predict_median_cost(preprocessor, model, background),
+                weights=background_weights,
+            )
+            report.append(
+                {
+                    "method": method,
+                    "rows": background_n,
+                    "baseline_2023_usd": background_baseline,
+                    "relative_difference": background_baseline / training_baseline - 1,
+                }
+            )
+    return pd.DataFrame(report)
+
+
+def build_shap_background_artifacts(df_train_input, preprocessor, model, training_baseline, shap_selection):
+    """Create the SHAP background and metadata for the configuration selected by scripts/benchmark_shap.py."""
+    background_method = shap_selection.get("background_method", SHAP_BACKGROUND_METHOD)
+    background_n = shap_selection.get("background_n", SHAP_BACKGROUND_N)
+    explanation_mode = shap_selection.get("explanation_mode", SHAP_EXPLANATION_MODE)
+    max_evals = shap_selection.get("max_evals", SHAP_MAX_EVALS)
+
+    background, background_weights = build_shap_background(
+        df_train_input,
+        df_train_input[WEIGHT_COLUMN],
+        background_n,
+        method=background_method,
+        preprocessor=preprocessor,
+        model=model,
+    )
+    background_validation = validate_shap_background(
+        np.average(predict_median_cost(preprocessor, model, background), weights=background_weights),
+        training_baseline,
+    )
+    if not background_validation["passed"]:
+        raise ValueError(
+            "SHAP background baseline differs from the weighted training baseline by "
+            f"{background_validation['absolute_relative_difference']:.1%}. "
+            "Increase the background size or rerun scripts/benchmark_shap.py."
+        )
+
+    shap_metadata = create_shap_metadata(
+        {
+            "model": QUANTILE_MODEL_PATH.as_posix(),
+            "preprocessor": PREPROCESSOR_PATH.as_posix(),
+            "background": SHAP_BACKGROUND_PATH.as_posix(),
+        },
+        background_n,
+        background_method,
+        background_validation,
+        max_evals,
+        shap_selection.get("configuration_benchmark"),
+        explanation_mode,
+    )
+    return background, background_weights, shap_metadata
+
+
 def recreate_training_data():
     """Recreate the training split with unscaled age values from the raw MEPS 2023 (HC-251) data."""
     df = pd.read_sas(RAW_DATA_PATH, format="sas7bdat", encoding="latin1")
@@ -143,7 +237,7 @@ def main():
         VAL_MODEL_READY_DATA_PATH,
         columns=[WEIGHT_COLUMN],
     )[WEIGHT_COLUMN].to_numpy()
-    quantile_predictions = joblib.load(QUANTILE_PREDICTIONS_PATH)
+    quantile_predictions = load_model(QUANTILE_PREDICTIONS_PATH, verbose=False)
 
     cost_benchmarks = build_cost_benchmarks(df_train)
     prediction_metadata = build_prediction_metadata(
@@ -153,6 +247,34 @@ def main():
     write_json(COST_BENCHMARKS_PATH, cost_benchmarks)
     write_json(PREDICTION_METADATA_PATH, prediction_metadata)
 
+    df_train_input = pd.read_parquet(
+        TRAIN_PREPROCESSOR_INPUT_DATA_PATH,
+        columns=SHAP_INPUT_FEATURES + [WEIGHT_COLUMN],
+    )
+    preprocessor = load_model(PREPROCESSOR_PATH, verbose=False)
+    model = load_model(QUANTILE_MODEL_PATH, verbose=False)
+    training_baseline = np.average(
+        predict_median_cost(preprocessor, model, df_train_input),
+        weights=df_train_input[WEIGHT_COLUMN],
+    )
+    with SHAP_SELECTION_PATH.open(encoding="utf-8") as file:
+        shap_selection = json.load(file)
+    background_report = report_shap_background_baselines(
+        df_train_input,
+        preprocessor,
+        model,
+        training_baseline,
+    )
+    background, background_weights, shap_metadata = build_shap_background_artifacts(
+        df_train_input,
+        preprocessor,
+        model,
+        training_baseline,
+        shap_selection,
+    )
+    save_shap_background(background, background_weights, SHAP_BACKGROUND_PATH)
+    write_json(SHAP_METADATA_PATH, shap_metadata)
+
     national_benchmark = cost_benchmarks["national"]
     cutoff = prediction_metadata["high_predicted_uncertainty"]["cutoff_2023_dollars"]
     print(
@@ -167,6 +289,22 @@ def main():
         print(f"Ages {age_group['label']} benchmark: ${age_group['median_cost']:,.0f}")
     print(f"Weighted q90 cutoff for top 20%: ${cutoff:,.2f}")
 
+    print(f"Created '{SHAP_BACKGROUND_PATH}' and '{SHAP_METADATA_PATH}'.")
+    print(f"Weighted training baseline (mean q50): ${training_baseline:,.2f}")
+    print("SHAP background baseline error by method and size:")
+    print(
+        background_report.pivot(index="rows", columns="method", values="relative_difference")
+        .loc[:, list(SHAP_BACKGROUND_METHODS)]
+        .to_string(float_format=lambda x: f"{x:+.1%}")
+    )
+    background_sample = shap_metadata["background_sample"]
+    background_validation = shap_metadata["background_validation"]
+    print(
+        f"Shipped background: {background_sample['rows']} rows ({background_sample['method']}), "
+        f"baseline ${background_validation['background_baseline_2023_usd']:,.2f} "
+        f"({background_validation['relative_difference']:+.1%})"
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,238 @@
+"""
+Global SHAP importance of the q50 plan-around estimate on the validation and test splits.
+
+The notebooks explain a single example profile (X_test_example). This stage explains every row of
+the validation and test preprocessor-input splits with the app's explainer configuration
+(app/data/shap_metadata.json and app/data/shap_background.parquet), so global importance
+summaries and dependence plots read precomputed values instead of rerunning SHAP.
+
+Workflow:
+  1.  Artifact Loading: Load the SHAP metadata (explanation mode, max_evals), the background,
+      and both preprocessor-input splits. Fingerprint the preprocessor, quantile model (and its
+      JSON sidecar), background, both splits, and explainer configuration: checkpoints of a different
+      fingerprint are discarded.
+  2.  Chunked Explanation: Split the rows into CHUNK_SIZE-row chunks and explain every chunk
+      without a checkpoint in parallel worker processes (explainer built once per worker, one
+      XGBoost thread each). Each chunk uses its own permutation seed, so values do not depend on
+      the worker or on earlier interrupted runs. Every finished chunk is written as a Parquet
+      checkpoint immediately; rerunning the script resumes with the missing chunks.
+  3.  Results: Combine the checkpoints into one columnar Parquet file indexed by DUPERSID.
+  4.  Global Importance: Survey-weighted mean absolute SHAP value per feature and feature group
+      for each split (summarize_global_importance), saved as JSON. Remove the checkpoints.
+
+Artifacts:
+  - models/shap_values.parquet: Split, survey weight, input values, q50 prediction, SHAP baseline,
+    and one SHAP_<feature> column per input feature (2023 dollars) for every row.
+  - models/shap_global_importance.json: Explainer configuration and ranked global importance per split.
+
+Usage:
+    Run: ./.venv-train/Scripts/python scripts/compute_global_shap.py
+    DVC: ./.venv-train/Scripts/dvc.exe repro shap
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from src.constants import RANDOM_STATE, WEIGHT_COLUMN
+from src.explainability import (
+    SHAP_INPUT_FEATURES,
+    SHAP_EXPLANATION_MODE,
+    SHAP_MAX_EVALS,
+    create_shap_explainer,
+    load_shap_background,
+    summarize_global_importance,
+)
+from src.modeling import VAL_PREPROCESSOR_INPUT_DATA_PATH, TEST_PREPROCESSOR_INPUT_DATA_PATH, load_model, save_metrics
+
+
+# =========================
+# Configuration
+# =========================
+
+PREPROCESSOR_PATH = Path("models/preprocessor.joblib")
+QUANTILE_MODEL_PATH = Path("models/xgb_quantile_model.ubj")
+QUANTILE_MODEL_SIDECAR_PATH = Path("models/xgb_quantile_model.json")  # Target transform and quantiles of the native model
+SHAP_METADATA_PATH = Path("app/data/shap_metadata.json")
+SHAP_BACKGROUND_PATH = Path("app/data/shap_background.parquet")
+SHAP_VALUES_PATH = Path("models/shap_values.parquet")
+GLOBAL_IMPORTANCE_PATH = Path("models/shap_global_importance.json")
+CHECKPOINT_DIR = Path("models/shap_checkpoints")
+
+SPLITS = {"validation": VAL_PREPROCESSOR_INPUT_DATA_PATH, "test": TEST_PREPROCESSOR_INPUT_DATA_PATH}
+FINGERPRINT_ARTIFACT_PATHS = [PREPROCESSOR_PATH, QUANTILE_MODEL_PATH, QUANTILE_MODEL_SIDECAR_PATH, SHAP_BACKGROUND_PATH, *SPLITS.values()]
+SPLIT_COLUMN = "SPLIT"
+PREDICTION_COLUMN = "Q50_PREDICTION"
+BASE_VALUE_COLUMN = "SHAP_BASE_VALUE"
+SHAP_COLUMN_PREFIX = "SHAP_"
+CHUNK_SIZE = 250  # Rows per chunk and checkpoint
+N_WORKERS = None  # Parallel chunks (None: CPU count; each worker uses one XGBoost thread)
+TOP_N_PRINT = 10
+
+
+# =========================
+# Checkpoints
+# =========================
+
+def get_artifact_fingerprint(artifact_paths, explainer_configuration):
+    """md5 of the artifact files and the explainer configuration (checkpoints are only valid for the same fingerprint)."""
+    digest = hashlib.md5(json.dumps(explainer_configuration, sort_keys=True).encode())
+    for path in artifact_paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def prepare_checkpoint_dir(checkpoint_dir, fingerprint):
+    """
+    Keep the checkpoints of the same fingerprint, discard all others.
+
+    Returns:
+        bool: Whether existing checkpoints were kept.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    manifest_path = checkpoint_dir / "manifest.json"
+    if manifest_path.exists() and json.loads(manifest_path.read_text(encoding="utf-8")).get("fingerprint") == fingerprint:
+        return True
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    checkpoint_dir.mkdir(parents=True)
+    manifest_path.write_text(json.dumps({"fingerprint": fingerprint}) + "\n", encoding="utf-8")
+    return False
+
+
+def get_checkpoint_path(checkpoint_dir, split, chunk_index):
+    return Path(checkpoint_dir) / f"{split}_{chunk_index:05d}.parquet"
+
+
+def write_checkpoint(df_chunk, filepath):
+    """Write a chunk atomically, so an interrupted run never leaves a partial checkpoint."""
+    tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}.tmp")
+    df_chunk.to_parquet(tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+# =========================
+# Chunked Explanation
+# =========================
+
+_explainer = None  # Built once per worker process by init_worker
+
+
+def init_worker(explainer_configuration):
+    """Load the artifacts and build the explainer of a worker process."""
+    global _explainer
+    preprocessor = load_model(PREPROCESSOR_PATH, verbose=False)
+    model = load_model(QUANTILE_MODEL_PATH, verbose=False)
+    model.regressor_.get_booster().set_param({"nthread": 1})  # Parallel workers must not share cores
+    background, background_weights = load_shap_background(SHAP_BACKGROUND_PATH)
+    _explainer = create_shap_explainer(
+        explainer_configuration["explanation_mode"], preprocessor, model, background, background_weights,
+        max_evals=explainer_configuration["max_evals"],
+    )
+
+
+def explain_chunk(X_chunk, seed):
+    """
+    Explain one chunk in a worker process.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: SHAP values (n_rows, n_features) and SHAP baselines.
+    """
+    if hasattr(_explainer, "random_state"):
+        _explainer.random_state = np.random.RandomState(seed)  # Per-chunk seed: independent of worker and resume order
+    explanation = _explainer.explain(X_chunk)
+    return explanation["values"], explanation["base_values"]
+
+
+def create_chunk_frame(df_chunk, split, values, base_values):
+    """Columnar rows of one explained chunk (index and input values of the split, SHAP results)."""
+    df_values = pd.DataFrame(values, index=df_chunk.index, columns=[f"{SHAP_COLUMN_PREFIX}{feature}" for feature in SHAP_INPUT_FEATURES])
+    return pd.concat([
+        pd.DataFrame({SPLIT_COLUMN: split, WEIGHT_COLUMN: df_chunk[WEIGHT_COLUMN]}, index=df_chunk.index),
+        df_chunk[SHAP_INPUT_FEATURES],
+        pd.DataFrame({PREDICTION_COLUMN: base_values + values.sum(axis=1), BASE_VALUE_COLUMN: base_values}, index=df_chunk.index),
+        df_values,
+    ], axis=1)
+
+
+def main():
+    # --- 1. Artifact Loading ---
+    print("Step 1: Loading SHAP configuration and preprocessor-input splits...")
+    shap_metadata = json.loads(SHAP_METADATA_PATH.read_text(encoding="utf-8")) if SHAP_METADATA_PATH.exists() else {}
+    explainer_contract = shap_metadata.get("explainer_contract", {})
+    explainer_configuration = {
+        "explanation_mode": explainer_contract.get("algorithm", SHAP_EXPLANATION_MODE),
+        "max_evals": explainer_contract.get("max_evals", SHAP_MAX_EVALS),
+        "seed": RANDOM_STATE,
+        "chunk_size": CHUNK_SIZE,
+    }
+    fingerprint = get_artifact_fingerprint(FINGERPRINT_ARTIFACT_PATHS, explainer_configuration)
+    resumed = prepare_checkpoint_dir(CHECKPOINT_DIR, fingerprint)
+    splits = {split: pd.read_parquet(path, columns=SHAP_INPUT_FEATURES + [WEIGHT_COLUMN]) for split, path in SPLITS.items()}
+    print(f"  Explainer: {explainer_configuration['explanation_mode']} (max_evals={explainer_configuration['max_evals']}) | "
+          + " | ".join(f"{split}: {len(df):,} rows" for split, df in splits.items()))
+
+    # --- 2. Chunked Explanation ---
+    chunks = [
+        (split, chunk_index, df.iloc[start:start + CHUNK_SIZE])
+        for split, df in splits.items()
+        for chunk_index, start in enumerate(range(0, len(df), CHUNK_SIZE))
+    ]
+    pending = [
+        (seed, split, chunk_index, df_chunk)
+        for seed, (split, chunk_index, df_chunk) in enumerate(chunks, start=RANDOM_STATE)
+        if not get_checkpoint_path(CHECKPOINT_DIR, split, chunk_index).exists()
+    ]
+    n_workers = N_WORKERS or min(max(len(pending), 1), os.cpu_count() or 1)
+    print(f"Step 2: Explaining {len(pending)} of {len(chunks)} chunks in {n_workers} worker processes"
+          + (f" (resumed, {len(chunks) - len(pending)} checkpointed)..." if resumed else "..."))
+    if pending:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(explainer_configuration,)) as executor:
+            futures = {
+                executor.submit(explain_chunk, df_chunk[SHAP_INPUT_FEATURES].to_numpy(), seed): (split, chunk_index, df_chunk)
+                for seed, split, chunk_index, df_chunk in pending
+            }
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                split, chunk_index, df_chunk = futures[future]
+                write_checkpoint(create_chunk_frame(df_chunk, split, *future.result()), get_checkpoint_path(CHECKPOINT_DIR, split, chunk_index))
+                print(f"  Chunk {n_done:>4}/{len(pending)} | {split} {chunk_index:>4} | {len(df_chunk):,} rows")
+
+    # --- 3. Results ---
+    print("Step 3: Combining checkpoints into the columnar results file...")
+    df_shap = pd.concat([pd.read_parquet(get_checkpoint_path(CHECKPOINT_DIR, split, chunk_index)) for split, chunk_index, _ in chunks])
+    SHAP_VALUES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    df_shap.to_parquet(SHAP_VALUES_PATH)
+    print(f"  Saved {len(df_shap):,} rows to '{SHAP_VALUES_PATH}'")
+
+    # --- 4. Global Importance ---
+    print("Step 4: Summarizing weighted global importance...")
+    shap_columns = [f"{SHAP_COLUMN_PREFIX}{feature}" for feature in SHAP_INPUT_FEATURES]
+    global_importance = {
+        "explainer": {**explainer_configuration, "background": SHAP_BACKGROUND_PATH.as_posix(), "fingerprint": fingerprint},
+        "unit": "USD",
+        "currency_year": 2023,
+        "splits": {
+            split: summarize_global_importance(df_split[shap_columns].to_numpy(), df_split[WEIGHT_COLUMN].to_numpy())
+            for split, df_split in df_shap.groupby(SPLIT_COLUMN, sort=False)
+        },
+    }
+    save_metrics(global_importance, GLOBAL_IMPORTANCE_PATH, verbose=False)
+    shutil.rmtree(CHECKPOINT_DIR)
+    print(f"  Saved '{GLOBAL_IMPORTANCE_PATH}'")
+    for split, summary in global_importance["splits"].items():
+        top_features = ", ".join(f"{entry['name']} (${entry['mean_abs_shap_2023_usd']:,.0f})" for entry in summary["features"][:TOP_N_PRINT])
+        print(f"  {split} top {TOP_N_PRINT} by weighted mean |SHAP|: {top_features}")
+
+    print("\n✅ Global SHAP importance complete.")
+
+
+if __name__ == "__main__":
+    main()
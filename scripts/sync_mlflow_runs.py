@@ -0,0 +1,48 @@
+"""
+Upload MLflow runs logged offline to the MLflow tracking server.
+
+Training and tuning scripts log to the local fallback store (MLFLOW_OFFLINE_URI in
+src/modeling.py) when the MLflow UI server is not running. This script recreates
+those experiments and runs on the tracking server, including params, tags, metric
+histories, and parent-child relations of tuning trials. Uploaded runs are tagged in
+the offline store, so the script can be rerun safely after new offline runs.
+
+Artifacts (e.g., logged models) and dataset inputs are not uploaded.
+
+Usage:
+    1. Start the MLflow UI server (in a separate terminal): ./run_mlflow_ui.sh
+    2. Run: ./.venv-train/Scripts/python scripts/sync_mlflow_runs.py
+"""
+
+# Standard library imports
+import argparse
+
+# Local imports
+from src.modeling import MLFLOW_OFFLINE_URI, MLFLOW_TRACKING_URI, sync_offline_runs
+
+
+def parse_args():
+    """Parse the source (offline) and target (tracking server) URIs."""
+    parser = argparse.ArgumentParser(description="Upload offline MLflow runs to the MLflow tracking server.")
+    parser.add_argument(
+        "--source",
+        default=MLFLOW_OFFLINE_URI,
+        help=f"Offline MLflow store (default: {MLFLOW_OFFLINE_URI}).",
+    )
+    parser.add_argument(
+        "--target",
+        default=MLFLOW_TRACKING_URI,
+        help=f"MLflow tracking server (default: {MLFLOW_TRACKING_URI}).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(f"Uploading offline runs from '{args.source}' to '{args.target}'...")
+    n_synced = sync_offline_runs(args.source, args.target)
+    print(f"\n✅ Uploaded {n_synced} runs.")
+
+
+if __name__ == "__main__":
+    main()
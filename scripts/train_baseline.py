@@ -5,18 +5,23 @@ This script trains multiple baseline models, logs the experiments to MLflow, and
 
 Workflow:
   1.  MLflow Setup: Initialize experiment tracking for "Baseline Models".
-  2.  Data Loading: Load preprocessed Parquet datasets into Memory.
-  3.  Feature-Target Separation: Separate features, target variable, and sample weights.
-  4.  Training and Evaluation: Fit baseline models (e.g., Linear Regression, Random Forest, XGBoost)
+  2.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  3.  Training and Evaluation: Fit baseline models (e.g., Linear Regression, Random Forest, XGBoost)
       on the training data using fixed random states. Predict and evaluate metrics on the validation data.
-  5.  Model Persistence: Save fitted models as individual Joblib files (DVC-tracked), evaluation metrics 
-      as a collective JSON file (Git-tracked), and predicted values as a collective Joblib file (DVC-tracked).
+      Models train concurrently in a process pool, longest-expected-first (expected times from the 
+      previous run's metrics), with multi-threaded models (Random Forest, XGBoost) sharing the CPU 
+      cores left by single-threaded models. Each worker process memory-maps the cached splits once 
+      (pool initializer), and the parent process logs every finished model to MLflow, so only one 
+      process writes to the tracking store. Logs per-model wall time and the critical path.
+  4.  Model Persistence: Save per model the fitted model as a Joblib file, evaluation metrics and 
+      hyperparameters as JSON files, and validation predictions as a .npy file (all DVC stage outputs).
 
 Artifacts:
   - models/*_baseline_model.joblib: Fitted model.
   - models/*_baseline_metrics.json: Evaluation metrics for each model.
   - models/*_baseline_params.json: Hyperparameters for each model.
-  - models/*_baseline_predictions.joblib: Validation set predictions for each model.
+  - models/*_baseline_predictions.npy: Validation set predictions for each model.
 
 Reference:
     For model training exploration, in-depth model evaluation, error analysis, and detailed rationale, see:
@@ -28,83 +33,171 @@ Usage:
 """
 
 # Standard library imports
+import os
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Thrid-party imports
-import pandas as pd
 import mlflow
 
 # Local imports
-from src.constants import TARGET_COLUMN, WEIGHT_COLUMN
-from src.modeling import get_baseline_models, train_and_evaluate, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, save_model, save_metrics, get_core_model_params
+from src.modeling import get_baseline_models, train_and_evaluate, log_training_run, resolve_tracking_uri, load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, CompactForestRegressor, save_model, save_metrics, load_metrics, get_core_model_params
 
 # Suppress benign MLflow warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
 
 
+# Scheduling: Expected training time in seconds (fallback when no previous baseline metrics exist).
+# Models are started longest-expected-first, so the slowest model (SVR) is on the critical path from the start.
+EXPECTED_TRAINING_TIME = {
+    "Support Vector Machine": 300,
+    "Random Forest": 120,
+    "Approximate SVM": 60,
+    "XGBoost": 30,
+    "Elastic Net": 10,
+    "Decision Tree": 2,
+    "Linear Regression": 1,
+    "Median Prediction": 0,
+}
+
+
+def get_model_id(model_name):
+    """Consistent model identifier for filenames."""
+    return (model_name.lower().replace(" ", "_")
+            .replace("support_vector_machine", "svm")
+            .replace("approximate_svm", "svm_approx")
+            .replace("linear_regression", "lr")
+            .replace("elastic_net", "en")
+            .replace("decision_tree", "tree")
+            .replace("random_forest", "rf")
+            .replace("xgboost", "xgb")
+            .replace("median_prediction", "median"))
+
+
+def get_expected_training_time(model_name):
+    """Expected training time from the previous baseline run's metrics, or the EXPECTED_TRAINING_TIME prior."""
+    previous_metrics = load_metrics(f"models/{get_model_id(model_name)}_baseline_metrics.json", verbose=False) or {}
+    previous_result = previous_metrics.get(f"{model_name} (Baseline)", {})
+    return previous_result.get("training_time", EXPECTED_TRAINING_TIME.get(model_name, 0))
+
+
+def replace_n_jobs(model, old_n_jobs, new_n_jobs):
+    """Replace n_jobs parameters equal to old_n_jobs in a model and its fitted inner regressor (if any)."""
+    for estimator in [model, getattr(model, "regressor_", None)]:
+        if estimator is not None:
+            estimator.set_params(**{
+                name: new_n_jobs
+                for name, value in estimator.get_params().items()
+                if name.split("__")[-1] == "n_jobs" and value == old_n_jobs
+            })
+
+
+def is_multithreaded(model):
+    """Whether a model uses all CPU cores (n_jobs=-1) during training."""
+    return any(name.split("__")[-1] == "n_jobs" and value == -1 for name, value in model.get_params().items())
+
+
+_splits = None  # (X_train, y_train, X_val, y_val, w_train, w_val), loaded once per worker process by init_worker
+
+
+def init_worker():
+    """Memory-map the cached training and validation splits of a worker process (instead of pickling them per model)."""
+    global _splits
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    _splits = (X_train, y_train, X_val, y_val, w_train, w_val)
+
+
+def train_baseline_model(model_name, model, n_threads):
+    """Train and evaluate one baseline model on the worker's splits (runs in a worker process, MLflow logging in the parent)."""
+    start_time = time.time()
+
+    # Multi-threaded models use their CPU share (fitted models are identical for any thread count)
+    multithreaded = is_multithreaded(model)
+    if multithreaded:
+        replace_n_jobs(model, -1, n_threads)
+    result = train_and_evaluate(model, *_splits)
+    if multithreaded:
+        # Restore n_jobs=-1, so saved models and params match sequential training
+        replace_n_jobs(result["fitted_model"], n_threads, -1)
+    result["wall_time"] = time.time() - start_time
+    return result
+
+
 # Main Baseline Model Training 
 def main():
     # --- 1. MLflow Setup --- 
     print("Step 1: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000") # Points to running MLflow UI server
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # MLflow UI server (or local fallback store if it is not running)
     mlflow.set_experiment("Baseline Models")
     print(f"  Set up 'Baseline Models' experiment in MLflow with tracking URI '{mlflow.get_tracking_uri()}'")
 
     # --- 2. Preprocessed Data Loading ---
-    print("Step 2: Loading preprocessed data...")
-    df_train_preprocessed = pd.read_parquet(TRAIN_MODEL_READY_DATA_PATH)
-    df_val_preprocessed = pd.read_parquet(VAL_MODEL_READY_DATA_PATH)
-    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(df_train_preprocessed):,} rows and {len(df_train_preprocessed.columns):,} columns")
-    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(df_val_preprocessed):,} rows and {len(df_val_preprocessed.columns):,} columns")
-
-    # --- 3. Feature-Target Separation ---
-    print("Step 3: Separating features and target...")
-    X_train_preprocessed = df_train_preprocessed.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_train = df_train_preprocessed[TARGET_COLUMN]
-    w_train = df_train_preprocessed[WEIGHT_COLUMN]
-    X_val_preprocessed = df_val_preprocessed.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_val = df_val_preprocessed[TARGET_COLUMN]
-    w_val = df_val_preprocessed[WEIGHT_COLUMN]
-    del df_train_preprocessed, df_val_preprocessed  # Free up memory
-    print("  Separated data into X features, y target variable, and w sample weights")
-
-    # --- 4. Model Training and Evaluation ---
-    print("Step 4: Training and evaluating baseline models...")    
+    print("Step 2: Loading preprocessed features, target, and sample weights...")
+    X_train_preprocessed, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val_preprocessed, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train_preprocessed):,} rows and {X_train_preprocessed.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val_preprocessed):,} rows and {X_val_preprocessed.shape[1]:,} features")
+
+    # --- 3. Model Training and Evaluation ---
+    print("Step 3: Training and evaluating baseline models...")    
     baseline_models = get_baseline_models()
+
+    # Schedule longest-expected-first in a process pool (one process per model, up to the CPU count)
+    expected_times = {model_name: get_expected_training_time(model_name) for model_name in baseline_models}
+    schedule = sorted(baseline_models, key=expected_times.get, reverse=True)
+    n_cpus = os.cpu_count() or 1
+    n_workers = min(len(schedule), n_cpus)
+    # Single-threaded models get one core each; multi-threaded models (RF, XGBoost) share the remaining cores
+    n_multithreaded = sum(is_multithreaded(model) for model in baseline_models.values())
+    n_threads = max(1, (n_cpus - (n_workers - n_multithreaded)) // max(1, n_multithreaded))
+    print(f"  Scheduling {len(schedule)} models on {n_workers} processes ({n_threads} threads per multi-threaded model): {', '.join(schedule)}")
+
     baseline_results = {}
-    for model_name, model in baseline_models.items():
-        print(f"  Training {model_name}...")
-        result = train_and_evaluate(
-            model, 
-            X_train_preprocessed, y_train, 
-            X_val_preprocessed, y_val, 
-            w_train, w_val,
-            track_mlflow=True,
-            model_name=model_name
-        )
-        baseline_results[model_name] = result
-        print(f"    {model_name:<20} → MdAE: {result['val_mdae']:8.2f} | MAE: {result['val_mae']:8.2f} | "
-              f"R²: {result['val_r2']:.4f} | Training Time: {result['training_time']:.2f}s")
-
-    # --- 5. Model Persistence ---
-    print("Step 5: Persisting baseline models...")
+    schedule_start = time.time()
+    # Splits are already in the feature cache (Step 2), so each worker memory-maps them once
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker) as executor:
+        futures = {
+            executor.submit(train_baseline_model, model_name, baseline_models[model_name], n_threads): model_name
+            for model_name in schedule
+        }
+        for future in as_completed(futures):
+            model_name = futures[future]
+            result = future.result()
+            baseline_results[model_name] = result
+            # Log in the parent process (unfitted model's params, as with sequential training)
+            log_training_run(
+                model_name, baseline_models[model_name].get_params(), result,
+                train_data_path=TRAIN_MODEL_READY_DATA_PATH, val_data_path=VAL_MODEL_READY_DATA_PATH
+            )
+            print(f"    {model_name:<22} → MdAE: {result['val_mdae']:8.2f} | MAE: {result['val_mae']:8.2f} | "
+                  f"R²: {result['val_r2']:.4f} | Training Time: {result['training_time']:.2f}s | Wall Time: {result['wall_time']:.2f}s")
+    schedule_time = time.time() - schedule_start
+
+    # Critical path: The longest single model bounds the schedule's wall time
+    critical_model = max(baseline_results, key=lambda model_name: baseline_results[model_name]["wall_time"])
+    sequential_time = sum(result["wall_time"] for result in baseline_results.values())
+    print(f"  Critical path: {critical_model} ({baseline_results[critical_model]['wall_time']:.1f} s) | "
+          f"Schedule wall time: {schedule_time:.1f} s | Sequential sum: {sequential_time:.1f} s")
+
+    # Persist in the original model order
+    baseline_results = {model_name: baseline_results[model_name] for model_name in baseline_models}
+
+    # --- 4. Model Persistence ---
+    print("Step 4: Persisting baseline models...")
     for model_name, result in baseline_results.items():        
-        # Consistent model identifier for filenames
-        model_id = (model_name.lower().replace(" ", "_")
-                    .replace("support_vector_machine", "svm")
-                    .replace("linear_regression", "lr")
-                    .replace("elastic_net", "en")
-                    .replace("decision_tree", "tree")
-                    .replace("random_forest", "rf")
-                    .replace("xgboost", "xgb")
-                    .replace("median_prediction", "median"))
+        model_id = get_model_id(model_name)
         
-        # 5.1. Save fitted model as .joblib file
+        # 4.1. Save fitted model as .joblib file (random forest as compact inference-only arrays)
         model_path = f"models/{model_id}_baseline_model.joblib"
-        save_model(result["fitted_model"], model_path, verbose=False)
+        fitted_model = result["fitted_model"]
+        if model_name == "Random Forest":
+            fitted_model = CompactForestRegressor.from_model(fitted_model)
+        save_model(fitted_model, model_path, verbose=False)
         print(f"  Saved fitted {model_name} model to '{model_path}'")
         
-        # 5.2. Save evaluation metrics as JSON
+        # 4.2. Save evaluation metrics as JSON
         metrics_dict = {
             f"{model_name} (Baseline)": {
                 "val_mdae": result["val_mdae"],
@@ -120,13 +213,13 @@ def main():
         save_metrics(metrics_dict, metrics_path, verbose=False)
         print(f"  Saved evaluation metrics of {model_name} to '{metrics_path}'")
 
-        # 5.3. Save hyperparameters as JSON
+        # 4.3. Save hyperparameters as JSON
         params_path = f"models/{model_id}_baseline_params.json"
         save_metrics(get_core_model_params(result["fitted_model"]), params_path, verbose=False)
         print(f"  Saved hyperparameters of {model_name} to '{params_path}'")
         
-        # 5.4. Save predicted values as .joblib file
-        pred_path = f"models/{model_id}_baseline_predictions.joblib"
+        # 4.4. Save predicted values as .npy file
+        pred_path = f"models/{model_id}_baseline_predictions.npy"
         save_model(result["y_val_pred"], pred_path, verbose=False)
         print(f"  Saved predicted values of {model_name} to '{pred_path}'")
 
@@ -8,20 +8,20 @@ logs the experiment to MLflow, and persists the model results.
 
 Workflow:
   1.  MLflow Setup: Initialize experiment tracking for "Quantile Regression".
-  2.  Preprocessed Data Loading: Load Parquet datasets into memory.
-  3.  Feature-Target Separation: Separate features, target variable, and sample weights.
-  4.  Model Configuration: Load tuned hyperparameters and adapt them for quantile regression.
-  5.  Training: Fit the multi-quantile model on log-transformed targets.
-  6.  Predictions: Generate and post-process predictions (non-negative, monotonic).
-  7.  Evaluation: Compute median accuracy, interval coverage, and interval width metrics.
-  8.  Model Persistence: Save the fitted model, evaluation metrics, hyperparameters, and
+  2.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  3.  Model Configuration: Load tuned hyperparameters and adapt them for quantile regression.
+  4.  Training: Fit the multi-quantile model on log-transformed targets.
+  5.  Predictions: Generate and post-process predictions (non-negative, monotonic).
+  6.  Evaluation: Compute median accuracy, interval coverage, and interval width metrics.
+  7.  Model Persistence: Save the fitted model, evaluation metrics, hyperparameters, and
       predicted values.
 
 Artifacts:
-  - models/xgb_quantile_model.joblib: Fitted model.
+  - models/xgb_quantile_model.ubj: Fitted model (native XGBoost format, wrapper metadata in models/xgb_quantile_model.json).
   - models/xgb_quantile_metrics.json: Evaluation metrics.
   - models/xgb_quantile_params.json: Hyperparameters used for training.
-  - models/xgb_quantile_predictions.joblib: Validation set predictions for all quantiles.
+  - models/xgb_quantile_predictions.npy: Validation set predictions for all quantiles.
 
 Reference:
     For quantile regression exploration and detailed rationale, see:
@@ -37,7 +37,6 @@ import time
 import warnings
 
 # Third-party imports
-import pandas as pd
 import numpy as np
 import mlflow
 from xgboost import XGBRegressor
@@ -45,8 +44,9 @@ from sklearn.compose import TransformedTargetRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 
 # Local imports
-from src.constants import TARGET_COLUMN, WEIGHT_COLUMN
 from src.modeling import (
+    load_split,
+    FEATURE_CACHE_DIR,
     TRAIN_MODEL_READY_DATA_PATH,
     VAL_MODEL_READY_DATA_PATH,
     weighted_median_absolute_error,
@@ -54,6 +54,8 @@ from src.modeling import (
     save_model,
     save_metrics,
     load_metrics,
+    resolve_tracking_uri,
+    log_dataset_input,
 )
 
 # Suppress benign MLflow warnings
@@ -63,30 +65,19 @@ warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
 def main():
     # --- 1. MLflow Setup ---
     print("Step 1: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")  # Points to running MLflow UI server
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # MLflow UI server (or local fallback store if it is not running)
     mlflow.set_experiment("Quantile Regression")
     print(f"  Set up 'Quantile Regression' experiment in MLflow with tracking URI '{mlflow.get_tracking_uri()}'")
 
     # --- 2. Preprocessed Data Loading ---
-    print("Step 2: Loading preprocessed data...")
-    df_train = pd.read_parquet(TRAIN_MODEL_READY_DATA_PATH)
-    df_val = pd.read_parquet(VAL_MODEL_READY_DATA_PATH)
-    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(df_train):,} rows and {len(df_train.columns):,} columns")
-    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(df_val):,} rows and {len(df_val.columns):,} columns")
-
-    # --- 3. Feature-Target Separation ---
-    print("Step 3: Separating features and target...")
-    X_train = df_train.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_train = df_train[TARGET_COLUMN]
-    w_train = df_train[WEIGHT_COLUMN]
-    X_val = df_val.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_val = df_val[TARGET_COLUMN]
-    w_val = df_val[WEIGHT_COLUMN]
-    del df_train, df_val  # Free up memory
-    print("  Separated data into X features, y target variable, and w sample weights")
-
-    # --- 4. Model Configuration ---
-    print("Step 4: Configuring XGBoost multi-quantile model parameters...")
+    print("Step 2: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+
+    # --- 3. Model Configuration ---
+    print("Step 3: Configuring XGBoost multi-quantile model parameters...")
     QUANTILES = [0.25, 0.50, 0.75, 0.90]
 
     tuned_params = load_metrics("models/xgb_tuned_params.json", verbose=False)
@@ -110,8 +101,8 @@ def main():
     })
     print(f"  Loaded hyperparameters of best tuned model and updated them for {len(QUANTILES)} quantiles: {QUANTILES}")
 
-    # --- 5. Model Training ---
-    print("Step 5: Training XGBoost quantile regression model...")
+    # --- 4. Model Training ---
+    print("Step 4: Training XGBoost quantile regression model...")
     # Train on log-costs: quantiles are invariant to monotonic transformations, and the log scale
     # stabilizes tree-splitting logic by preventing extreme outliers from dominating the partition search.
     xgb_quantile_model = TransformedTargetRegressor(
@@ -127,21 +118,9 @@ def main():
         # Tag raw MEPS SAS data source
         mlflow.set_tag("data_source", "h251.sas7bdat")  
         
-        # Log data lineage (preprocessed datasets used for training and evaluation)
-        data_train = mlflow.data.from_pandas(
-            X_train.assign(**{TARGET_COLUMN: y_train}), 
-            targets=TARGET_COLUMN,
-            source=TRAIN_MODEL_READY_DATA_PATH,
-            name="training_data"
-        )
-        data_val = mlflow.data.from_pandas(
-            X_val.assign(**{TARGET_COLUMN: y_val}), 
-            targets=TARGET_COLUMN,
-            source=VAL_MODEL_READY_DATA_PATH,
-            name="validation_data"
-        )
-        mlflow.log_input(data_train, context="training")
-        mlflow.log_input(data_val, context="validation")
+        # Log data lineage (preprocessed datasets used for training and evaluation, cached Parquet digests)
+        log_dataset_input(TRAIN_MODEL_READY_DATA_PATH, name="training_data", context="training")
+        log_dataset_input(VAL_MODEL_READY_DATA_PATH, name="validation_data", context="validation")
 
         # Log model hyperparameters
         mlflow.log_params(xgb_quantile_params)
@@ -152,8 +131,8 @@ def main():
         training_time = time.time() - start_time
         print(f"  Completed training in {training_time:.1f} s")
 
-        # --- 6. Predictions ---
-        print("Step 6: Predicting on training and validation set...")
+        # --- 5. Predictions ---
+        print("Step 5: Predicting on training and validation set...")
         # Predict on training and validation set
         y_train_pred_raw = xgb_quantile_model.predict(X_train)
         y_val_pred_raw = xgb_quantile_model.predict(X_val)
@@ -163,8 +142,8 @@ def main():
         y_val_pred = postprocess_quantile_predictions(y_val_pred_raw)
         print(f"  Generated predictions for {len(y_train_pred):,} train and {len(y_val_pred):,} validation samples and ensured non-negative and monotonic predictions")
 
-        # --- 7. Evaluation ---
-        print("Step 7: Evaluating model performance...")
+        # --- 6. Evaluation ---
+        print("Step 6: Evaluating model performance...")
         # Unpack quantiles
         y_train_pred_q25, y_train_pred_q50, y_train_pred_q75, y_train_pred_q90 = y_train_pred.T
         y_val_pred_q25, y_val_pred_q50, y_val_pred_q75, y_val_pred_q90 = y_val_pred.T
@@ -217,13 +196,13 @@ def main():
             "training_time": training_time,
         })
 
-    # --- 8. Model Persistence ---
-    print("Step 8: Persisting model results...")
-    # 8.1. Save fitted model as .joblib file
-    save_model(xgb_quantile_model, "models/xgb_quantile_model.joblib", verbose=False)
-    print("  Saved fitted XGBoost quantile regression model to 'models/xgb_quantile_model.joblib'")
+    # --- 7. Model Persistence ---
+    print("Step 7: Persisting model results...")
+    # 7.1. Save fitted model as .joblib file
+    save_model(xgb_quantile_model, "models/xgb_quantile_model.ubj", verbose=False)
+    print("  Saved fitted XGBoost quantile regression model to 'models/xgb_quantile_model.ubj'")
 
-    # 8.2. Save evaluation metrics as JSON
+    # 7.2. Save evaluation metrics as JSON
     xgb_quantile_metrics = {
         "XGBoost (Quantile)": {
             "train_q50_mdae": train_q50_mdae,
@@ -246,13 +225,13 @@ def main():
     save_metrics(xgb_quantile_metrics, "models/xgb_quantile_metrics.json", verbose=False)
     print("  Saved evaluation metrics to 'models/xgb_quantile_metrics.json'")
 
-    # 8.3. Save hyperparameters as JSON
+    # 7.3. Save hyperparameters as JSON
     save_metrics(xgb_quantile_params, "models/xgb_quantile_params.json", verbose=False)
     print("  Saved hyperparameters to 'models/xgb_quantile_params.json'")
 
-    # 8.4. Save predicted values as .joblib file
-    save_model(y_val_pred, "models/xgb_quantile_predictions.joblib", verbose=False)
-    print("  Saved predicted values for the validation set to 'models/xgb_quantile_predictions.joblib'")
+    # 7.4. Save predicted values as .npy file
+    save_model(y_val_pred, "models/xgb_quantile_predictions.npy", verbose=False)
+    print("  Saved predicted values for the validation set to 'models/xgb_quantile_predictions.npy'")
 
     print("\n✅ XGBoost quantile regression complete.")
 
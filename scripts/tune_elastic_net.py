@@ -10,21 +10,28 @@ metrics, hyperparameters, predictions, and the full randomized search history.
 
 Workflow:
   1.  MLflow Setup: Initialize experiment tracking for "Elastic Net Tuning".
-  2.  Preprocessed Data Loading: Load Parquet datasets into memory.
-  3.  Feature-Target Separation: Separate features, target variable, and sample weights.
-  4.  Hyperparameter Search: Evaluate N_ITER random configurations using 
-      ParameterSampler. Track each trial as an MLflow child run with 
+  2.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  3.  Hyperparameter Search: Evaluate N_ITER configurations proposed by the 
+      sampler set in src/params.py (randomized search with ParameterSampler or 
+      TPE model-based search, see src/tuning.py). For randomized search, the 
+      sampled l1_ratio is snapped to PATH_L1_RATIO_GRID, the polynomial 
+      expansion is computed once per `interaction_only` setting, and all alphas 
+      of the same (interaction_only, l1_ratio) are solved along one warm-started 
+      regularization path and scored in one batch. Training metrics use the full training split, a fixed 
+      stratified subsample, or are skipped (TRAIN_METRICS_STRATEGY in 
+      src/params.py). Track each trial as an MLflow child run with 
       training/validation metrics and training time.
-  5.  Best Model: Retrain the best configuration with full MLflow logging.
-  6.  Model Persistence: Save the best tuned model as a Joblib file, evaluation metrics 
-      as JSON, parameters as JSON, predictions as Joblib, and full random search history 
+  4.  Best Model: Retrain the best configuration with full MLflow logging.
+  5.  Model Persistence: Save the best tuned model as a Joblib file, evaluation metrics 
+      as JSON, parameters as JSON, predictions as .npy, and full random search history 
       as JSON.
 
 Artifacts:
   - models/en_tuned_model.joblib: Best fitted model.
   - models/en_tuned_metrics.json: Evaluation metrics for the best tuned model.
   - models/en_tuned_params.json: Hyperparameters of the best tuned model.
-  - models/en_tuned_predictions.joblib: Validation set predictions of the best tuned model.
+  - models/en_tuned_predictions.npy: Validation set predictions of the best tuned model.
   - models/en_tuning_history.json: Metrics and params for entire random search history.
 
 Reference:
@@ -39,57 +46,161 @@ Usage:
 # Standard library imports
 import time
 import warnings
+from collections import Counter
 
 # Third-party imports
-import pandas as pd
 import numpy as np
 import mlflow
 from sklearn.linear_model import ElasticNet
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.pipeline import Pipeline
 from sklearn.compose import TransformedTargetRegressor
-from sklearn.model_selection import ParameterSampler
-from sklearn.metrics import mean_absolute_error, r2_score
 
 # Local imports
-from src.constants import TARGET_COLUMN, WEIGHT_COLUMN, RANDOM_STATE
-from src.modeling import train_and_evaluate, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_model, save_metrics, get_core_model_params
-from src.params import EN_PARAM_DISTRIBUTIONS, EN_N_ITER
+from src.constants import RANDOM_STATE
+from src.modeling import train_and_evaluate, AsyncMlflowLogger, resolve_tracking_uri, log_dataset_input, get_train_metrics_indices, load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_regression_metrics_batch, save_model, save_metrics, get_core_model_params
+from src.params import EN_PARAM_DISTRIBUTIONS, EN_N_ITER, SEARCH_SAMPLER, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE
+from src.tuning import get_param_sampler, prepare_weighted_design, weighted_elastic_net_path
 
 # Suppress benign MLflow warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
 
 
+# Solve trials along warm-started regularization paths instead of independent cold-start fits
+USE_REGULARIZATION_PATH = True
+# l1_ratio values of the regularization paths (sampled l1_ratios are snapped to the nearest value, 
+# so the alphas of several trials share one path; centers of the quintiles of uniform(0, 1))
+PATH_L1_RATIO_GRID = [0.1, 0.3, 0.5, 0.7, 0.9]
+
+
+def fit_and_evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """Fit one Elastic Net configuration from scratch and evaluate it on the training and validation set."""
+    # Build model: Elastic Net with Polynomial Features wrapped in Target Log-Transformer
+    model = TransformedTargetRegressor(
+        regressor=Pipeline([
+            ("polynomials", PolynomialFeatures(degree=2, include_bias=False)),  # include_bias=False lets ElasticNet handle the intercept
+            ("model", ElasticNet(random_state=RANDOM_STATE, max_iter=2000))
+        ]),
+        func=np.log1p,
+        inverse_func=np.expm1
+    )
+    # Set hyperparameters for the internal model in the pipeline
+    model.regressor.set_params(**params)
+
+    # Train with normalized sample weights (passed to the last pipeline step) and evaluate with raw survey weights
+    result = train_and_evaluate(
+        model,
+        X_train, y_train,
+        X_val, y_val,
+        w_train, w_val,
+        calculate_train_metrics=TRAIN_METRICS_STRATEGY != "off",
+        train_metrics_indices=train_metrics_indices
+    )
+    return {name: value for name, value in result.items() if name not in ("fitted_model", "y_val_pred")}
+
+
+def snap_l1_ratios(param_list, grid=PATH_L1_RATIO_GRID):
+    """Snap the l1_ratio of every configuration to the nearest grid value (all other parameters unchanged)."""
+    grid = np.asarray(grid, dtype=np.float64)
+    return [{**params, "model__l1_ratio": float(grid[np.argmin(np.abs(grid - params["model__l1_ratio"]))])} for params in param_list]
+
+
+def evaluate_along_regularization_paths(param_list, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """
+    Evaluate all Elastic Net configurations with shared polynomial expansions and regularization paths.
+
+    Trials are grouped by `interaction_only`, so the polynomial expansion of the training and 
+    validation features is computed once per group. Within a group, trials are sub-grouped by 
+    `l1_ratio` (snapped to a small grid with snap_l1_ratios, otherwise every sub-group holds a 
+    single trial), and all alphas of a sub-group are solved along one warm-started coordinate 
+    descent path (solved in increasing l1_ratio order, each path starting from its neighbor's 
+    solution). All alphas of a path are then scored in one batched evaluation. The solutions are 
+    the same as independent ElasticNet fits (up to the solver tolerance).
+
+    Returns:
+        list[dict]: Evaluation metrics per trial (same keys and order as fit_and_evaluate_trial over param_list).
+            The training time of a trial is its share of the path and polynomial expansion time.
+    """
+    results = [None] * len(param_list)
+    y_train_log = np.log1p(y_train.to_numpy())
+    # Training rows for the overfitting diagnostic (all rows unless a fixed subsample is given)
+    train_rows = np.arange(len(y_train)) if train_metrics_indices is None else train_metrics_indices
+    y_train_eval, w_train_eval = y_train.iloc[train_rows], w_train.iloc[train_rows]
+
+    for interaction_only in sorted({params["polynomials__interaction_only"] for params in param_list}):
+        group_idx = [i for i, params in enumerate(param_list) if params["polynomials__interaction_only"] == interaction_only]
+
+        # Expand features and prepare the weighted design once per polynomial setting
+        setup_start = time.time()
+        polynomials = PolynomialFeatures(degree=2, interaction_only=interaction_only, include_bias=False).fit(X_train)
+        X_train_poly = polynomials.transform(X_train)
+        X_val_poly = polynomials.transform(X_val)
+        design = prepare_weighted_design(X_train_poly, y_train_log, w_train)
+        setup_time_share = (time.time() - setup_start) / len(group_idx)
+
+        trials_by_l1_ratio = {}
+        for i in group_idx:
+            trials_by_l1_ratio.setdefault(param_list[i]["model__l1_ratio"], []).append(i)
+
+        previous_alphas, previous_coefs = None, None
+        for l1_ratio in sorted(trials_by_l1_ratio):
+            path_idx = trials_by_l1_ratio[l1_ratio]
+            alphas = np.array([param_list[i]["model__alpha"] for i in path_idx])
+
+            # Warm start from the neighboring path's solution closest to this path's largest alpha
+            coef_init = None
+            if previous_coefs is not None:
+                closest = np.argmin(np.abs(np.log(previous_alphas) - np.log(alphas.max())))
+                coef_init = previous_coefs[:, closest]
+
+            path_start = time.time()
+            coefs, intercepts = weighted_elastic_net_path(design, l1_ratio, alphas, coef_init=coef_init, max_iter=2000)
+            path_time_share = (time.time() - path_start) / len(path_idx)
+            previous_alphas, previous_coefs = alphas, coefs
+
+            # Batched evaluation of all alphas with raw survey weights (predictions in raw dollars)
+            val_metrics = weighted_regression_metrics_batch(y_val, np.expm1(X_val_poly @ coefs + intercepts), w_val)
+            if TRAIN_METRICS_STRATEGY != "off":
+                train_metrics = weighted_regression_metrics_batch(y_train_eval, np.expm1(X_train_poly[train_rows] @ coefs + intercepts), w_train_eval)
+            for k, i in enumerate(path_idx):
+                results[i] = {
+                    "val_mdae": val_metrics["mdae"][k],
+                    "val_mae": val_metrics["mae"][k],
+                    "val_r2": val_metrics["r2"][k],
+                    "training_time": setup_time_share + path_time_share
+                }
+                if TRAIN_METRICS_STRATEGY != "off":
+                    results[i].update({
+                        "train_mdae": train_metrics["mdae"][k],
+                        "train_mae": train_metrics["mae"][k],
+                        "train_r2": train_metrics["r2"][k]
+                    })
+    return results
+
+
 def main():
     # --- 1. MLflow Setup ---
     print("Step 1: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")
-    mlflow.set_experiment("Elastic Net Tuning")
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # Local fallback store if the MLflow UI server is not running
+    experiment = mlflow.set_experiment("Elastic Net Tuning")
     print(f"  Set up 'Elastic Net Tuning' experiment in MLflow with tracking URI '{mlflow.get_tracking_uri()}'")
 
     # --- 2. Preprocessed Data Loading ---
-    print("Step 2: Loading preprocessed data...")
-    df_train = pd.read_parquet(TRAIN_MODEL_READY_DATA_PATH)
-    df_val = pd.read_parquet(VAL_MODEL_READY_DATA_PATH)
-    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(df_train):,} rows and {len(df_train.columns):,} columns")
-    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(df_val):,} rows and {len(df_val.columns):,} columns")
-
-    # --- 3. Feature-Target Separation ---
-    print("Step 3: Separating features and target...")
-    X_train = df_train.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_train = df_train[TARGET_COLUMN]
-    w_train = df_train[WEIGHT_COLUMN]
-    X_val = df_val.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_val = df_val[TARGET_COLUMN]
-    w_val = df_val[WEIGHT_COLUMN]
-    del df_train, df_val  # Free up memory
-    print("  Separated data into X features, y target variable, and w sample weights")
-
-    # --- 4. Randomized Search ---
-    print(f"Step 4: Running randomized search ({EN_N_ITER} iterations)...")
-    # Normalize training weights (mean=1.0) for numerical stability during model fitting
-    w_train_norm = w_train / w_train.mean()
-    param_list = list(ParameterSampler(EN_PARAM_DISTRIBUTIONS, n_iter=EN_N_ITER, random_state=RANDOM_STATE))
+    print("Step 2: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+
+    # --- 3. Randomized Search ---
+    print(f"Step 3: Running {SEARCH_SAMPLER} search ({EN_N_ITER} iterations)...")
+    # Sampler proposes each trial's hyperparameters (TPE adapts proposals to the validation MdAE of finished trials)
+    sampler = get_param_sampler(EN_PARAM_DISTRIBUTIONS, n_iter=EN_N_ITER, sampler=SEARCH_SAMPLER, random_state=RANDOM_STATE)
+    param_list = []
+    # Regularization path mode requires all trials upfront (random search); TPE trials are fitted one by one
+    use_regularization_path = USE_REGULARIZATION_PATH and SEARCH_SAMPLER == "random"
+    # Fixed training rows for the per-trial overfitting diagnostic (same rows in every trial)
+    train_metrics_indices = get_train_metrics_indices(y_train, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE)
 
     tuning_history = []
     best_mdae = np.inf  # positive infinity
@@ -97,82 +208,66 @@ def main():
     search_start = time.time()
 
     # Start MLflow parent run (to group all iterations as child runs for better organization in UI)
-    with mlflow.start_run(run_name="Elastic Net Randomized Search"):
+    # Trials are logged as child runs on a background thread (search wall time excludes tracking latency)
+    with mlflow.start_run(run_name="Elastic Net Randomized Search") as parent_run, \
+            AsyncMlflowLogger(mlflow.get_tracking_uri(), experiment.experiment_id) as tracker:
         mlflow.set_tag("stage", "tuning")
+        log_dataset_input(TRAIN_MODEL_READY_DATA_PATH, name="training_data", context="training")
+        log_dataset_input(VAL_MODEL_READY_DATA_PATH, name="validation_data", context="validation")
         mlflow.log_param("n_iterations", EN_N_ITER)
-
-        for i, params in enumerate(param_list):
-            # Build model: Elastic Net with Polynomial Features wrapped in Target Log-Transformer
-            model = TransformedTargetRegressor(
-                regressor=Pipeline([
-                    ("polynomials", PolynomialFeatures(degree=2, include_bias=False)),  # include_bias=False lets ElasticNet handle the intercept
-                    ("model", ElasticNet(random_state=RANDOM_STATE, max_iter=2000))
-                ]),
-                func=np.log1p,
-                inverse_func=np.expm1
-            )
-            # Set hyperparameters for the internal model in the pipeline
-            model.regressor.set_params(**params)
-
-            # Train with normalized sample weights
-            iter_start = time.time()
-            # We need to pass the sample_weight correctly to the last step of the pipeline
-            model.fit(X_train, y_train, model__sample_weight=w_train_norm)
-            training_time = time.time() - iter_start
-
-            # Predict on training and validation set (predictions in raw dollars)
-            y_train_pred = model.predict(X_train)
-            y_val_pred = model.predict(X_val)
-
-            # Evaluate with raw survey weights
-            train_mdae = weighted_median_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_mae = mean_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_r2 = r2_score(y_train, y_train_pred, sample_weight=w_train)
-
-            val_mdae = weighted_median_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_mae = mean_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_r2 = r2_score(y_val, y_val_pred, sample_weight=w_val)
+        mlflow.log_param("sampler", SEARCH_SAMPLER)
+        mlflow.log_param("regularization_path", use_regularization_path)
+        mlflow.log_param("train_metrics", TRAIN_METRICS_STRATEGY)
+
+        if use_regularization_path:
+            path_param_list = snap_l1_ratios(sampler.param_list)
+            path_sizes = Counter((params["polynomials__interaction_only"], params["model__l1_ratio"]) for params in path_param_list)
+            n_shared = sum(size for size in path_sizes.values() if size > 1)
+            mlflow.log_param("path_l1_ratio_grid", PATH_L1_RATIO_GRID)
+            mlflow.log_metric("n_regularization_paths", len(path_sizes))
+            mlflow.log_metric("n_shared_path_trials", n_shared)
+            print(f"  {len(path_sizes)} regularization paths: {n_shared}/{EN_N_ITER} configurations share a path with other alphas")
+            path_results = evaluate_along_regularization_paths(path_param_list, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+
+        for i in range(EN_N_ITER):
+            trial_id, params = sampler.ask()
+            if use_regularization_path:
+                params = path_param_list[i]  # Snapped l1_ratio (the configuration actually fitted)
+            param_list.append(params)
+
+            if use_regularization_path:
+                trial_result = path_results[i]
+            else:
+                trial_result = fit_and_evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+            val_mdae = trial_result["val_mdae"]
 
             tuning_history.append({
                 "params": params,
-                "train_mdae": train_mdae,
-                "train_mae": train_mae,
-                "train_r2": train_r2,
-                "val_mdae": val_mdae,
-                "val_mae": val_mae,
-                "val_r2": val_r2,
-                "training_time": training_time
+                "sampler": SEARCH_SAMPLER,
+                "train_metrics": TRAIN_METRICS_STRATEGY,
+                **trial_result
             })
 
-            # Track best configuration
+            # Report result to sampler and track best configuration
+            sampler.tell(trial_id, val_mdae)
             if val_mdae < best_mdae:
                 best_mdae = val_mdae
                 best_idx = i
 
             # Log each iteration to MLflow as a child run
-            with mlflow.start_run(run_name=f"Trial {i+1:03d}", nested=True):  # :03d displays 3-digit integer with leading zeros
-                mlflow.log_params(params)
-                mlflow.log_metrics({
-                    "val_mdae": val_mdae,
-                    "val_mae": val_mae,
-                    "val_r2": val_r2,
-                    "train_mdae": train_mdae,
-                    "train_mae": train_mae,
-                    "train_r2": train_r2,
-                    "training_time": training_time
-                })
+            tracker.log_run(f"Trial {i+1:03d}", params=params, metrics=trial_result, parent_run_id=parent_run.info.run_id)  # :03d displays 3-digit integer with leading zeros
 
             # Progress logging 
             squares_label = "off" if params["polynomials__interaction_only"] else "on "  # interaction_only=True means turning off squared features
-            print(f"  [{i+1:3d}/{EN_N_ITER}] MdAE: {val_mdae:8.2f} | alpha={params['model__alpha']:.2f}, l1_ratio={params['model__l1_ratio']:.2f}, squares={squares_label:3} | fit: {training_time:5.1f} s")
+            print(f"  [{i+1:3d}/{EN_N_ITER}] MdAE: {val_mdae:8.2f} | alpha={params['model__alpha']:.2f}, l1_ratio={params['model__l1_ratio']:.2f}, squares={squares_label:3} | fit: {trial_result['training_time']:5.1f} s")
 
         mlflow.log_metric("random_search_time", time.time() - search_start)
 
     total_search_time = time.time() - search_start
     print(f"  Random search completed in {total_search_time:.0f} s")
 
-    # --- 5. Best Model: Retrain with MLflow Logging ---
-    print("Step 5: Retraining best model...")
+    # --- 4. Best Model: Retrain with MLflow Logging ---
+    print("Step 4: Retraining best model...")
     best_params = param_list[best_idx]
 
     best_en_model = TransformedTargetRegressor(
@@ -191,13 +286,15 @@ def main():
         X_val, y_val,
         w_train, w_val,
         track_mlflow=True,
+        train_data_path=TRAIN_MODEL_READY_DATA_PATH,
+        val_data_path=VAL_MODEL_READY_DATA_PATH,
         model_name="Elastic Net (Tuned)"
     )
     print(f"  Best Tuned Elastic Net  →  MdAE: {best_en_result['val_mdae']:.2f} | MAE: {best_en_result['val_mae']:.2f} | "
           f"R²: {best_en_result['val_r2']:.4f} | Training Time: {best_en_result['training_time']:.2f}s")
 
-    # --- 6. Model Persistence ---
-    print("Step 6: Persisting hyperparameter tuning results...")
+    # --- 5. Model Persistence ---
+    print("Step 5: Persisting hyperparameter tuning results...")
 
     # Save best fitted model as .joblib file
     save_model(best_en_result["fitted_model"], "models/en_tuned_model.joblib", verbose=False)
@@ -226,9 +323,9 @@ def main():
     save_metrics(get_core_model_params(best_en_result["fitted_model"]), "models/en_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/en_tuned_params.json'")
     
-    # Save predictions of best model as .joblib file
-    save_model(best_en_result["y_val_pred"], "models/en_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/en_tuned_predictions.joblib'")
+    # Save predictions of best model as .npy file
+    save_model(best_en_result["y_val_pred"], "models/en_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/en_tuned_predictions.npy'")
 
     print("\n✅ Elastic Net hyperparameter tuning complete.")
 
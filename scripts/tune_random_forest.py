@@ -4,27 +4,35 @@ Reproducible hyperparameter tuning script for Random Forest Regressor.
 This script performs a randomized search over a defined hyperparameter space 
 with MLflow experiment tracking. It uses log-transformed targets 
 (TransformedTargetRegressor) and evaluates each configuration on the training 
-and validation set using weighted MdAE, MAE, and R². It then retrains the best 
-model and persists the fitted model, evaluation metrics, hyperparameters, 
-predictions, and the full randomized search history.
+and validation set using weighted MdAE, MAE, and R². 
+It then retrains the best model and persists the fitted model, evaluation 
+metrics, hyperparameters, predictions, and the full randomized search history.
 
 Workflow:
   1.  MLflow Setup: Initialize experiment tracking for "Random Forest Tuning".
-  2.  Preprocessed Data Loading: Load Parquet datasets into memory.
-  3.  Feature-Target Separation: Separate features, target variable, and sample weights.
-  4.  Hyperparameter Search: Evaluate N_ITER random configurations using 
-      ParameterSampler. Track each trial as an MLflow child run with 
-      training/validation metrics and training time.
-  5.  Best Model: Retrain the best configuration with full MLflow logging.
-  6.  Model Persistence: Save the best tuned model as a Joblib file, evaluation metrics 
-      as JSON, parameters as JSON, predictions as Joblib, and full random search history 
+  2.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  3.  Hyperparameter Search: Evaluate N_ITER configurations proposed by the 
+      sampler set in src/params.py (randomized search with ParameterSampler or 
+      TPE model-based search, see src/tuning.py). Training metrics follow 
+      TRAIN_METRICS_STRATEGY in src/params.py. Opt-in modes: USE_WARM_START 
+      (randomized search only) samples base configurations (all parameters 
+      except n_estimators) and evaluates each at every candidate tree count by 
+      growing one forest with warm_start, and OVERFITTING_SIGNAL = "oob" replaces 
+      training-set predictions with weighted out-of-bag predictions. Track each 
+      trial as an MLflow child run with training/validation (or out-of-bag) 
+      metrics, training time, and trees built, and report the measured tree reuse 
+      savings in warm-start mode.
+  4.  Best Model: Retrain the best configuration with full MLflow logging.
+  5.  Model Persistence: Save the best tuned model as a Joblib file, evaluation metrics 
+      as JSON, parameters as JSON, predictions as .npy, and full random search history 
       as JSON.
 
 Artifacts:
-  - models/rf_tuned_model.joblib: Best fitted model.
+  - models/rf_tuned_model.joblib: Best fitted model as a compact inference-only forest (CompactForestRegressor).
   - models/rf_tuned_metrics.json: Evaluation metrics for the best tuned model.
   - models/rf_tuned_params.json: Hyperparameters of the best tuned model.
-  - models/rf_tuned_predictions.joblib: Validation set predictions of the best tuned model.
+  - models/rf_tuned_predictions.npy: Validation set predictions of the best tuned model.
   - models/rf_tuning_history.json: Metrics and params for entire random search history.
 
 Reference:
@@ -40,103 +48,226 @@ import time
 import warnings
 
 # Third-party imports
-import pandas as pd
 import numpy as np
 import mlflow
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.compose import TransformedTargetRegressor
-from sklearn.model_selection import ParameterSampler
 from sklearn.metrics import mean_absolute_error, r2_score
 
 # Local imports
-from src.constants import TARGET_COLUMN, WEIGHT_COLUMN, RANDOM_STATE
-from src.modeling import train_and_evaluate, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_model, save_metrics, get_core_model_params
-from src.params import RF_PARAM_DISTRIBUTIONS, RF_N_ITER
+from src.constants import RANDOM_STATE
+from src.modeling import train_and_evaluate, AsyncMlflowLogger, resolve_tracking_uri, log_dataset_input, get_train_metrics_indices, load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, CompactForestRegressor, save_model, save_metrics, get_core_model_params
+from src.params import RF_PARAM_DISTRIBUTIONS, RF_N_ITER, SEARCH_SAMPLER, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE
+from src.tuning import get_param_sampler
 
 # Suppress benign MLflow warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
 
 
+# Opt-in tuning mode: Random search configurations share one forest per sampled base configuration 
+# (warm_start through all tree counts). Samples a different set of configurations than the default 
+# search, so its tuning histories are not comparable with independent random search runs.
+USE_WARM_START = False
+# Overfitting signal: "train" (training-set predictions on the rows selected by TRAIN_METRICS_STRATEGY 
+# in src/params.py) or opt-in "oob" (weighted out-of-bag predictions, logged as oob_* metrics)
+OVERFITTING_SIGNAL = "train"
+
+
+def evaluate_forest(forest, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """
+    Evaluate a fitted log-target forest on the validation set and compute the overfitting signal.
+
+    With OVERFITTING_SIGNAL = "oob", training metrics use the weighted out-of-bag predictions 
+    that the forest computed during fitting (each row is predicted only by trees that did not 
+    see it), which avoids predicting the full training set. Metrics are then reported as 
+    oob_mdae, oob_mae, and oob_r2 instead of train_mdae, train_mae, and train_r2. With 
+    OVERFITTING_SIGNAL = "train", training metrics are calculated on train_metrics_indices 
+    (None for all rows) or skipped if TRAIN_METRICS_STRATEGY is "off".
+    """
+    # Predictions in raw dollars (forest is trained on log1p costs)
+    y_val_pred = np.expm1(forest.predict(X_val))
+
+    # Evaluate with raw survey weights
+    metrics = {
+        "val_mdae": weighted_median_absolute_error(y_val, y_val_pred, sample_weight=w_val),
+        "val_mae": mean_absolute_error(y_val, y_val_pred, sample_weight=w_val),
+        "val_r2": r2_score(y_val, y_val_pred, sample_weight=w_val),
+    }
+    if OVERFITTING_SIGNAL == "oob":
+        prefix, y_train_pred = "oob", np.expm1(forest.oob_prediction_)
+    elif TRAIN_METRICS_STRATEGY != "off":
+        if train_metrics_indices is not None:
+            X_train, y_train, w_train = X_train.iloc[train_metrics_indices], y_train.iloc[train_metrics_indices], w_train.iloc[train_metrics_indices]
+        prefix, y_train_pred = "train", np.expm1(forest.predict(X_train))
+    else:
+        return metrics
+
+    metrics.update({
+        f"{prefix}_mdae": weighted_median_absolute_error(y_train, y_train_pred, sample_weight=w_train),
+        f"{prefix}_mae": mean_absolute_error(y_train, y_train_pred, sample_weight=w_train),
+        f"{prefix}_r2": r2_score(y_train, y_train_pred, sample_weight=w_train),
+    })
+    return metrics
+
+
+def fit_and_evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """Fit one Random Forest configuration from scratch and evaluate it."""
+    # Forest trained on log1p costs (same model as RandomForest wrapped in TransformedTargetRegressor(log1p))
+    forest = RandomForestRegressor(
+        criterion="absolute_error",
+        oob_score=OVERFITTING_SIGNAL == "oob",
+        n_jobs=-1,
+        random_state=RANDOM_STATE,
+        **params
+    )
+
+    # Train with normalized sample weights (mean=1.0) for numerical stability
+    iter_start = time.time()
+    forest.fit(X_train, np.log1p(y_train), sample_weight=w_train / w_train.mean())
+    training_time = time.time() - iter_start
+
+    return {
+        **evaluate_forest(forest, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices),
+        "training_time": training_time,
+        "trees_built": params["n_estimators"]
+    }
+
+
+def sample_warm_start_trials(param_distributions, n_iter, random_state=RANDOM_STATE):
+    """
+    Sample a randomized search as groups of configurations that differ only in n_estimators.
+
+    Base configurations (all parameters except n_estimators) are sampled from the search space, 
+    and each base configuration is evaluated at every candidate tree count in ascending order 
+    until n_iter configurations are reached. One forest per group is then grown with warm_start 
+    through its tree counts, so every tree is built only once. Sampling continuous parameters 
+    (e.g., max_samples) independently per configuration would leave no two configurations to 
+    share a forest.
+
+    Returns:
+        list[tuple]: (base_params without n_estimators, ascending tree counts to evaluate) per group,
+            with n_iter tree counts in total.
+    """
+    tree_counts = sorted(param_distributions["n_estimators"])
+    base_distributions = {name: values for name, values in param_distributions.items() if name != "n_estimators"}
+    n_groups = -(-n_iter // len(tree_counts))
+    base_param_list = get_param_sampler(base_distributions, n_iter=n_groups, sampler="random", random_state=random_state).param_list
+    return [
+        (base_params, tree_counts[:n_iter - i * len(tree_counts)])
+        for i, base_params in enumerate(base_param_list)
+    ]
+
+
+def evaluate_with_warm_start(warm_start_groups, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """
+    Evaluate grouped configurations by growing one forest per group with warm_start.
+
+    Growing a forest from 200 to 300 trees with warm_start adds 100 trees and yields the same 
+    forest as fitting 300 trees from scratch with the same random_state, so every tree count 
+    is evaluated while each tree is built only once.
+
+    Yields:
+        tuple: (params, trial_result) per evaluated tree count, where trial_result["training_time"] 
+            and trial_result["trees_built"] cover only the trees added for that tree count, and 
+            trial_result["cumulative_training_time"] is the measured time to grow the forest up to 
+            that tree count (the fit time of the identical forest without tree reuse).
+    """
+    y_train_log = np.log1p(y_train)
+    w_train_norm = w_train / w_train.mean()
+    for base_params, tree_counts in warm_start_groups:
+        forest = RandomForestRegressor(
+            criterion="absolute_error",
+            warm_start=True,
+            oob_score=OVERFITTING_SIGNAL == "oob",
+            n_jobs=-1,
+            random_state=RANDOM_STATE,
+            **base_params
+        )
+        n_trees = 0
+        cumulative_training_time = 0.0
+        for n_estimators in tree_counts:
+            # Add trees to the existing forest
+            forest.set_params(n_estimators=n_estimators)
+            iter_start = time.time()
+            forest.fit(X_train, y_train_log, sample_weight=w_train_norm)
+            training_time = time.time() - iter_start
+            cumulative_training_time += training_time
+
+            trial_result = {
+                **evaluate_forest(forest, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices),
+                "training_time": training_time,
+                "cumulative_training_time": cumulative_training_time,
+                "trees_built": n_estimators - n_trees
+            }
+            n_trees = n_estimators
+            yield {**base_params, "n_estimators": n_estimators}, trial_result
+
+
 def main():
     # --- 1. MLflow Setup ---
     print("Step 1: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")
-    mlflow.set_experiment("Random Forest Tuning")
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # Local fallback store if the MLflow UI server is not running
+    experiment = mlflow.set_experiment("Random Forest Tuning")
     print(f"  Set up 'Random Forest Tuning' experiment in MLflow with tracking URI '{mlflow.get_tracking_uri()}'")
 
     # --- 2. Preprocessed Data Loading ---
-    print("Step 2: Loading preprocessed data...")
-    df_train = pd.read_parquet(TRAIN_MODEL_READY_DATA_PATH)
-    df_val = pd.read_parquet(VAL_MODEL_READY_DATA_PATH)
-    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(df_train):,} rows and {len(df_train.columns):,} columns")
-    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(df_val):,} rows and {len(df_val.columns):,} columns")
-
-    # --- 3. Feature-Target Separation ---
-    print("Step 3: Separating features and target...")
-    X_train = df_train.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_train = df_train[TARGET_COLUMN]
-    w_train = df_train[WEIGHT_COLUMN]
-    X_val = df_val.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_val = df_val[TARGET_COLUMN]
-    w_val = df_val[WEIGHT_COLUMN]
-    del df_train, df_val  # Free up memory
-    print("  Separated data into X features, y target variable, and w sample weights")
-
-    # --- 4. Randomized Search ---
-    print(f"Step 4: Running randomized search ({RF_N_ITER} iterations)...")
-    # Normalize training weights (mean=1.0) for numerical stability during model fitting
-    w_train_norm = w_train / w_train.mean()
-    param_list = list(ParameterSampler(RF_PARAM_DISTRIBUTIONS, n_iter=RF_N_ITER, random_state=RANDOM_STATE))
+    print("Step 2: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+
+    # --- 3. Randomized Search ---
+    print(f"Step 3: Running {SEARCH_SAMPLER} search ({RF_N_ITER} iterations)...")
+    # Sampler proposes each trial's hyperparameters (TPE adapts proposals to the validation MdAE of finished trials)
+    sampler = get_param_sampler(RF_PARAM_DISTRIBUTIONS, n_iter=RF_N_ITER, sampler=SEARCH_SAMPLER, random_state=RANDOM_STATE)
+    param_list = []
+    # Fixed training rows for the per-trial overfitting diagnostic (same rows in every trial)
+    train_metrics_indices = get_train_metrics_indices(y_train, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE)
+    # Training-set metric strategy recorded in the tuning history ("oob" when out-of-bag predictions replace it)
+    train_metrics_strategy = "oob" if OVERFITTING_SIGNAL == "oob" else TRAIN_METRICS_STRATEGY
+    # Warm-start mode requires all trials upfront (random search); TPE trials are fitted one by one
+    use_warm_start = USE_WARM_START and SEARCH_SAMPLER == "random"
+    if use_warm_start:
+        warm_start_groups = sample_warm_start_trials(RF_PARAM_DISTRIBUTIONS, RF_N_ITER)
+        print(f"  Warm-start mode: {RF_N_ITER} configurations → {len(warm_start_groups)} forests grown through tree counts {sorted(RF_PARAM_DISTRIBUTIONS['n_estimators'])}")
+
+    def run_trials():
+        """Yield (params, trial_result) for each evaluated configuration."""
+        if use_warm_start:
+            yield from evaluate_with_warm_start(warm_start_groups, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+            return
+        for _ in range(RF_N_ITER):
+            trial_id, params = sampler.ask()
+            trial_result = fit_and_evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+            sampler.tell(trial_id, trial_result["val_mdae"])
+            yield params, trial_result
 
     tuning_history = []
     best_mdae = np.inf
     search_start = time.time()
 
     # Start MLflow parent run (to group all iterations as child runs for better organization in UI)
-    with mlflow.start_run(run_name="Random Forest Randomized Search"):
+    # Trials are logged as child runs on a background thread (search wall time excludes tracking latency)
+    with mlflow.start_run(run_name="Random Forest Randomized Search") as parent_run, \
+            AsyncMlflowLogger(mlflow.get_tracking_uri(), experiment.experiment_id) as tracker:
         mlflow.set_tag("stage", "tuning")
+        log_dataset_input(TRAIN_MODEL_READY_DATA_PATH, name="training_data", context="training")
+        log_dataset_input(VAL_MODEL_READY_DATA_PATH, name="validation_data", context="validation")
         mlflow.log_param("n_iterations", RF_N_ITER)
+        mlflow.log_param("sampler", SEARCH_SAMPLER)
+        mlflow.log_param("warm_start", use_warm_start)
+        mlflow.log_param("train_metrics", train_metrics_strategy)
 
-        for i, params in enumerate(param_list):
-            # Build model: RandomForest wrapped in TransformedTargetRegressor(log1p)
-            model = TransformedTargetRegressor(
-                regressor=RandomForestRegressor(
-                    criterion="absolute_error",
-                    n_jobs=-1,
-                    random_state=RANDOM_STATE,
-                    **params
-                ),
-                func=np.log1p,
-                inverse_func=np.expm1
-            )
-
-            # Train with normalized sample weights
-            iter_start = time.time()
-            model.fit(X_train, y_train, sample_weight=w_train_norm)
-            training_time = time.time() - iter_start
-
-            # Predict on training and validation set (predictions in raw dollars)
-            y_train_pred = model.predict(X_train)
-            y_val_pred = model.predict(X_val)
-
-            # Evaluate with raw survey weights
-            train_mdae = weighted_median_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_mae = mean_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_r2 = r2_score(y_train, y_train_pred, sample_weight=w_train)
-
-            val_mdae = weighted_median_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_mae = mean_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_r2 = r2_score(y_val, y_val_pred, sample_weight=w_val)
+        for i, (params, trial_result) in enumerate(run_trials()):
+            param_list.append(params)
+            val_mdae = trial_result["val_mdae"]
 
             tuning_history.append({
                 "params": params,
-                "train_mdae": train_mdae,
-                "train_mae": train_mae,
-                "train_r2": train_r2,
-                "val_mdae": val_mdae,
-                "val_mae": val_mae,
-                "val_r2": val_r2,
-                "training_time": training_time
+                "sampler": SEARCH_SAMPLER,
+                "train_metrics": train_metrics_strategy,
+                **trial_result
             })
 
             # Track best configuration
@@ -145,28 +276,30 @@ def main():
                 best_idx = i
 
             # Log each iteration to MLflow as a child run
-            with mlflow.start_run(run_name=f"Trial {i+1:03d}", nested=True):
-                mlflow.log_params(params)
-                mlflow.log_metrics({
-                    "val_mdae": val_mdae,
-                    "val_mae": val_mae,
-                    "val_r2": val_r2,
-                    "train_mdae": train_mdae,
-                    "train_mae": train_mae,
-                    "train_r2": train_r2,
-                    "training_time": training_time
-                })
+            tracker.log_run(f"Trial {i+1:03d}", params=params, metrics=trial_result, parent_run_id=parent_run.info.run_id)
 
             # Progress logging 
-            print(f"  [{i+1:3d}/{RF_N_ITER}] MdAE: {val_mdae:8.2f} | trees={params['n_estimators']}, depth={params['max_depth']}, leaf={params['min_samples_leaf']}, feats={params['max_features']}, samples={params['max_samples']:.2f}, split={params['min_samples_split']} | fit: {training_time:5.1f} s")
-
+            print(f"  [{i+1:3d}/{RF_N_ITER}] MdAE: {val_mdae:8.2f} | trees={params['n_estimators']}, depth={params['max_depth']}, leaf={params['min_samples_leaf']}, feats={params['max_features']}, samples={params['max_samples']:.2f}, split={params['min_samples_split']} | fit: {trial_result['training_time']:5.1f} s")
+
+        trees_built = sum(trial["trees_built"] for trial in tuning_history)
+        fit_time = sum(trial["training_time"] for trial in tuning_history)
+        mlflow.log_metrics({"trees_built": trees_built, "fit_time": fit_time})
+        if use_warm_start:
+            # Tree reuse savings: Measured wall time of growing each forest to a tree count equals the fit 
+            # time of that configuration without tree reuse (warm_start yields the identical forest)
+            trees_independent = sum(trial["params"]["n_estimators"] for trial in tuning_history)
+            fit_time_independent = sum(trial["cumulative_training_time"] for trial in tuning_history)
+            mlflow.log_metrics({"trees_independent": trees_independent, "fit_time_independent": fit_time_independent})
         mlflow.log_metric("random_search_time", time.time() - search_start)
 
+    if use_warm_start:
+        print(f"  Trees built: {trees_built:,} (vs. {trees_independent:,} without tree reuse, {1 - trees_built / trees_independent:.0%} saved)")
+        print(f"  Fit time: {fit_time:.0f} s (vs. {fit_time_independent:.0f} s measured for the same forests without tree reuse, {1 - fit_time / fit_time_independent:.0%} saved)")
     total_search_time = time.time() - search_start
     print(f"  Random search completed in {total_search_time:.0f} s")
 
-    # --- 5. Best Model: Retrain with MLflow Logging ---
-    print("Step 5: Retraining best model...")
+    # --- 4. Best Model: Retrain with MLflow Logging ---
+    print("Step 4: Retraining best model...")
     best_params = param_list[best_idx]
 
     best_rf_model = TransformedTargetRegressor(
@@ -186,16 +319,18 @@ def main():
         X_val, y_val,
         w_train, w_val,
         track_mlflow=True,
+        train_data_path=TRAIN_MODEL_READY_DATA_PATH,
+        val_data_path=VAL_MODEL_READY_DATA_PATH,
         model_name="Random Forest (Tuned)"
     )
     print(f"  Best Tuned Random Forest  →  MdAE: {best_rf_result['val_mdae']:.2f} | MAE: {best_rf_result['val_mae']:.2f} | "
           f"R²: {best_rf_result['val_r2']:.4f} | Training Time: {best_rf_result['training_time']:.2f}s")
 
-    # --- 6. Model Persistence ---
-    print("Step 6: Persisting hyperparameter tuning results...")
+    # --- 5. Model Persistence ---
+    print("Step 5: Persisting hyperparameter tuning results...")
 
     # Save best fitted model as .joblib file
-    save_model(best_rf_result["fitted_model"], "models/rf_tuned_model.joblib", verbose=False)
+    save_model(CompactForestRegressor.from_model(best_rf_result["fitted_model"]), "models/rf_tuned_model.joblib", verbose=False)
     print("  Saved best model to 'models/rf_tuned_model.joblib'")
 
     # Save evaluation metrics of best model as JSON
@@ -221,9 +356,9 @@ def main():
     save_metrics(get_core_model_params(best_rf_result["fitted_model"]), "models/rf_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/rf_tuned_params.json'")
     
-    # Save predictions of best model as .joblib file
-    save_model(best_rf_result["y_val_pred"], "models/rf_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/rf_tuned_predictions.joblib'")
+    # Save predictions of best model as .npy file
+    save_model(best_rf_result["y_val_pred"], "models/rf_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/rf_tuned_predictions.npy'")
 
     print("\n✅ Random Forest hyperparameter tuning complete.")
 
@@ -3,28 +3,37 @@ Reproducible hyperparameter tuning script for XGBoost Regressor.
 
 This script performs a randomized search over a defined hyperparameter space 
 with MLflow experiment tracking. It uses log-transformed targets 
-(TransformedTargetRegressor) and evaluates each configuration on the training 
-and validation set using weighted MdAE, MAE, and R². It then retrains the best 
-model and persists the fitted model, evaluation metrics, hyperparameters, 
-predictions, and the full randomized search history.
+(TransformedTargetRegressor) and evaluates each configuration on the validation 
+set (and on the training rows selected by TRAIN_METRICS_STRATEGY) using weighted 
+MdAE, MAE, and R². It then retrains the best model and persists the fitted model, 
+evaluation metrics, hyperparameters, predictions, and the full randomized search 
+history.
 
 Workflow:
   1.  MLflow Setup: Initialize experiment tracking for "XGBoost Tuning".
-  2.  Preprocessed Data Loading: Load Parquet datasets into memory.
-  3.  Feature-Target Separation: Separate features, target variable, and sample weights.
-  4.  Hyperparameter Search: Evaluate N_ITER random configurations using 
-      ParameterSampler. Track each trial as an MLflow child run with 
-      training/validation metrics and training time.
-  5.  Best Model: Retrain the best configuration with full MLflow logging.
-  6.  Model Persistence: Save the best tuned model as a Joblib file, evaluation metrics 
-      as JSON, parameters as JSON, predictions as Joblib, and full random search history 
-      as JSON.
+  2.  Preprocessed Data Loading: Load features, target variable, and sample weights from the Parquet
+      datasets (load_split in src/modeling.py memory-maps the cached feature matrix, see FEATURE_CACHE_DIR).
+  3.  Hyperparameter Search: Evaluate N_ITER configurations proposed by the 
+      sampler set in src/params.py (randomized search with ParameterSampler or 
+      TPE model-based search, see src/tuning.py). Training metrics use the 
+      full training split, a fixed stratified subsample, or are skipped 
+      (TRAIN_METRICS_STRATEGY in src/params.py). With TUNING_CV_FOLDS set, 
+      trials are instead scored by survey-weighted stratified K-fold 
+      cross-validation on the training split, with folds fitted in parallel 
+      processes. With --queue-dir, the trials are enqueued in a shared 
+      directory and run by worker processes on any host that mounts it 
+      (src/tuning.py FileTrialQueue). Track each trial as an MLflow child 
+      run with training/validation metrics and training time.
+  4.  Best Model: Retrain the best configuration with full MLflow logging.
+  5.  Model Persistence: Save the best tuned model in the native XGBoost format (.ubj) 
+      with a JSON sidecar for the wrapper metadata, evaluation metrics as JSON, parameters 
+      as JSON, predictions as .npy, and full random search history as JSON.
 
 Artifacts:
-  - models/xgb_tuned_model.joblib: Best fitted model.
+  - models/xgb_tuned_model.ubj: Best fitted model (native XGBoost format, wrapper metadata in models/xgb_tuned_model.json).
   - models/xgb_tuned_metrics.json: Evaluation metrics for the best tuned model.
   - models/xgb_tuned_params.json: Hyperparameters of the best tuned model.
-  - models/xgb_tuned_predictions.joblib: Validation set predictions of the best tuned model.
+  - models/xgb_tuned_predictions.npy: Validation set predictions of the best tuned model.
   - models/xgb_tuning_history.json: Metrics and params for entire random search history.
 
 Reference:
@@ -34,113 +43,234 @@ Reference:
 Usage:
     1. Start the MLflow UI server (in a separate terminal): ./run_mlflow_ui.sh
     2. Run: ./.venv-train/Scripts/python scripts/tune_xgboost.py
+
+    Multi-node search (shared filesystem, e.g., NFS mounted at /mnt/shared on all hosts):
+    1. Coordinator: ./.venv-train/Scripts/python scripts/tune_xgboost.py --queue-dir /mnt/shared/xgb_queue
+    2. Workers (any number, on any host): ./.venv-train/Scripts/python scripts/tune_xgboost.py --worker --queue-dir /mnt/shared/xgb_queue
+    The coordinator logs all trials to MLflow, then retrains and persists the best model as in steps 4-5.
 """
 
 # Standard library imports
+import argparse
 import time
 import warnings
+from pathlib import Path
 
 # Third-party imports
-import pandas as pd
 import numpy as np
 import mlflow
 from xgboost import XGBRegressor
 from sklearn.compose import TransformedTargetRegressor
-from sklearn.model_selection import ParameterSampler
-from sklearn.metrics import mean_absolute_error, r2_score
 
 # Local imports
-from src.constants import TARGET_COLUMN, WEIGHT_COLUMN, RANDOM_STATE
-from src.modeling import train_and_evaluate, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, weighted_median_absolute_error, save_model, save_metrics, get_core_model_params
-from src.params import XGB_PARAM_DISTRIBUTIONS, XGB_N_ITER
+from src.constants import RANDOM_STATE
+from src.modeling import train_and_evaluate, AsyncMlflowLogger, resolve_tracking_uri, log_dataset_input, cross_validate_weighted, get_train_metrics_indices, load_split, FEATURE_CACHE_DIR, TRAIN_MODEL_READY_DATA_PATH, VAL_MODEL_READY_DATA_PATH, save_model, save_metrics, get_core_model_params
+from src.params import XGB_PARAM_DISTRIBUTIONS, XGB_N_ITER, SEARCH_SAMPLER, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE, TUNING_CV_FOLDS
+from src.tuning import FileTrialQueue, get_param_sampler, run_queue_worker
 
 # Suppress benign MLflow warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="mlflow")
 
 
+def parse_args():
+    """Parse the optional shared-filesystem queue settings for multi-node search."""
+    parser = argparse.ArgumentParser(description="Tune XGBoost hyperparameters (optionally across several hosts).")
+    parser.add_argument(
+        "--queue-dir",
+        type=Path,
+        default=None,
+        help="Shared directory (e.g., on an NFS mount) for a multi-node search. Without --worker, run as coordinator.",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Run as worker: claim and run trials from --queue-dir until the coordinator closes the queue.",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=None,
+        help="Maximum enqueued but unfinished trials (default: all trials for random search, 8 for TPE).",
+    )
+    parser.add_argument(
+        "--stale-timeout",
+        type=float,
+        default=3600.0,
+        help="Seconds after which a claimed but unfinished trial is requeued (e.g., after a worker crash).",
+    )
+    args = parser.parse_args()
+    if args.worker and args.queue_dir is None:
+        parser.error("--worker requires --queue-dir")
+    return args
+
+
+def load_data():
+    """Load the preprocessed training and validation data and separate features, target, and weights."""
+    # --- 2. Preprocessed Data Loading ---
+    print("Step 2: Loading preprocessed features, target, and sample weights...")
+    X_train, y_train, w_train = load_split(TRAIN_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    X_val, y_val, w_val = load_split(VAL_MODEL_READY_DATA_PATH, cache_dir=FEATURE_CACHE_DIR)
+    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(X_train):,} rows and {X_train.shape[1]:,} features")
+    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(X_val):,} rows and {X_val.shape[1]:,} features")
+    return X_train, y_train, w_train, X_val, y_val, w_val
+
+
+def build_model(params):
+    """Build XGBoost wrapped in Target Log-Transformer."""
+    return TransformedTargetRegressor(
+        regressor=XGBRegressor(
+            objective="reg:absoluteerror",
+            tree_method="hist",
+            n_jobs=-1,
+            random_state=RANDOM_STATE,
+            **params
+        ),
+        func=np.log1p,
+        inverse_func=np.expm1
+    )
+
+
+def evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices=None):
+    """
+    Train and evaluate one configuration.
+
+    Returns:
+        dict: Validation metrics (CV means with TUNING_CV_FOLDS), training metrics (depending on 
+            TRAIN_METRICS_STRATEGY), training time, and per-fold metrics under "folds" with TUNING_CV_FOLDS.
+    """
+    model = build_model(params)
+    if TUNING_CV_FOLDS:
+        # Mean validation metrics across K training folds (folds run in parallel processes)
+        cv_result = cross_validate_weighted(model, X_train, y_train, w_train, n_splits=TUNING_CV_FOLDS)
+        return {name: value for name, value in cv_result.items() if name != "y_oof_pred"}
+
+    # Train with normalized sample weights and evaluate with raw survey weights
+    result = train_and_evaluate(
+        model,
+        X_train, y_train,
+        X_val, y_val,
+        w_train, w_val,
+        calculate_train_metrics=TRAIN_METRICS_STRATEGY != "off",
+        train_metrics_indices=train_metrics_indices
+    )
+    return {name: value for name, value in result.items() if name not in ("fitted_model", "y_val_pred")}
+
+
+def run_queued_trials(sampler, queue, queue_depth, stale_timeout, poll_interval=2.0):
+    """
+    Coordinate a multi-node search: enqueue trials and collect the results written by the workers.
+
+    Keeps at most queue_depth trials enqueued but unfinished, so an adaptive sampler (TPE) proposes 
+    new trials from the results that are already available. Trials claimed longer than stale_timeout 
+    seconds ago without a result are requeued.
+
+    Yields:
+        tuple: (params, trial_metrics or None, error message or None) in completion order.
+    """
+    n_asked, finished = 0, set()
+    while len(finished) < XGB_N_ITER:
+        while n_asked < XGB_N_ITER and n_asked - len(finished) < queue_depth:
+            trial_id, params = sampler.ask()
+            queue.put(trial_id, params)
+            n_asked += 1
+        if n_asked == XGB_N_ITER and not queue.closed:
+            queue.close()  # Idle workers exit once the remaining trials are claimed
+
+        new_results = queue.results(exclude=finished)
+        for result in new_results:
+            finished.add(result["trial_id"])
+            metrics = result["metrics"]
+            sampler.tell(result["trial_id"], metrics["val_mdae"] if metrics else np.inf)
+            yield result["params"], metrics, result["error"]
+        if not new_results:
+            for trial_id in queue.requeue_stale(stale_timeout):
+                print(f"  ⚠️ Requeued trial {trial_id + 1} (no result after {stale_timeout:.0f} s)")
+            time.sleep(poll_interval)
+
+
 def main():
+    args = parse_args()
+
+    if args.worker:
+        # Worker mode: run trials from the shared queue, the coordinator logs and selects the results
+        print(f"Step 1: Starting worker for queue '{args.queue_dir}'...")
+        X_train, y_train, w_train, X_val, y_val, w_val = load_data()
+        train_metrics_indices = get_train_metrics_indices(y_train, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE)
+        print("Step 3: Running queued trials...")
+        n_trials = run_queue_worker(
+            FileTrialQueue(args.queue_dir),
+            lambda params: evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+        )
+        print(f"\n✅ Worker finished {n_trials} trials.")
+        return
+
     # --- 1. MLflow Setup ---
     print("Step 1: Setting up MLflow...")
-    mlflow.set_tracking_uri("http://127.0.0.1:5000")
-    mlflow.set_experiment("XGBoost Tuning")
+    mlflow.set_tracking_uri(resolve_tracking_uri())  # Local fallback store if the MLflow UI server is not running
+    experiment = mlflow.set_experiment("XGBoost Tuning")
     print(f"  Set up 'XGBoost Tuning' experiment in MLflow with tracking URI '{mlflow.get_tracking_uri()}'")
 
     # --- 2. Preprocessed Data Loading ---
-    print("Step 2: Loading preprocessed data...")
-    df_train = pd.read_parquet(TRAIN_MODEL_READY_DATA_PATH)
-    df_val = pd.read_parquet(VAL_MODEL_READY_DATA_PATH)
-    print(f"  Loaded '{TRAIN_MODEL_READY_DATA_PATH}' with {len(df_train):,} rows and {len(df_train.columns):,} columns")
-    print(f"  Loaded '{VAL_MODEL_READY_DATA_PATH}' with {len(df_val):,} rows and {len(df_val.columns):,} columns")
-
-    # --- 3. Feature-Target Separation ---
-    print("Step 3: Separating features and target...")
-    X_train = df_train.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_train = df_train[TARGET_COLUMN]
-    w_train = df_train[WEIGHT_COLUMN]
-    X_val = df_val.drop([TARGET_COLUMN, WEIGHT_COLUMN], axis=1)
-    y_val = df_val[TARGET_COLUMN]
-    w_val = df_val[WEIGHT_COLUMN]
-    del df_train, df_val  # Free up memory
-    print("  Separated data into X features, y target variable, and w sample weights")
-
-    # --- 4. Randomized Search ---
-    print(f"Step 4: Running randomized search ({XGB_N_ITER} iterations)...")
-    # Normalize training weights (mean=1.0) for numerical stability during model fitting
-    w_train_norm = w_train / w_train.mean()
-    param_list = list(ParameterSampler(XGB_PARAM_DISTRIBUTIONS, n_iter=XGB_N_ITER, random_state=RANDOM_STATE))
+    X_train, y_train, w_train, X_val, y_val, w_val = load_data()
+
+    # --- 3. Randomized Search ---
+    print(f"Step 3: Running {SEARCH_SAMPLER} search ({XGB_N_ITER} iterations)...")
+    # Fixed training rows for the per-trial overfitting diagnostic (same rows in every trial)
+    train_metrics_indices = get_train_metrics_indices(y_train, TRAIN_METRICS_STRATEGY, TRAIN_METRICS_SUBSAMPLE_SIZE)
+    # Sampler proposes each trial's hyperparameters (TPE adapts proposals to the validation MdAE of finished trials)
+    sampler = get_param_sampler(XGB_PARAM_DISTRIBUTIONS, n_iter=XGB_N_ITER, sampler=SEARCH_SAMPLER, random_state=RANDOM_STATE)
+    param_list = []
+
+    def run_trials():
+        """Yield (params, trial_metrics, error) for each finished trial (locally or from the shared queue)."""
+        if args.queue_dir is not None:
+            queue = FileTrialQueue(args.queue_dir)
+            if any(queue.counts().values()) or queue.closed:
+                raise RuntimeError(f"Queue directory '{args.queue_dir}' is not empty. Use a new directory for each search.")
+            queue_depth = args.queue_depth or (XGB_N_ITER if SEARCH_SAMPLER == "random" else 8)
+            print(f"  Enqueuing trials in '{args.queue_dir}' (start workers with --worker --queue-dir)")
+            yield from run_queued_trials(sampler, queue, queue_depth, args.stale_timeout)
+            return
+        for _ in range(XGB_N_ITER):
+            trial_id, params = sampler.ask()
+            trial_metrics = evaluate_trial(params, X_train, y_train, w_train, X_val, y_val, w_val, train_metrics_indices)
+            sampler.tell(trial_id, trial_metrics["val_mdae"])
+            yield params, trial_metrics, None
 
     tuning_history = []
     best_mdae = np.inf
     best_idx = -1
     search_start = time.time()
 
-    # Start MLflow parent run
-    with mlflow.start_run(run_name="XGBoost Randomized Search"):
+    # Start MLflow parent run (trials are logged as child runs on a background thread, so search wall time excludes tracking latency)
+    with mlflow.start_run(run_name="XGBoost Randomized Search") as parent_run, \
+            AsyncMlflowLogger(mlflow.get_tracking_uri(), experiment.experiment_id) as tracker:
         mlflow.set_tag("stage", "tuning")
+        log_dataset_input(TRAIN_MODEL_READY_DATA_PATH, name="training_data", context="training")
+        log_dataset_input(VAL_MODEL_READY_DATA_PATH, name="validation_data", context="validation")
         mlflow.log_param("n_iterations", XGB_N_ITER)
-
-        for i, params in enumerate(param_list):
-            # Build model: XGBoost wrapped in Target Log-Transformer
-            model = TransformedTargetRegressor(
-                regressor=XGBRegressor(
-                    objective="reg:absoluteerror",
-                    tree_method="hist",
-                    n_jobs=-1,
-                    random_state=RANDOM_STATE,
-                    **params
-                ),
-                func=np.log1p,
-                inverse_func=np.expm1
-            )
-
-            # Train with normalized sample weights
-            iter_start = time.time()
-            model.fit(X_train, y_train, sample_weight=w_train_norm)
-            training_time = time.time() - iter_start
-
-            # Predict on training and validation set
-            y_train_pred = model.predict(X_train)
-            y_val_pred = model.predict(X_val)
-
-            # Evaluate with raw survey weights
-            train_mdae = weighted_median_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_mae = mean_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_r2 = r2_score(y_train, y_train_pred, sample_weight=w_train)
-
-            val_mdae = weighted_median_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_mae = mean_absolute_error(y_val, y_val_pred, sample_weight=w_val)
-            val_r2 = r2_score(y_val, y_val_pred, sample_weight=w_val)
-
-            tuning_history.append({
+        mlflow.log_param("sampler", SEARCH_SAMPLER)
+        mlflow.log_param("train_metrics", TRAIN_METRICS_STRATEGY)
+        mlflow.log_param("cv_folds", TUNING_CV_FOLDS)
+        mlflow.log_param("trial_queue", args.queue_dir is not None)
+
+        for i, (params, trial_metrics, error) in enumerate(run_trials()):
+            param_list.append(params)
+            trial_record = {
                 "params": params,
-                "train_mdae": train_mdae,
-                "train_mae": train_mae,
-                "train_r2": train_r2,
-                "val_mdae": val_mdae,
-                "val_mae": val_mae,
-                "val_r2": val_r2,
-                "training_time": training_time
-            })
+                "sampler": SEARCH_SAMPLER,
+                "train_metrics": "off" if TUNING_CV_FOLDS else TRAIN_METRICS_STRATEGY,
+                "cv_folds": TUNING_CV_FOLDS,
+            }
+            if error is not None:
+                # Failed trial on a queue worker: keep it in the history, but never select it
+                tuning_history.append({**trial_record, "error": error})
+                print(f"  [{i+1:3d}/{XGB_N_ITER}] ❌ Failed: {error}")
+                continue
+            tuning_history.append({**trial_record, **trial_metrics})  # Includes per-fold metrics with TUNING_CV_FOLDS
+            trial_metrics = {name: value for name, value in trial_metrics.items() if name != "folds"}
+            val_mdae = trial_metrics["val_mdae"]
+            training_time = trial_metrics["training_time"]
 
             # Track best configuration
             if val_mdae < best_mdae:
@@ -148,17 +278,7 @@ def main():
                 best_idx = i
 
             # Log each iteration to MLflow as a child run
-            with mlflow.start_run(run_name=f"Trial {i+1:03d}", nested=True):
-                mlflow.log_params(params)
-                mlflow.log_metrics({
-                    "val_mdae": val_mdae,
-                    "val_mae": val_mae,
-                    "val_r2": val_r2,
-                    "train_mdae": train_mdae,
-                    "train_mae": train_mae,
-                    "train_r2": train_r2,
-                    "training_time": training_time
-                })
+            tracker.log_run(f"Trial {i+1:03d}", params=params, metrics=trial_metrics, parent_run_id=parent_run.info.run_id)
 
             # Progress logging 
             print(f"  [{i+1:3d}/{XGB_N_ITER}] MdAE: {val_mdae:8.2f} | est={params['n_estimators']}, depth={params['max_depth']}, lr={params['learning_rate']:.3f}, sub={params['subsample']:.2f}, col={params['colsample_bytree']:.2f} | fit: {training_time:5.1f} s")
@@ -168,21 +288,13 @@ def main():
     total_search_time = time.time() - search_start
     print(f"  Random search completed in {total_search_time:.0f} s")
 
-    # --- 5. Best Model: Retrain with MLflow Logging ---
-    print("Step 5: Retraining best model...")
+    # --- 4. Best Model: Retrain with MLflow Logging ---
+    print("Step 4: Retraining best model...")
+    if best_idx < 0:
+        raise RuntimeError("All trials failed. See the error messages in the trial log above.")
     best_params = param_list[best_idx]
 
-    best_xgb_model = TransformedTargetRegressor(
-        regressor=XGBRegressor(
-            objective="reg:absoluteerror",
-            tree_method="hist",
-            n_jobs=-1,
-            random_state=RANDOM_STATE,
-            **best_params
-        ),
-        func=np.log1p,
-        inverse_func=np.expm1
-    )
+    best_xgb_model = build_model(best_params)
 
     best_xgb_result = train_and_evaluate(
         best_xgb_model,
@@ -190,16 +302,18 @@ def main():
         X_val, y_val,
         w_train, w_val,
         track_mlflow=True,
+        train_data_path=TRAIN_MODEL_READY_DATA_PATH,
+        val_data_path=VAL_MODEL_READY_DATA_PATH,
         model_name="XGBoost (Tuned)"
     )
     print(f"  Best Tuned XGBoost  →  MdAE: {best_xgb_result['val_mdae']:.2f} | MAE: {best_xgb_result['val_mae']:.2f} | "
           f"R²: {best_xgb_result['val_r2']:.4f} | Training Time: {best_xgb_result['training_time']:.2f}s")
 
-    # --- 6. Model Persistence ---
-    print("Step 6: Persisting hyperparameter tuning results...")
+    # --- 5. Model Persistence ---
+    print("Step 5: Persisting hyperparameter tuning results...")
 
-    save_model(best_xgb_result["fitted_model"], "models/xgb_tuned_model.joblib", verbose=False)
-    print("  Saved best model to 'models/xgb_tuned_model.joblib'")
+    save_model(best_xgb_result["fitted_model"], "models/xgb_tuned_model.ubj", verbose=False)
+    print("  Saved best model to 'models/xgb_tuned_model.ubj'")
 
     tuned_metrics = {
         "XGBoost (Tuned)": {
@@ -221,8 +335,8 @@ def main():
     save_metrics(get_core_model_params(best_xgb_result["fitted_model"]), "models/xgb_tuned_params.json", verbose=False)
     print("  Saved hyperparameters of best model to 'models/xgb_tuned_params.json'")
     
-    save_model(best_xgb_result["y_val_pred"], "models/xgb_tuned_predictions.joblib", verbose=False)
-    print("  Saved predicted values of best model to 'models/xgb_tuned_predictions.joblib'")
+    save_model(best_xgb_result["y_val_pred"], "models/xgb_tuned_predictions.npy", verbose=False)
+    print("  Saved predicted values of best model to 'models/xgb_tuned_predictions.npy'")
 
     print("\n✅ XGBoost hyperparameter tuning complete.")
 
@@ -0,0 +1,1711 @@
+"""
+Batched SHAP explanations of the postprocessed q50 plan-around estimate.
+
+The explainer specified in notebooks/2_modeling.py wraps the complete q50 prediction path
+(predict_median_cost) in shap.Explainer(..., algorithm="permutation") over a
+shap.maskers.Independent background. SHAP then runs the pandas-based sklearn preprocessor
+and the TransformedTargetRegressor once per permutation on DataFrames of masked rows, and
+most of the explanation latency is pandas and sklearn overhead rather than tree evaluation.
+
+This module computes the same permutation SHAP values without that overhead:
+
+    explainer = PermutationShapExplainer(preprocessor, xgb_quantile_model, shap_background)
+    explanation = explainer.explain(X_profile)
+    top_drivers = get_top_drivers(explanation["values"][0], explanation["feature_names"])
+
+Components:
+  - CompiledPreprocessor: Array-only equivalent of the fitted preprocessing pipeline
+    (src/pipeline.py) for numeric-coded preprocessor inputs: imputation, chronic condition
+    and limitation counts, scaling, one-hot encoding, and binary passthrough.
+  - PermutationShapExplainer: Reproduces SHAP's permutation algorithm with an Independent
+    masker (same permutations for the same seed, same delta masking). All masked rows of
+    one explanation are built as one contiguous array and scored by one compiled
+    preprocessor call and one in-place booster prediction. Rows whose masked features equal
+    the background values are not re-evaluated, exactly as in SHAP's masked model.
+  - PartitionShapExplainer: Partition mode with the Owen values of the binarized hierarchy of
+    feature groups (SHAP_FEATURE_HIERARCHY: chronic conditions, functional limitations,
+    health status, socioeconomic, demographic; groups with more than two members split into
+    halves in listed order), using a fixed set of coalitions per explanation, plus the
+    attribution of each group.
+  - TreeShapExplainer: Hybrid alternative with exact path-dependent TreeSHAP of the q50 booster
+    in log space, mapped back to the inputs through the preprocessing graph and converted to
+    dollars by a local linearization of expm1. evaluate_tree_shap_fidelity decides whether its
+    top drivers agree with permutation SHAP closely enough to switch.
+  - WhatIfSession: Session-scoped incremental recomputation of one planner profile: after an
+    input edit, only the affected model-ready columns and masked SHAP evaluations are recomputed.
+  - CounterfactualSweep: Quantile curves of a fixed profile over a grid of one or two features
+    (age, insurance status, health rating), predicted in one vectorized batch.
+  - ExplanationJobQueue: Background explanation jobs behind random handles, with a bounded
+    worker pool, rejection when full, in-memory results that expire after a short TTL, and
+    aggregate backpressure metrics.
+  - BatchExplainer: Batch top drivers in request order from a process pool whose workers build
+    the explainer once, with a per-request row budget and a global cap on concurrently explained rows.
+
+build_shap_background creates the survey-weighted background: weighted resampling, or a
+weighted k-medoids/k-means summary whose rows carry the population weight of their cluster.
+The Configuration Benchmark functions compare explanations of a candidate background size and
+evaluation budget against a larger reference configuration (scripts/benchmark_shap.py).
+
+Inputs are the 27 preprocessor input features (SHAP_INPUT_FEATURES) as numeric MEPS codes,
+as stored in the preprocessor-input Parquet files. Values are 2023 dollars before
+medical-cost inflation.
+"""
+
+# Standard library imports
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import xgboost
+from sklearn.cluster import KMeans, kmeans_plusplus
+from sklearn.metrics import euclidean_distances, pairwise_distances_argmin
+
+# Local imports
+from src.constants import RANDOM_STATE, CATEGORY_LABELS_PIPELINE, PIPELINE_NUMERICAL_FEATURES, PIPELINE_NOMINAL_FEATURES, PIPELINE_BINARY_FEATURES
+from src.pipeline import postprocess_quantile_predictions
+from src.transformers import MedicalFeatureDeriver
+
+# Preprocessor input features explained by SHAP (same order as the SHAP background data)
+SHAP_INPUT_FEATURES = PIPELINE_NUMERICAL_FEATURES + PIPELINE_NOMINAL_FEATURES + PIPELINE_BINARY_FEATURES
+SHAP_MAX_EVALS = 500  # SHAP's default evaluation budget for the permutation explainer
+SHAP_TOP_K = 5  # Number of cost drivers shown to users
+MEDIAN_QUANTILE_INDEX = 1  # q50 in the (q25, q50, q75, q90) quantile model output
+
+# Acceptance criteria of a SHAP configuration (background size, max_evals) against a reference configuration
+SHAP_BASELINE_REL_DIFF_MAX = 0.10  # Max. relative difference of background vs. weighted training baseline
+SHAP_MIN_TOP_K_MATCHES = 4  # Min. top-k drivers shared with the reference ...
+SHAP_MIN_TOP_K_MATCH_ROW_SHARE = 0.90  # ... for at least this share of profiles
+SHAP_MATERIAL_CONTRIBUTION_MIN_2023_USD = 25.0  # Shared drivers of at least this size must keep their sign
+SHAP_MEDIAN_TOP_K_ABS_DELTA_MAX_2023_USD = 25.0  # Max. median dollar difference of shared top-k drivers
+SHAP_ADDITIVITY_ABS_ERROR_MAX_2023_USD = 0.01  # Max. p95 |prediction - (baseline + sum of SHAP values)|
+
+# SHAP background construction (build_shap_background): method -> sampling description in the SHAP metadata
+SHAP_BACKGROUND_SAMPLING_DESCRIPTIONS = {
+    "resample": "weighted sample with replacement using PERWT23F",
+    "kmeans": "weighted k-means summary using PERWT23F (member closest to each centroid, weighted by cluster population)",
+    "kmedoids": "weighted k-medoids summary using PERWT23F (medoids weighted by cluster population)",
+}
+SHAP_BACKGROUND_METHODS = tuple(SHAP_BACKGROUND_SAMPLING_DESCRIPTIONS)
+SHAP_BACKGROUND_METHOD = "kmedoids"  # Default method of the app background
+SHAP_BACKGROUND_N = 100  # Default background rows (scripts/benchmark_shap.py selects the shipped size)
+SHAP_BACKGROUND_WEIGHT_COLUMN = "BACKGROUND_WEIGHT"  # Population share of each background row in the Parquet artifact
+SHAP_BACKGROUND_PREDICTION_SCALE = 8.0  # Weight of the standardized sqrt(q50) prediction in the clustering space
+SHAP_KMEDOIDS_MAX_ITER = 30
+
+# Explanation modes: flat permutation SHAP, or Owen values of the binarized SHAP_FEATURE_HIERARCHY
+SHAP_EXPLANATION_MODES = ("permutation", "partition")
+SHAP_EXPLANATION_MODE = "permutation"
+
+# Fixed feature hierarchy of the partition mode (named groups, innermost groups list SHAP_INPUT_FEATURES).
+# The partition mode binarizes it: members are split into a first half of len // 2 and the rest, in listed
+# order, recursively (e.g., Health | (Socioeconomic | Demographic) at the top level and
+# Chronic conditions | (Functional limitations | Health status) within Health). Reordering members
+# changes the binarization and therefore the Owen values.
+SHAP_FEATURE_HIERARCHY = {
+    "Health": {
+        "Chronic conditions": MedicalFeatureDeriver.CHRONIC_CONDITION_FEATURES,
+        "Functional limitations": MedicalFeatureDeriver.FUNCTIONAL_LIMITATION_FEATURES,
+        "Health status": ["RTHLTH31", "MNHLTH31", "ADSMOK42"],
+    },
+    "Socioeconomic": ["POVCAT23", "INSCOV23", "HIDEG", "EMPST31_GRP", "HAVEUS42"],
+    "Demographic": ["AGE23X", "SEX", "REGION23", "MARRY31X_GRP", "FAMSZE23", "RECENT_LIFE_TRANSITION"],
+}
+
+
+# =========================
+# Compiled Preprocessing
+# =========================
+
+class CompiledPreprocessor:
+    """
+    Array-only equivalent of the fitted preprocessing pipeline.
+
+    Reads the fitted statistics of create_preprocessing_pipeline (imputation fill values,
+    scaler mean/scale, one-hot categories and dropped baselines) and applies them with
+    vectorized NumPy operations. Inputs are float arrays of numeric MEPS codes (NaN for
+    missing) in the order of input_features; outputs match preprocessor.transform() column
+    for column, as a float array in the model-ready feature order.
+
+    Unlike the pipeline, missing required features are imputed instead of raising
+    MissingValueError: callers validate user inputs before explaining them.
+    """
+
+    def __init__(self, preprocessor, input_features=SHAP_INPUT_FEATURES):
+        standardizer = preprocessor.named_steps["categorical_label_standardizer"]
+        imputer = preprocessor.named_steps["missing_value_imputer"]
+        scaler_encoder = preprocessor.named_steps["feature_scaler_encoder"]
+        self.input_features = list(input_features)
+        column_index = {feature: i for i, feature in enumerate(self.input_features)}
+
+        # Imputation fill values per input column
+        fill_values = {}
+        for name, transformer, features in imputer.transformers_:
+            if name == "remainder":
+                continue
+            fill_values.update(zip(features, transformer.statistics_))
+
+        # One-hot encoding: sorted numeric codes -> category index; NaN is imputed with the mode category
+        block_features = {name: list(features) for name, _, features in scaler_encoder.transformers_}
+        encoder = scaler_encoder.named_transformers_["nominal_encoder"]
+        self.nominal_features = block_features["nominal_encoder"]
+        self.nominal_columns = np.array([column_index[feature] for feature in self.nominal_features])
+        self.nominal_codes, self.nominal_category_indices, self.nominal_fill_indices = [], [], []
+        self.nominal_kept_categories, onehot_names = [], []
+        for feature, categories, drop_idx in zip(self.nominal_features, encoder.categories_, encoder.drop_idx_):
+            categories = list(categories)
+            code_to_index = {
+                float(code): categories.index(label)
+                for code, label in sorted(standardizer.categorical_label_map[feature].items()) if label in categories
+            }
+            self.nominal_codes.append(np.array(list(code_to_index)))
+            self.nominal_category_indices.append(np.array(list(code_to_index.values())))
+            self.nominal_fill_indices.append(categories.index(fill_values[feature]))
+            kept = [i for i in range(len(categories)) if drop_idx is None or i != drop_idx]
+            self.nominal_kept_categories.append(np.array(kept))
+            onehot_names += [f"{feature}_{categories[i]}" for i in kept]
+
+        # Numerical imputation and binary passthrough (all other input columns)
+        other_features = [feature for feature in self.input_features if feature not in self.nominal_features]
+        self.other_columns = np.array([column_index[feature] for feature in other_features])
+        self.other_fill_values = np.array([float(fill_values[feature]) for feature in other_features])
+        other_index = {feature: i for i, feature in enumerate(other_features)}
+
+        # Derived counts (sums of imputed flags) and scaling
+        self.chronic_columns = np.array([other_index[f] for f in MedicalFeatureDeriver.CHRONIC_CONDITION_FEATURES])
+        self.limitation_columns = np.array([other_index[f] for f in MedicalFeatureDeriver.FUNCTIONAL_LIMITATION_FEATURES])
+        scaler = scaler_encoder.named_transformers_["numerical_scaler"]
+        scaled_features = block_features["numerical_scaler"]
+        base_scaled_features = [f for f in scaled_features if f not in MedicalFeatureDeriver.OUTPUT_FEATURES]
+        if scaled_features != base_scaled_features + MedicalFeatureDeriver.OUTPUT_FEATURES:
+            raise ValueError("CompiledPreprocessor: Derived count features must be the last scaled features.")
+        self.scaled_columns = np.array([other_index[f] for f in base_scaled_features])
+        self.scaler_mean = scaler.mean_.astype(float)
+        self.scaler_scale = scaler.scale_.astype(float)
+        binary_features = block_features["binary_passthrough"]
+        self.binary_columns = np.array([other_index[f] for f in binary_features])
+
+        # Output column order of the fitted pipeline
+        block_names = scaled_features + onehot_names + binary_features
+        self.feature_names_out = list(scaler_encoder.get_feature_names_out())
+        if sorted(block_names) != sorted(self.feature_names_out):
+            raise ValueError("CompiledPreprocessor: The fitted pipeline has an unexpected output schema.")
+        block_index = {name: i for i, name in enumerate(block_names)}
+        self.output_order = np.array([block_index[name] for name in self.feature_names_out])
+
+        # Input column behind every model-ready column (-1: derived counts)
+        block_input_columns = np.concatenate([
+            self.other_columns[self.scaled_columns],
+            np.full(len(MedicalFeatureDeriver.OUTPUT_FEATURES), -1),
+            np.repeat(self.nominal_columns, [len(kept) for kept in self.nominal_kept_categories]),
+            self.other_columns[self.binary_columns],
+        ])
+        self.output_input_columns = block_input_columns[self.output_order]
+
+        # Output position of every block column, per block (partial recomputation in transform_columns)
+        block_positions = np.argsort(self.output_order)
+        n_scaled = len(self.scaled_columns)
+        n_numerical = n_scaled + len(MedicalFeatureDeriver.OUTPUT_FEATURES)
+        self.scaled_positions = block_positions[:n_scaled]
+        self.count_positions = block_positions[n_scaled:n_numerical]
+        onehot_ends = n_numerical + np.cumsum([len(kept) for kept in self.nominal_kept_categories])
+        self.nominal_positions = np.split(block_positions[n_numerical:onehot_ends[-1]], onehot_ends[:-1] - n_numerical)
+        self.binary_positions = block_positions[onehot_ends[-1]:]
+
+    def _encode_nominal_column(self, values, j):
+        """Map the codes of nominal feature j to its one-hot block (dropped baseline excluded)."""
+        category_index = np.full(len(values), self.nominal_fill_indices[j])
+        observed = ~np.isnan(values)
+        codes = self.nominal_codes[j]
+        position = np.clip(np.searchsorted(codes, values[observed]), 0, len(codes) - 1)
+        if not np.array_equal(codes[position], values[observed]):
+            unknown = np.setdiff1d(values[observed], codes)
+            raise ValueError(f"CompiledPreprocessor: Found unknown codes {unknown.tolist()} in '{self.nominal_features[j]}'.")
+        category_index[observed] = self.nominal_category_indices[j][position]
+        return (category_index[:, None] == self.nominal_kept_categories[j][None, :]).astype(float)
+
+    def _impute_other(self, X_other, columns):
+        """Imputed values of some non-nominal columns (indices into other_columns)."""
+        return np.where(np.isnan(X_other[:, columns]), self.other_fill_values[columns], X_other[:, columns])
+
+    def _encode_nominal(self, X_nominal):
+        """Map nominal codes to one-hot blocks (dropped baselines excluded)."""
+        return np.hstack([self._encode_nominal_column(X_nominal[:, j], j) for j in range(X_nominal.shape[1])])
+
+    def transform(self, X):
+        """
+        Transform preprocessor input rows into model-ready features.
+
+        Args:
+            X (np.ndarray or pd.DataFrame): Rows of input_features as numeric codes (NaN for missing).
+
+        Returns:
+            np.ndarray: Model-ready features with shape (n_samples, len(feature_names_out)).
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.input_features]
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2 or X.shape[1] != len(self.input_features):
+            raise ValueError(f"CompiledPreprocessor: Input must have shape (n_rows, {len(self.input_features)}).")
+
+        X_other = X[:, self.other_columns]
+        X_other = np.where(np.isnan(X_other), self.other_fill_values, X_other)
+        X_numerical = np.column_stack([
+            X_other[:, self.scaled_columns],
+            X_other[:, self.chronic_columns].sum(axis=1),
+            X_other[:, self.limitation_columns].sum(axis=1),
+        ])
+        X_blocks = np.hstack([
+            (X_numerical - self.scaler_mean) / self.scaler_scale,
+            self._encode_nominal(X[:, self.nominal_columns]),
+            X_other[:, self.binary_columns],
+        ])
+        return X_blocks[:, self.output_order]
+
+    def transform_columns(self, X, input_columns):
+        """
+        Recompute only the model-ready columns that depend on some input columns.
+
+        A changed input affects its own scaled, one-hot, or passthrough columns and, for chronic
+        condition and limitation flags, the derived CHRONIC_COUNT or LIMITATION_COUNT. All other
+        model-ready columns of X are unchanged and can be kept from an earlier transform().
+
+        Args:
+            X (np.ndarray): Rows of input_features as numeric codes (NaN for missing).
+            input_columns (array-like): Indices of the changed input columns.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Affected model-ready column positions, and their values
+                with shape (n_samples, n_positions).
+        """
+        X = np.asarray(X, dtype=float)
+        input_columns = set(np.asarray(input_columns, dtype=int).tolist())
+        positions, blocks = [], []
+        for j, column in enumerate(self.nominal_columns):
+            if column in input_columns:
+                positions.append(self.nominal_positions[j])
+                blocks.append(self._encode_nominal_column(X[:, column], j))
+
+        changed_other = np.flatnonzero(np.isin(self.other_columns, list(input_columns)))
+        X_other = X[:, self.other_columns]
+        n_scaled = len(self.scaled_columns)
+        n_binary = len(self.binary_columns)
+        for block_columns, block_positions, mean, scale in [
+            (self.scaled_columns, self.scaled_positions, self.scaler_mean[:n_scaled], self.scaler_scale[:n_scaled]),
+            (self.binary_columns, self.binary_positions, np.zeros(n_binary), np.ones(n_binary)),
+        ]:
+            changed = np.isin(block_columns, changed_other)
+            if changed.any():
+                positions.append(block_positions[changed])
+                blocks.append((self._impute_other(X_other, block_columns[changed]) - mean[changed]) / scale[changed])
+
+        for i, count_columns in enumerate([self.chronic_columns, self.limitation_columns]):
+            if np.isin(count_columns, changed_other).any():
+                counts = self._impute_other(X_other, count_columns).sum(axis=1)
+                positions.append(self.count_positions[i:i + 1])
+                blocks.append(((counts - self.scaler_mean[n_scaled + i]) / self.scaler_scale[n_scaled + i])[:, None])
+
+        if not positions:
+            return np.empty(0, dtype=int), np.empty((len(X), 0))
+        return np.concatenate(positions), np.hstack(blocks)
+
+
+# =========================
+# Permutation SHAP
+# =========================
+
+def slice_quantile_booster(booster, outputs):
+    """
+    Copy of a multi-quantile XGBoost booster that keeps only the trees of the given outputs.
+
+    Predictions of the sliced booster equal the selected columns of the full booster's
+    predictions. The postprocessed q50 only depends on q25 and q50 (non-negative and
+    monotonic cleanup looks at lower quantiles only), so the q75 and q90 trees can be
+    skipped when scoring SHAP masks.
+
+    Args:
+        booster (xgboost.Booster): Fitted booster with one output per quantile (one tree per output and round).
+        outputs (list[int]): Output (quantile) indices to keep, in order.
+
+    Returns:
+        xgboost.Booster: Booster with len(outputs) outputs.
+    """
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    trees_model = learner["gradient_booster"]["model"]
+    n_outputs = int(learner["learner_model_param"]["num_target"])
+    if learner["gradient_booster"]["name"] != "gbtree" or list(outputs) == list(range(n_outputs)):
+        return booster
+
+    kept_trees = [(tree, outputs.index(output)) for tree, output in zip(trees_model["trees"], trees_model["tree_info"]) if output in outputs]
+    for tree_id, (tree, _) in enumerate(kept_trees):
+        tree["id"] = tree_id
+    trees_model["trees"] = [tree for tree, _ in kept_trees]
+    trees_model["tree_info"] = [output for _, output in kept_trees]
+    trees_model["gbtree_model_param"]["num_trees"] = str(len(kept_trees))
+    trees_model["iteration_indptr"] = list(range(0, len(kept_trees) + 1, len(outputs)))
+
+    base_scores = re.findall(r"[^\[\],\s]+", learner["learner_model_param"]["base_score"])
+    learner["learner_model_param"]["base_score"] = "[" + ",".join(base_scores[i] for i in outputs) + "]"
+    learner["learner_model_param"]["num_target"] = str(len(outputs))
+    quantile_param = learner["objective"].get("quantile_loss_param")
+    if quantile_param is not None:
+        alphas = re.findall(r"[^\[\],\s]+", quantile_param["quantile_alpha"])
+        quantile_param["quantile_alpha"] = "[" + ",".join(alphas[i] for i in outputs) + "]"
+
+    sliced_booster = xgboost.Booster()
+    sliced_booster.load_model(bytearray(json.dumps(model).encode()))
+    sliced_booster.set_param({"nthread": json.loads(booster.save_config())["learner"]["generic_param"]["nthread"]})
+    return sliced_booster
+
+
+class PermutationShapExplainer:
+    """
+    Batched permutation SHAP for the postprocessed q50 cost.
+
+    Equivalent to shap.Explainer(predict_median_cost, shap.maskers.Independent(background,
+    max_samples=len(background)), algorithm="permutation", seed=seed): permutations are drawn
+    from a NumPy RandomState seeded once at construction (like SHAP's global seed), so a
+    sequence of explanations matches a SHAP explainer built with the same seed and called
+    on the same rows.
+
+    Each explanation builds the masked rows of all permutations at once and scores them in
+    one batch. A masked row is determined by its background row and by the masked-in features
+    whose profile value differs from that background row, so every distinct row is scored
+    only once (SHAP re-evaluates rows per permutation and only skips unchanged consecutive
+    masks). Only the q25 and q50 trees are evaluated (see slice_quantile_booster).
+
+    Summarized backgrounds (build_shap_background) carry per-row weights: masked outputs and
+    the baseline are then weighted averages over the background rows instead of plain means.
+    Without weights, the explanations equal SHAP's.
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline (models/preprocessor.joblib).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model (models/xgb_quantile_model.ubj).
+        background (pd.DataFrame or np.ndarray): SHAP background rows of SHAP_INPUT_FEATURES.
+        background_weights (array-like, optional): Population weight per background row (None: equal weights).
+        max_evals (int): Default evaluation budget per explanation (permutations = max_evals // (2 * n_features + 1)).
+        seed (int): Seed of the permutation random state.
+    """
+
+    def __init__(self, preprocessor, model, background, background_weights=None, max_evals=SHAP_MAX_EVALS, seed=RANDOM_STATE):
+        self.preprocessor = CompiledPreprocessor(preprocessor)
+        self.feature_names = self.preprocessor.input_features
+        if isinstance(background, pd.DataFrame):
+            background = background.loc[:, self.feature_names]
+        self.background = np.ascontiguousarray(background, dtype=float)
+        self.background_weights = None if background_weights is None else np.asarray(background_weights, dtype=float) / np.sum(background_weights)
+        self.booster = slice_quantile_booster(model.regressor_.get_booster(), list(range(MEDIAN_QUANTILE_INDEX + 1)))
+        self.inverse_func = model.inverse_func
+        self.max_evals = max_evals
+        self.random_state = np.random.RandomState(seed)
+        self.feature_bits = np.left_shift(1, np.arange(len(self.feature_names), dtype=np.int64))
+        self.expected_value = self._average_over_background(self.predict(self.background))
+
+    def predict(self, X):
+        """Fused q50 callable: compiled preprocessing, in-place booster prediction, inverse transform, postprocessing."""
+        return self.predict_model_ready(self.preprocessor.transform(X))
+
+    def predict_model_ready(self, X_model_ready):
+        """Postprocessed q50 of already preprocessed (model-ready) rows."""
+        quantile_predictions = self.inverse_func(self.booster.inplace_predict(X_model_ready, validate_features=False))
+        return postprocess_quantile_predictions(np.asarray(quantile_predictions).reshape(len(X_model_ready), -1))[:, MEDIAN_QUANTILE_INDEX]
+
+    def _average_over_background(self, outputs):
+        """Mean (or weighted mean) over the last axis, which indexes the background rows."""
+        if self.background_weights is None:
+            return outputs.mean(axis=-1)
+        return outputs @ self.background_weights
+
+    def _permutation_orders(self, varying_features, n_permutations, random_state):
+        """Feature orders of all permutations, drawn like SHAP (in-place shuffles of one index array)."""
+        orders = np.empty((n_permutations, len(varying_features)), dtype=np.int64)
+        for i in range(n_permutations):
+            random_state.shuffle(varying_features)
+            orders[i] = varying_features
+        return orders
+
+    def _evaluate_masks(self, x, variants, mask_bits, score_rows=None):
+        """
+        Background-averaged outputs of feature bitmasks (any shape), scoring every distinct masked row once.
+
+        score_rows(X_masked, row_keys) replaces predict(X_masked) for callers that reuse earlier
+        evaluations (WhatIfSession); a row key encodes the background row and the masked-in features
+        whose profile value differs from it.
+        """
+        n_background, n_features = self.background.shape
+
+        # A masked row only depends on the background row and its masked-in differing features
+        variant_bits = variants.astype(np.int64) @ self.feature_bits
+        row_keys = (np.arange(n_background, dtype=np.int64) << n_features) | (mask_bits[..., None] & variant_bits)
+        unique_keys, key_index = np.unique(row_keys, return_inverse=True)
+        background_index = unique_keys >> n_features
+        masked_in = (unique_keys[:, None] & self.feature_bits).astype(bool)
+        X_masked = np.where(masked_in, x, self.background[background_index])
+
+        # One batched evaluation of all distinct masked rows, averaged over the background per mask
+        outputs = self.predict(X_masked) if score_rows is None else score_rows(X_masked, unique_keys)
+        return self._average_over_background(outputs[key_index.reshape(row_keys.shape)])
+
+    def _explain_row(self, x, max_evals, random_state=None, score_rows=None):
+        n_features = len(self.feature_names)
+        variants = ~np.isclose(x, self.background)  # Background rows whose value differs from the profile
+        varying_features = np.flatnonzero(variants.any(axis=0))
+        n_varying = len(varying_features)
+        if n_varying == 0:
+            return np.zeros(n_features), self.expected_value
+        n_steps = 2 * n_varying + 1
+        n_permutations = max_evals // n_steps
+        if n_permutations == 0:
+            raise ValueError(f"max_evals={max_evals} is too low for the Permutation explainer, it must be at least 2 * num_features + 1 = {n_steps}!")
+        orders = self._permutation_orders(varying_features, n_permutations, self.random_state if random_state is None else random_state)
+
+        # Mask states as feature bitmasks: step 0 is the background, steps 1..k switch the
+        # features of the permutation on, steps k+1..2k switch them off again in the same order
+        feature_bits = self.feature_bits[orders]
+        flip_bits = np.concatenate([np.zeros((n_permutations, 1), dtype=np.int64), feature_bits, feature_bits], axis=1)
+        mask_bits = np.bitwise_xor.accumulate(flip_bits, axis=1)
+        step_outputs = self._evaluate_masks(x, variants, mask_bits, score_rows)
+
+        # Marginal contributions: forward pass adds features, backward pass removes them
+        deltas = np.diff(step_outputs, axis=1)
+        values = np.zeros(n_features)
+        np.add.at(values, orders, deltas[:, :n_varying])
+        np.add.at(values, orders, -deltas[:, n_varying:])
+        return values / (2 * n_permutations), step_outputs[0, 0]
+
+    def explain(self, X, max_evals=None):
+        """
+        Explain the postprocessed q50 prediction of one or more profiles.
+
+        Args:
+            X (pd.DataFrame or np.ndarray): Profiles with the SHAP_INPUT_FEATURES columns (numeric codes).
+            max_evals (int, optional): Evaluation budget per profile (defaults to the explainer's max_evals).
+
+        Returns:
+            dict: values (n_rows, n_features) in 2023 dollars, base_values (n_rows,), and feature_names.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.feature_names]
+        X = np.asarray(X, dtype=float).reshape(-1, len(self.feature_names))
+        values, base_values = zip(*(self._explain_row(x, max_evals or self.max_evals) for x in X))
+        return {"values": np.vstack(values), "base_values": np.asarray(base_values), "feature_names": self.feature_names}
+
+
+def _binarize_hierarchy(hierarchy, feature_index):
+    """Binary tree of feature indices: groups with more than two members are split into balanced halves in listed order."""
+    members = hierarchy.values() if isinstance(hierarchy, dict) else hierarchy
+    nodes = [feature_index[member] if isinstance(member, str) else _binarize_hierarchy(member, feature_index) for member in members]
+    while len(nodes) > 2:
+        middle = len(nodes) // 2
+        nodes = [_split_nodes(nodes[:middle]), _split_nodes(nodes[middle:])]
+    return _split_nodes(nodes)
+
+
+def _split_nodes(nodes):
+    """Single node, or a (left, right) pair of balanced halves."""
+    if len(nodes) == 1:
+        return nodes[0]
+    middle = len(nodes) // 2
+    return (_split_nodes(nodes[:middle]), _split_nodes(nodes[middle:]))
+
+
+def _node_bits(node):
+    """Feature bitmask of a binary hierarchy node."""
+    return 1 << node if isinstance(node, int) else _node_bits(node[0]) | _node_bits(node[1])
+
+
+def _owen_contexts(node, contexts):
+    """
+    Yield every feature of a binary hierarchy with its Owen contexts.
+
+    A feature's contexts are all combinations of the siblings on its path to the root being
+    masked in or out; each context has the same Owen weight.
+    """
+    if isinstance(node, int):
+        yield node, contexts
+        return
+    left, right = node
+    yield from _owen_contexts(left, np.concatenate([contexts, contexts | _node_bits(right)]))
+    yield from _owen_contexts(right, np.concatenate([contexts, contexts | _node_bits(left)]))
+
+
+def build_owen_coalitions(feature_hierarchy=SHAP_FEATURE_HIERARCHY, feature_names=SHAP_INPUT_FEATURES):
+    """
+    Coalitions of the Owen values of the binarized feature hierarchy (see _binarize_hierarchy for the split order).
+
+    Args:
+        feature_hierarchy (dict): Nested named groups containing every feature exactly once.
+        feature_names (list): Feature order of the bitmasks.
+
+    Returns:
+        tuple: Distinct coalition bitmasks, the coalition index of every (context, context + feature)
+            pair with shape (2, n_pairs), and the feature and Owen weight of every pair.
+    """
+    binary_hierarchy = _binarize_hierarchy(feature_hierarchy, {feature: i for i, feature in enumerate(feature_names)})
+    features, contexts = zip(*_owen_contexts(binary_hierarchy, np.zeros(1, dtype=np.int64)))
+    pair_features = np.repeat(features, [len(context) for context in contexts])
+    pair_weights = np.concatenate([np.full(len(context), 1 / len(context)) for context in contexts])
+    context_bits = np.concatenate(contexts)
+    coalition_pairs = np.stack([context_bits, context_bits | np.left_shift(1, pair_features)])
+    coalition_bits, coalition_index = np.unique(coalition_pairs, return_inverse=True)
+    return coalition_bits, coalition_index.reshape(coalition_pairs.shape), pair_features, pair_weights
+
+
+def get_feature_groups(feature_hierarchy=SHAP_FEATURE_HIERARCHY):
+    """Innermost named groups of a feature hierarchy, e.g. {"Chronic conditions": [...], ...}."""
+    feature_groups = {}
+    for group, members in feature_hierarchy.items():
+        if isinstance(members, dict):
+            feature_groups.update(get_feature_groups(members))
+        else:
+            feature_groups[group] = list(members)
+    return feature_groups
+
+
+class PartitionShapExplainer(PermutationShapExplainer):
+    """
+    Owen values of the postprocessed q50 cost over the binarized feature hierarchy.
+
+    Partition mode of the cost-driver explanations. The hierarchy (SHAP_FEATURE_HIERARCHY) is
+    binarized like a SHAP Partition masker clustering: the members of a group with more than two
+    members are split, in listed order, into the first len // 2 members and the rest, recursively.
+    The values are exact for this binary hierarchy, not for the declared multi-way groups (e.g.,
+    the 3-member Health group): Owen values depend on the binarization, so reordering the members
+    of a group changes them. On a binary hierarchy, the Owen value of a feature is its mean
+    marginal contribution over all contexts in which each sibling on its path to the root is
+    masked in or out. The coalitions are therefore fixed by the hierarchy (556 distinct coalitions
+    for SHAP_FEATURE_HIERARCHY): every explanation scores the same coalitions in one batch,
+    without sampling noise or a seed, and with the background-row deduplication of
+    PermutationShapExplainer. SHAP's PartitionExplainer approximates the same values adaptively
+    within max_evals.
+
+    Values are additive like permutation SHAP values. The values of a group's features sum to
+    the Owen value of the group, reported per innermost group as group_values.
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline (models/preprocessor.joblib).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model (models/xgb_quantile_model.ubj).
+        background (pd.DataFrame or np.ndarray): SHAP background rows of SHAP_INPUT_FEATURES.
+        background_weights (array-like, optional): Population weight per background row (None: equal weights).
+        feature_hierarchy (dict): Nested named groups containing every input feature exactly once.
+
+    Raises:
+        ValueError: If the hierarchy does not contain every input feature exactly once.
+    """
+
+    def __init__(self, preprocessor, model, background, background_weights=None, feature_hierarchy=SHAP_FEATURE_HIERARCHY):
+        super().__init__(preprocessor, model, background, background_weights)
+        self.feature_groups = get_feature_groups(feature_hierarchy)
+        grouped_features = [feature for members in self.feature_groups.values() for feature in members]
+        if sorted(grouped_features) != sorted(self.feature_names):
+            raise ValueError("The feature hierarchy must contain every SHAP input feature exactly once.")
+        self.group_matrix = np.array([[feature in members for members in self.feature_groups.values()] for feature in self.feature_names], dtype=float)
+
+        self.coalition_bits, self.coalition_index, self.pair_features, self.pair_weights = build_owen_coalitions(feature_hierarchy, self.feature_names)
+        self.max_evals = len(self.coalition_bits)  # Distinct coalitions per explanation (fixed by the hierarchy)
+
+    def _explain_row(self, x, max_evals=None, random_state=None, score_rows=None):
+        variants = ~np.isclose(x, self.background)
+        if not variants.any():
+            return np.zeros(len(self.feature_names)), self.expected_value
+        coalition_outputs = self._evaluate_masks(x, variants, self.coalition_bits, score_rows)[self.coalition_index]
+        marginal_contributions = (coalition_outputs[1] - coalition_outputs[0]) * self.pair_weights
+        return np.bincount(self.pair_features, weights=marginal_contributions, minlength=len(self.feature_names)), self.expected_value
+
+    def explain(self, X, max_evals=None):
+        """
+        Explain the postprocessed q50 prediction of one or more profiles.
+
+        Args:
+            X (pd.DataFrame or np.ndarray): Profiles with the SHAP_INPUT_FEATURES columns (numeric codes).
+            max_evals (int, optional): Ignored, the coalitions are fixed by the feature hierarchy.
+
+        Returns:
+            dict: values (n_rows, n_features) in 2023 dollars, base_values (n_rows,), feature_names,
+                group_values (n_rows, n_groups), and group_names.
+        """
+        explanation = super().explain(X, self.max_evals)
+        explanation["group_values"] = explanation["values"] @ self.group_matrix
+        explanation["group_names"] = list(self.feature_groups)
+        return explanation
+
+
+def create_shap_explainer(explanation_mode, preprocessor, model, background, background_weights=None, max_evals=SHAP_MAX_EVALS, seed=RANDOM_STATE):
+    """
+    Build the explainer of an explanation mode (SHAP metadata: explainer_contract.algorithm).
+
+    Args:
+        explanation_mode (str): "permutation" (PermutationShapExplainer) or "partition" (PartitionShapExplainer).
+        preprocessor (Pipeline): Fitted preprocessing pipeline.
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model.
+        background (pd.DataFrame or np.ndarray): SHAP background rows of SHAP_INPUT_FEATURES.
+        background_weights (array-like, optional): Population weight per background row.
+        max_evals (int): Evaluation budget of the permutation mode (the partition mode has fixed coalitions).
+        seed (int): Seed of the permutation mode.
+
+    Returns:
+        PermutationShapExplainer or PartitionShapExplainer: Explainer with an explain(X) method.
+
+    Raises:
+        ValueError: If the explanation mode is unknown.
+    """
+    if explanation_mode == "permutation":
+        return PermutationShapExplainer(preprocessor, model, background, background_weights, max_evals=max_evals, seed=seed)
+    if explanation_mode == "partition":
+        return PartitionShapExplainer(preprocessor, model, background, background_weights)
+    raise ValueError(f"Unknown SHAP explanation mode '{explanation_mode}'. Use one of {list(SHAP_EXPLANATION_MODES)}.")
+
+
+def get_top_drivers(values, feature_names=SHAP_INPUT_FEATURES, top_k=SHAP_TOP_K):
+    """
+    Rank SHAP contributions of one profile by absolute dollar impact.
+
+    Args:
+        values (array-like): SHAP values of one profile.
+        feature_names (list): Feature names in the order of values.
+        top_k (int): Number of drivers to return.
+
+    Returns:
+        list[tuple[str, float]]: (feature, contribution) pairs, largest absolute contribution first.
+    """
+    values = np.asarray(values, dtype=float)
+    top_indices = np.argsort(np.abs(values), kind="stable")[::-1][:top_k]
+    return [(feature_names[i], float(values[i])) for i in top_indices]
+
+
+def predict_median_cost(preprocessor, model, X):
+    """
+    Postprocessed q50 cost through the fitted pipeline (the callable specified in notebooks/2_modeling.py).
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline.
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model.
+        X (pd.DataFrame): Rows with the SHAP_INPUT_FEATURES columns (numeric codes).
+
+    Returns:
+        np.ndarray: Predicted median cost in 2023 dollars.
+    """
+    X_model_ready = preprocessor.transform(X.loc[:, SHAP_INPUT_FEATURES])
+    return postprocess_quantile_predictions(model.predict(X_model_ready))[:, MEDIAN_QUANTILE_INDEX]
+
+
+# =========================
+# Hybrid TreeSHAP
+# =========================
+
+class TreeShapExplainer:
+    """
+    Exact path-dependent TreeSHAP of the q50 booster, attributed to the preprocessor inputs.
+
+    Hybrid alternative to the permutation explainer: XGBoost's TreeSHAP (pred_contribs) explains
+    the raw q50 output of the sliced booster in log1p space, for all rows in one call and without
+    masked rows or a background. The contributions of the model-ready columns are then mapped
+    back to the 27 inputs through the preprocessing graph:
+
+      - Scaled numericals and binary passthrough: the column is an affine function of one input,
+        so its contribution belongs to that input.
+      - One-hot columns: the contributions of a nominal feature's columns are summed.
+      - CHRONIC_COUNT and LIMITATION_COUNT: the count's contribution is split equally among the
+        flags the person reports (among all of the count's flags if none is reported). Flags also
+        keep their own passthrough contribution.
+
+    Dollar impacts use a local linearization of expm1 between the TreeSHAP baseline m0 (expected
+    log1p cost over the training data, weighted by tree cover) and the raw q50 prediction m:
+    every log-space contribution is scaled by the secant slope (expm1(m) - expm1(m0)) / (m - m0),
+    or by the derivative exp(m0) if m equals m0. The dollar values thus add up exactly to
+    expm1(m) - expm1(m0), and rank and sign the inputs like the log-space contributions. The
+    baseline expm1(m0) is the cost at the mean log cost, which is lower than the mean cost used
+    as baseline by permutation SHAP. postprocessing_adjustments holds the difference between the
+    postprocessed q50 and expm1(m) (non-zero only when q50 is raised to q25).
+
+    Path-dependent TreeSHAP conditions on the training distribution along tree paths, while
+    permutation SHAP masks features independently with the background, so the two can rank
+    drivers differently. Use evaluate_tree_shap_fidelity before switching explainers.
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline (models/preprocessor.joblib).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model with the log1p/expm1 target transformation.
+
+    Raises:
+        ValueError: If the model does not use the expm1 inverse target transformation.
+    """
+
+    def __init__(self, preprocessor, model):
+        if model.inverse_func is not np.expm1:
+            raise ValueError("TreeShapExplainer requires a model with the log1p/expm1 target transformation.")
+        self.preprocessor = CompiledPreprocessor(preprocessor)
+        self.feature_names = self.preprocessor.input_features
+        booster = model.regressor_.get_booster()
+        self.q25_q50_booster = slice_quantile_booster(booster, list(range(MEDIAN_QUANTILE_INDEX + 1)))
+        self.q50_booster = slice_quantile_booster(booster, [MEDIAN_QUANTILE_INDEX])
+
+        # Back-attribution of the model-ready columns: direct (one input per column) and derived counts
+        n_outputs, n_inputs = len(self.preprocessor.feature_names_out), len(self.feature_names)
+        direct = self.preprocessor.output_input_columns >= 0
+        self.direct_attribution = np.zeros((n_outputs, n_inputs))
+        self.direct_attribution[np.flatnonzero(direct), self.preprocessor.output_input_columns[direct]] = 1.0
+        self.count_attributions = [
+            (self.preprocessor.feature_names_out.index(count_feature), self.preprocessor.other_columns[flag_columns], self.preprocessor.other_fill_values[flag_columns])
+            for count_feature, flag_columns in zip(MedicalFeatureDeriver.OUTPUT_FEATURES, [self.preprocessor.chronic_columns, self.preprocessor.limitation_columns])
+        ]
+
+    def _attribute_to_inputs(self, X, contributions):
+        """Map model-ready contributions (n_rows, n_outputs) to input contributions (n_rows, n_inputs)."""
+        input_contributions = contributions @ self.direct_attribution
+        for count_column, flag_columns, flag_fill_values in self.count_attributions:
+            flags = X[:, flag_columns]
+            reported = np.where(np.isnan(flags), flag_fill_values, flags) == 1
+            recipients = np.where(reported.any(axis=1, keepdims=True), reported, True)
+            input_contributions[:, flag_columns] += contributions[:, [count_column]] * recipients / recipients.sum(axis=1, keepdims=True)
+        return input_contributions
+
+    def explain(self, X):
+        """
+        Explain the q50 prediction of one or more profiles with TreeSHAP.
+
+        Args:
+            X (pd.DataFrame or np.ndarray): Profiles with the SHAP_INPUT_FEATURES columns (numeric codes).
+
+        Returns:
+            dict: values (n_rows, n_features) in 2023 dollars, base_values (n_rows,), feature_names,
+                log_values (input contributions in log1p space), and postprocessing_adjustments.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.feature_names]
+        X = np.asarray(X, dtype=float).reshape(-1, len(self.feature_names))
+        X_model_ready = self.preprocessor.transform(X)
+        contributions = self.q50_booster.predict(
+            xgboost.DMatrix(X_model_ready, feature_names=self.preprocessor.feature_names_out), pred_contribs=True
+        ).reshape(len(X), -1)
+        log_values = self._attribute_to_inputs(X, contributions[:, :-1])
+        log_base_values = contributions[:, -1].astype(float)
+        log_predictions = log_base_values + log_values.sum(axis=1)
+
+        # Local linearization of expm1: secant slope between baseline and prediction (derivative if they coincide)
+        log_deltas = log_predictions - log_base_values
+        nonzero = np.abs(log_deltas) > 1e-12
+        slopes = np.exp(log_base_values)
+        slopes[nonzero] = (np.expm1(log_predictions[nonzero]) - np.expm1(log_base_values[nonzero])) / log_deltas[nonzero]
+
+        quantile_predictions = np.expm1(self.q25_q50_booster.inplace_predict(X_model_ready, validate_features=False))
+        predictions = postprocess_quantile_predictions(np.asarray(quantile_predictions).reshape(len(X), -1))[:, MEDIAN_QUANTILE_INDEX]
+        return {
+            "values": log_values * slopes[:, None],
+            "base_values": np.expm1(log_base_values),
+            "feature_names": self.feature_names,
+            "log_values": log_values,
+            "postprocessing_adjustments": predictions - np.expm1(log_predictions),
+        }
+
+
+# =========================
+# Incremental What-If
+# =========================
+
+class WhatIfSession:
+    """
+    Incremental what-if recomputation of one planner profile.
+
+    A planner session toggles one input at a time (e.g., a chronic condition checkbox) and
+    shows the four postprocessed quantiles and the SHAP cost drivers of the edited profile.
+    Instead of rerunning preprocessing, the quantile model, and SHAP from scratch, the session
+    caches the model-ready vector of the profile and the masked-evaluation matrix of its last
+    explanation (model-ready masked rows and their q50 outputs, keyed by background row and
+    masked-in differing features), and after an edit:
+
+      - recomputes only the model-ready columns affected by the changed inputs
+        (CompiledPreprocessor.transform_columns: own scaled, one-hot, or passthrough columns,
+        plus CHRONIC_COUNT or LIMITATION_COUNT for condition and limitation flags);
+      - reuses the q50 output of every masked row without a changed feature masked in (the
+        row is identical to the cached one);
+      - builds every other masked row from the cached row of the same background row and
+        unchanged masked-in features by patching only the affected columns, and scores these
+        rows in one batch of the q25/q50 booster. Rows without such a cached row are
+        preprocessed in full.
+
+    Permutation orders are drawn from a fixed seed for every explanation of the session, so
+    edits that keep the set of varying features reuse the same masks, and unchanged inputs do
+    not pick up sampling noise between edits. Explanations equal explainer.explain() with a
+    random state seeded by the same seed (partition mode has no seed).
+
+    The cache lives in memory only and is never persisted; it belongs to one session and
+    profile and is released with the session object.
+
+    Args:
+        explainer (PermutationShapExplainer or PartitionShapExplainer): Shared app explainer (not modified).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model (all quantile outputs).
+        profile (dict or pd.Series): Numeric codes of every SHAP input feature.
+        seed (int): Seed of the permutation orders.
+    """
+
+    def __init__(self, explainer, model, profile, seed=RANDOM_STATE):
+        self.explainer = explainer
+        self.preprocessor = explainer.preprocessor
+        self.feature_names = explainer.feature_names
+        self.booster = model.regressor_.get_booster()
+        self.inverse_func = model.inverse_func
+        self.seed = seed
+        self.x = self._to_vector(profile)
+        self.x_model_ready = self.preprocessor.transform(self.x[None, :])
+        self._row_keys = None  # Masked-evaluation matrix of the last explanation: sorted row keys,
+        self._rows_model_ready = None  # model-ready masked rows (float32, as scored by XGBoost),
+        self._row_outputs = None  # and their q50 outputs
+        self._changed_columns = np.arange(len(self.feature_names))
+        self.result = self._recompute()
+
+    def _to_vector(self, profile):
+        missing = [feature for feature in self.feature_names if feature not in profile]
+        if missing:
+            raise ValueError(f"WhatIfSession: Profile is missing the input features {missing}.")
+        return np.array([profile[feature] for feature in self.feature_names], dtype=float)
+
+    def _predict_quantiles(self, X_model_ready):
+        """Postprocessed quantiles of model-ready rows (all quantile outputs)."""
+        quantile_predictions = self.inverse_func(self.booster.inplace_predict(X_model_ready, validate_features=False))
+        return postprocess_quantile_predictions(np.asarray(quantile_predictions).reshape(len(X_model_ready), -1))
+
+    def _score_rows(self, X_masked, row_keys):
+        """q50 outputs of the distinct masked rows of an explanation, reusing the cached masked-evaluation matrix."""
+        rows_model_ready = np.empty((len(row_keys), len(self.preprocessor.feature_names_out)), dtype=np.float32)
+        outputs = np.empty(len(row_keys))
+        unchanged = np.zeros(len(row_keys), dtype=bool)
+        patched = np.zeros(len(row_keys), dtype=bool)
+        if self._row_keys is not None:
+            # Row of the same background row and unchanged masked-in features in the cache
+            changed_bits = int(self.explainer.feature_bits[self._changed_columns].sum())
+            base_keys = row_keys & ~changed_bits
+            position = np.searchsorted(self._row_keys, base_keys).clip(max=len(self._row_keys) - 1)
+            cached = self._row_keys[position] == base_keys
+            rows_model_ready[cached] = self._rows_model_ready[position[cached]]
+            unchanged = cached & (base_keys == row_keys)
+            outputs[unchanged] = self._row_outputs[position[unchanged]]
+            patched = cached & ~unchanged
+
+        # Changed features masked in: patch the affected model-ready columns of the cached row
+        if patched.any():
+            column_positions, column_values = self.preprocessor.transform_columns(X_masked[patched], self._changed_columns)
+            rows_model_ready[np.ix_(np.flatnonzero(patched), column_positions)] = column_values
+        new = ~(unchanged | patched)
+        if new.any():
+            rows_model_ready[new] = self.preprocessor.transform(X_masked[new])
+
+        scored = ~unchanged
+        if scored.any():
+            outputs[scored] = self.explainer.predict_model_ready(rows_model_ready[scored])
+        self._row_keys, self._rows_model_ready, self._row_outputs = row_keys, rows_model_ready, outputs
+        self._evaluation = {"reused_rows": int(unchanged.sum()), "patched_rows": int(patched.sum()), "new_rows": int(new.sum())}
+        return outputs
+
+    def _recompute(self):
+        self._evaluation = {"reused_rows": 0, "patched_rows": 0, "new_rows": 0}
+        values, base_value = self.explainer._explain_row(
+            self.x, self.explainer.max_evals, random_state=np.random.RandomState(self.seed), score_rows=self._score_rows,
+        )
+        result = {
+            "quantiles": self._predict_quantiles(self.x_model_ready)[0],
+            "values": values,
+            "base_value": float(base_value),
+            "feature_names": self.feature_names,
+            "evaluation": self._evaluation,
+        }
+        if hasattr(self.explainer, "group_matrix"):
+            result["group_values"] = values @ self.explainer.group_matrix
+            result["group_names"] = list(self.explainer.feature_groups)
+        return result
+
+    def update(self, changes):
+        """
+        Apply edited inputs and recompute the quantiles and SHAP values incrementally.
+
+        Args:
+            changes (dict): Input feature -> new numeric code.
+
+        Returns:
+            dict: quantiles (q25, q50, q75, q90) and SHAP values in 2023 dollars, base_value,
+                feature_names, group_values and group_names (partition mode), and evaluation
+                (reused, patched, and new masked rows).
+
+        Raises:
+            ValueError: If a changed feature is not a SHAP input feature.
+        """
+        unknown = [feature for feature in changes if feature not in self.feature_names]
+        if unknown:
+            raise ValueError(f"WhatIfSession: Unknown input features {unknown}.")
+        x = self.x.copy()
+        for feature, value in changes.items():
+            x[self.feature_names.index(feature)] = value
+        changed_columns = np.flatnonzero(~((x == self.x) | (np.isnan(x) & np.isnan(self.x))))
+        if len(changed_columns) == 0:
+            return self.result
+
+        column_positions, column_values = self.preprocessor.transform_columns(x[None, :], changed_columns)
+        self.x_model_ready = self.x_model_ready.copy()
+        self.x_model_ready[:, column_positions] = column_values
+        self.x, self._changed_columns = x, changed_columns
+        self.result = self._recompute()
+        return self.result
+
+
+# =========================
+# Counterfactual Sweep
+# =========================
+
+QUANTILE_NAMES = ["q25", "q50", "q75", "q90"]  # Quantile model outputs, in order
+MODEL_PRICE_YEAR = 2023
+# Features a planner can sweep for an otherwise fixed profile, with their default grids (numeric MEPS codes)
+SWEEP_FEATURE_VALUES = {
+    "AGE23X": np.arange(18, 86, dtype=float),  # Ages 18-85 (85 = top-coded 85+)
+    "INSCOV23": np.array(list(CATEGORY_LABELS_PIPELINE["INSCOV23"]), dtype=float),  # Any private, public only, uninsured
+    "RTHLTH31": np.array([1.0, 2.0, 3.0, 4.0, 5.0]),  # Excellent to poor
+}
+SWEEP_QUANTILES = ["q50", "q90"]
+
+
+class CounterfactualSweep:
+    """
+    Vectorized counterfactual sweep of the quantile estimates over one or two input features.
+
+    Planners compare the plan-around (q50) and high-cost (q90) estimates of a profile across
+    ages, insurance statuses, or health ratings with all other inputs fixed. The sweep builds the
+    full grid of varied values as one batch: the profile is preprocessed once and only the
+    model-ready columns of the varied features are recomputed for the grid
+    (CompiledPreprocessor.transform_columns). One in-place booster call predicts all quantiles,
+    which are postprocessed and converted from 2023 dollars with the medical inflation factor
+    exactly once before rounding.
+
+    Predictions are returned to the caller only; the sweep does not persist or log them.
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline (models/preprocessor.joblib).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model (models/xgb_quantile_model.ubj).
+        medical_inflation (dict, optional): Medical inflation artifact (app/data/medical_inflation.json).
+            None keeps 2023 dollars.
+    """
+
+    def __init__(self, preprocessor, model, medical_inflation=None):
+        self.preprocessor = CompiledPreprocessor(preprocessor)
+        self.feature_names = self.preprocessor.input_features
+        self.booster = model.regressor_.get_booster()
+        self.inverse_func = model.inverse_func
+        if medical_inflation is None:
+            self.inflation_factor, output_price_year = 1.0, MODEL_PRICE_YEAR
+        else:
+            self.inflation_factor = float(medical_inflation["medical_cost_inflation_factor"])
+            output_price_year = int(medical_inflation["target_period"][:4])
+        self.currency_context = {
+            "currency": "USD",
+            "model_price_year": MODEL_PRICE_YEAR,
+            "output_price_year": output_price_year,
+            "inflation_factor": self.inflation_factor,
+        }
+
+    def sweep(self, profile, features, values=None, quantiles=SWEEP_QUANTILES):
+        """
+        Quantile curves of a profile over a grid of one or two swept features.
+
+        Args:
+            profile (dict or pd.Series): Numeric codes of every SHAP input feature.
+            features (list[str]): One or two features of SWEEP_FEATURE_VALUES.
+            values (dict, optional): Feature -> grid values (defaults to SWEEP_FEATURE_VALUES).
+            quantiles (list[str]): Returned quantiles of QUANTILE_NAMES.
+
+        Returns:
+            dict: currency_context, features, values (grid per feature), and one curve per quantile
+                in whole output-year dollars with shape (n_values,) or (n_values_1, n_values_2).
+
+        Raises:
+            ValueError: If the features, quantiles, or profile are invalid.
+        """
+        features = list(features)
+        if not 1 <= len(features) <= 2 or len(set(features)) != len(features):
+            raise ValueError("CounterfactualSweep: Sweep one or two distinct features.")
+        unknown = [feature for feature in features if feature not in SWEEP_FEATURE_VALUES]
+        unknown_quantiles = [quantile for quantile in quantiles if quantile not in QUANTILE_NAMES]
+        if unknown or unknown_quantiles:
+            raise ValueError(f"CounterfactualSweep: Unknown sweep features {unknown} or quantiles {unknown_quantiles}. "
+                             f"Use features of {list(SWEEP_FEATURE_VALUES)} and quantiles of {QUANTILE_NAMES}.")
+        missing = [feature for feature in self.feature_names if feature not in profile]
+        if missing:
+            raise ValueError(f"CounterfactualSweep: Profile is missing the input features {missing}.")
+
+        x = np.array([profile[feature] for feature in self.feature_names], dtype=float)
+        grids = [np.asarray((values or {}).get(feature, SWEEP_FEATURE_VALUES[feature]), dtype=float) for feature in features]
+        grid_shape = tuple(len(grid) for grid in grids)
+        columns = [self.feature_names.index(feature) for feature in features]
+
+        # Grid rows: the fixed profile with the swept columns set to every combination of values
+        X_grid = np.repeat(x[None, :], np.prod(grid_shape), axis=0)
+        X_grid[:, columns] = np.stack([mesh.ravel() for mesh in np.meshgrid(*grids, indexing="ij")], axis=1)
+        X_model_ready = np.repeat(self.preprocessor.transform(x[None, :]), len(X_grid), axis=0)
+        positions, column_values = self.preprocessor.transform_columns(X_grid, columns)
+        X_model_ready[:, positions] = column_values
+
+        # One prediction of all quantiles, inflation applied once to the 2023-dollar estimates
+        quantile_predictions = self.inverse_func(self.booster.inplace_predict(X_model_ready, validate_features=False))
+        predictions = postprocess_quantile_predictions(np.asarray(quantile_predictions).reshape(len(X_grid), -1))
+        predictions = np.round(predictions * self.inflation_factor)
+        return {
+            "currency_context": dict(self.currency_context),
+            "features": features,
+            "values": {feature: grid.tolist() for feature, grid in zip(features, grids)},
+            **{quantile: predictions[:, QUANTILE_NAMES.index(quantile)].reshape(grid_shape).tolist() for quantile in quantiles},
+        }
+
+
+# =========================
+# Asynchronous Explanation Jobs
+# =========================
+
+EXPLANATION_JOB_WORKERS = 2  # Worker threads computing explanations in the background
+EXPLANATION_JOB_MAX_PENDING = 32  # Max. queued and running jobs (further submissions are rejected, not queued)
+EXPLANATION_RESULT_TTL = 60.0  # Seconds a finished result is kept in memory before it expires
+EXPLANATION_LATENCY_WINDOW = 1000  # Recent job latencies kept for the p50/p95 metrics
+
+
+class ExplanationJobQueue:
+    """
+    Explanation jobs decoupled from prediction latency, with short-lived in-memory results.
+
+    A prediction returns immediately with the handle of a submitted explanation job, and a
+    bounded pool of worker threads computes the explanation in the background (NumPy and
+    XGBoost release the GIL during scoring). Each handle is a random token mapped to its future;
+    there are no other request identifiers.
+
+    Results stay in process memory only: a finished result is removed on its first read or
+    after result_ttl seconds, whichever comes first, and is never written to disk or logs.
+    Submissions beyond max_pending queued and running jobs are rejected instead of blocking
+    the prediction. metrics() reports aggregate backpressure counters and gauges only.
+
+        jobs = ExplanationJobQueue(lambda X: get_top_drivers(explainer.explain(X)["values"][0]))
+        handle = jobs.submit(X_profile)  # None: queue full, explanation unavailable
+        jobs.result(handle)  # {"status": "pending"}, then {"status": "ready", "explanation": [...]}
+
+    Args:
+        explain (callable): Maps one submitted profile to its explanation (e.g., top drivers).
+        n_workers (int): Number of worker threads.
+        max_pending (int): Maximum number of queued and running jobs.
+        result_ttl (float): Seconds a finished result is kept before it expires.
+        clock (callable): Monotonic time source in seconds.
+    """
+
+    def __init__(self, explain, n_workers=EXPLANATION_JOB_WORKERS, max_pending=EXPLANATION_JOB_MAX_PENDING,
+                 result_ttl=EXPLANATION_RESULT_TTL, clock=time.monotonic):
+        self.explain = explain
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="explanation-job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # handle -> {"future": Future, "finished": finish time or None}
+        self._n_pending = 0
+        self._latencies = deque(maxlen=EXPLANATION_LATENCY_WINDOW)
+        self._counts = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "expired": 0}
+
+    def submit(self, X):
+        """
+        Submit an explanation job (returns immediately).
+
+        Args:
+            X: Profile passed to explain (e.g., a one-row DataFrame of SHAP_INPUT_FEATURES).
+
+        Returns:
+            str or None: Random handle of the job, or None if the queue is full (job rejected).
+        """
+        with self._lock:
+            self._evict_expired()
+            if self._n_pending >= self.max_pending:
+                self._counts["rejected"] += 1
+                return None
+            handle = secrets.token_urlsafe(16)
+            self._n_pending += 1
+            self._counts["submitted"] += 1
+            job = {"future": None, "finished": None}
+            self._jobs[handle] = job
+        job["future"] = self._executor.submit(self._run, job, X, self.clock())
+        return handle
+
+    def _run(self, job, X, submitted):
+        try:
+            return self.explain(X)
+        finally:
+            with self._lock:
+                job["finished"] = self.clock()
+                self._n_pending -= 1
+                self._latencies.append(job["finished"] - submitted)
+
+    def result(self, handle, timeout=0):
+        """
+        Status of a job, with its explanation once ready (a ready or failed job is removed on this read).
+
+        Args:
+            handle (str): Handle returned by submit().
+            timeout (float or None): Seconds to wait for a pending job (None: until it finishes). Defaults to 0.
+
+        Returns:
+            dict: {"status": "pending"}, {"status": "ready", "explanation": ...}, {"status": "failed"},
+                or {"status": "unavailable"} for unknown, expired, or already read handles.
+        """
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(handle)
+        if job is None:
+            return {"status": "unavailable"}
+        try:
+            explanation = job["future"].result(timeout=timeout)
+            status = {"status": "ready", "explanation": explanation}
+        except FutureTimeoutError:
+            return {"status": "pending"}
+        except Exception:
+            status = {"status": "failed"}  # Error details are not exposed (they may contain profile values)
+        with self._lock:
+            if self._jobs.pop(handle, None) is None:  # Expired or read concurrently
+                return {"status": "unavailable"}
+            self._counts["completed" if status["status"] == "ready" else "failed"] += 1
+        return status
+
+    def _evict_expired(self):
+        """Remove finished results older than result_ttl (called with the lock held)."""
+        expired_before = self.clock() - self.result_ttl
+        expired = [handle for handle, job in self._jobs.items() if job["finished"] is not None and job["finished"] < expired_before]
+        for handle in expired:
+            del self._jobs[handle]
+        self._counts["expired"] += len(expired)
+
+    def metrics(self):
+        """
+        Aggregate backpressure metrics (no handles, profiles, or explanations).
+
+        Returns:
+            dict: queue_depth (queued and running jobs), stored_results (finished, not yet read or
+                expired), counts of submitted, rejected, completed (read), failed, and expired jobs,
+                and latency_p50/latency_p95 in seconds from submission to finish (None before the first job).
+        """
+        with self._lock:
+            self._evict_expired()
+            latencies = np.array(self._latencies)
+            return {
+                "queue_depth": self._n_pending,
+                "stored_results": sum(job["finished"] is not None for job in self._jobs.values()),
+                **self._counts,
+                "latency_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "latency_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            }
+
+    def close(self):
+        """Finish running jobs, cancel queued ones, and drop all stored results."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._jobs.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# =========================
+# Batch Explanations
+# =========================
+
+BATCH_EXPLAIN_MAX_ROWS = 100  # Per-request row budget (larger requests are rejected, not truncated)
+BATCH_EXPLAIN_MAX_CONCURRENT_ROWS = 200  # Global cap on rows being explained by all concurrent requests
+
+_batch_explainer = None  # Built once per worker process by _init_batch_worker
+
+
+def _init_batch_worker(preprocessor, model, background, background_weights, explanation_mode, max_evals):
+    """Build the explainer of a batch worker process (one XGBoost thread, so workers do not share cores)."""
+    global _batch_explainer
+    model.regressor_.get_booster().set_param({"nthread": 1})
+    _batch_explainer = create_shap_explainer(explanation_mode, preprocessor, model, background, background_weights, max_evals=max_evals)
+
+
+def _explain_batch_chunk(X_chunk, row_seeds, top_k):
+    """Top drivers of the rows of one chunk in a worker process (per-row seeds: independent of chunking and worker)."""
+    return [
+        get_top_drivers(
+            _batch_explainer._explain_row(x, _batch_explainer.max_evals, random_state=np.random.RandomState(row_seed))[0],
+            _batch_explainer.feature_names,
+            top_k,
+        )
+        for x, row_seed in zip(X_chunk, row_seeds)
+    ]
+
+
+class BatchExplainer:
+    """
+    Batch explanations in a process pool with a per-request row budget and a global concurrency cap.
+
+    The pool is started once (e.g., at service startup), and its initializer builds the explainer
+    once per worker process with one XGBoost thread. explain_batch() splits the explained rows of
+    a request into one contiguous chunk per worker and returns the top drivers of every row in
+    request order. Each row is explained with its own permutation seed (seed + row position), so
+    the drivers do not depend on the number of workers, the chunking, or earlier requests.
+
+    A request with more than max_rows_per_request rows is rejected instead of truncated. A shared
+    row budget caps the rows explained at the same time by all requests (max_concurrent_rows), so
+    batch traffic cannot occupy every worker: requests wait until enough rows are free.
+
+    Args:
+        preprocessor (Pipeline): Fitted preprocessing pipeline (models/preprocessor.joblib).
+        model (TransformedTargetRegressor): Fitted XGBoost quantile model (models/xgb_quantile_model.ubj).
+        background (pd.DataFrame or np.ndarray): SHAP background rows of SHAP_INPUT_FEATURES.
+        background_weights (array-like, optional): Population weight per background row (None: equal weights).
+        explanation_mode (str): "permutation" or "partition" (SHAP metadata: explainer_contract.algorithm).
+        max_evals (int): Evaluation budget of the permutation mode.
+        n_workers (int, optional): Worker processes. Defaults to None (CPU count).
+        max_rows_per_request (int): Per-request row budget.
+        max_concurrent_rows (int): Rows explained at the same time across all requests.
+        seed (int): Base permutation seed.
+
+    Raises:
+        ValueError: If the per-request row budget exceeds the concurrency cap.
+    """
+
+    def __init__(self, preprocessor, model, background, background_weights=None, explanation_mode=SHAP_EXPLANATION_MODE,
+                 max_evals=SHAP_MAX_EVALS, n_workers=None, max_rows_per_request=BATCH_EXPLAIN_MAX_ROWS,
+                 max_concurrent_rows=BATCH_EXPLAIN_MAX_CONCURRENT_ROWS, seed=RANDOM_STATE):
+        if max_rows_per_request > max_concurrent_rows:
+            raise ValueError("BatchExplainer: max_rows_per_request must not exceed max_concurrent_rows.")
+        if isinstance(background, pd.DataFrame):
+            background = background.loc[:, SHAP_INPUT_FEATURES]
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.max_rows_per_request = max_rows_per_request
+        self.max_concurrent_rows = max_concurrent_rows
+        self.seed = seed
+        self._active_rows = 0
+        self._rows_available = threading.Condition()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=_init_batch_worker,
+            initargs=(preprocessor, model, background, background_weights, explanation_mode, max_evals),
+        )
+
+    def explain_batch(self, X, top_k=SHAP_TOP_K, timeout=None):
+        """
+        Top drivers of every row of a batch request, in request order.
+
+        Args:
+            X (pd.DataFrame or np.ndarray): Rows of SHAP_INPUT_FEATURES (numeric codes).
+            top_k (int): Number of drivers per row.
+            timeout (float, optional): Seconds to wait for free rows under the concurrency cap. Defaults to None (no limit).
+
+        Returns:
+            list[list[tuple[str, float]]]: (feature, contribution) pairs per row, largest absolute contribution first.
+
+        Raises:
+            ValueError: If the request has more rows than max_rows_per_request.
+            TimeoutError: If the concurrency cap does not free enough rows within timeout.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, SHAP_INPUT_FEATURES]
+        X = np.asarray(X, dtype=float).reshape(-1, len(SHAP_INPUT_FEATURES))
+        n_rows = len(X)
+        if n_rows > self.max_rows_per_request:
+            raise ValueError(f"BatchExplainer: {n_rows} rows exceed the per-request budget of {self.max_rows_per_request} explained rows.")
+        if n_rows == 0:
+            return []
+
+        with self._rows_available:
+            if not self._rows_available.wait_for(lambda: self._active_rows + n_rows <= self.max_concurrent_rows, timeout=timeout):
+                raise TimeoutError(f"BatchExplainer: No capacity for {n_rows} rows within {timeout} s.")
+            self._active_rows += n_rows
+        try:
+            chunks = np.array_split(np.arange(n_rows), min(self.n_workers, n_rows))
+            futures = [self._executor.submit(_explain_batch_chunk, X[rows], self.seed + rows, top_k) for rows in chunks]
+            return [drivers for future in futures for drivers in future.result()]
+        finally:
+            with self._rows_available:
+                self._active_rows -= n_rows
+                self._rows_available.notify_all()
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# =========================
+# Global Importance
+# =========================
+
+def summarize_global_importance(values, weights, feature_names=SHAP_INPUT_FEATURES, feature_groups=None):
+    """
+    Survey-weighted global importance of per-row SHAP values.
+
+    Features are ranked by their weighted mean absolute SHAP value, the average dollar impact on
+    the q50 estimate of the represented population. Groups (default: get_feature_groups()) are
+    ranked by the weighted mean absolute sum of their members' values.
+
+    Args:
+        values (np.ndarray): SHAP values in 2023 dollars with shape (n_rows, n_features).
+        weights (array-like): Survey weight per row (e.g., PERWT23F).
+        feature_names (list): Feature name per column of values.
+        feature_groups (dict, optional): Group name -> member features.
+
+    Returns:
+        dict: rows, population (sum of weights), and ranked features and groups with
+            mean_abs_shap_2023_usd and mean_shap_2023_usd.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    feature_groups = get_feature_groups() if feature_groups is None else feature_groups
+    group_values = np.column_stack([
+        values[:, [feature_names.index(feature) for feature in members]].sum(axis=1) for members in feature_groups.values()
+    ])
+
+    def rank(names, columns):
+        mean_abs = np.average(np.abs(columns), axis=0, weights=weights)
+        mean = np.average(columns, axis=0, weights=weights)
+        order = np.argsort(-mean_abs, kind="stable")
+        return [
+            {"name": names[i], "rank": rank + 1, "mean_abs_shap_2023_usd": float(mean_abs[i]), "mean_shap_2023_usd": float(mean[i])}
+            for rank, i in enumerate(order)
+        ]
+
+    return {
+        "rows": len(values),
+        "population": float(weights.sum()),
+        "features": rank(list(feature_names), values),
+        "groups": rank(list(feature_groups), group_values),
+    }
+
+
+# =========================
+# SHAP Background
+# =========================
+
+def _weighted_kmedoids(Z, weights, n_clusters, random_state, max_iter=SHAP_KMEDOIDS_MAX_ITER, chunk_size=2048):
+    """
+    Weighted k-medoids (alternating assignment and medoid update) on an embedding Z.
+
+    Starts from weighted k-means++ seeds. Each update makes the member with the smallest
+    weighted sum of Euclidean distances to its cluster the new medoid.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Medoid row positions and the cluster label of every row.
+    """
+    _, medoids = kmeans_plusplus(Z, n_clusters, sample_weight=weights, random_state=random_state)
+    for _ in range(max_iter):
+        labels = pairwise_distances_argmin(Z, Z[medoids])
+        new_medoids = medoids.copy()
+        for cluster in range(n_clusters):
+            members = np.flatnonzero(labels == cluster)
+            if len(members) == 0:
+                continue
+            costs = np.concatenate([
+                euclidean_distances(Z[members[i:i + chunk_size]], Z[members]) @ weights[members]
+                for i in range(0, len(members), chunk_size)
+            ])
+            new_medoids[cluster] = members[np.argmin(costs)]
+        if np.array_equal(new_medoids, medoids):
+            break
+        medoids = new_medoids
+    return medoids, pairwise_distances_argmin(Z, Z[medoids])
+
+
+def _summarization_space(X, weights, preprocessor, model):
+    """
+    Clustering space of the background summarization: model-ready features plus the predicted cost.
+
+    The SHAP baseline is the (weighted) mean q50 over the background rows. Clustering on the
+    features alone groups rows with very different predicted costs, and the representatives of
+    heavy-tailed cost clusters then miss the training baseline. The standardized square root of
+    the postprocessed q50 (scaled by SHAP_BACKGROUND_PREDICTION_SCALE) keeps clusters homogeneous
+    in predicted cost.
+    """
+    compiled_preprocessor = CompiledPreprocessor(preprocessor)
+    Z = compiled_preprocessor.transform(X)
+    booster = model.regressor_.get_booster()
+    quantile_predictions = np.asarray(model.inverse_func(booster.inplace_predict(Z, validate_features=False))).reshape(len(Z), -1)
+    root_cost = np.sqrt(postprocess_quantile_predictions(quantile_predictions)[:, MEDIAN_QUANTILE_INDEX])
+    root_cost_mean = np.average(root_cost, weights=weights)
+    root_cost_std = np.sqrt(np.average((root_cost - root_cost_mean) ** 2, weights=weights)) or 1.0
+    return np.column_stack([Z, SHAP_BACKGROUND_PREDICTION_SCALE * (root_cost - root_cost_mean) / root_cost_std])
+
+
+def build_shap_background(X, weights, background_n, method=SHAP_BACKGROUND_METHOD, preprocessor=None, model=None, random_state=RANDOM_STATE):
+    """
+    Build a survey-weighted SHAP background from preprocessor-input training rows.
+
+    Methods:
+      - "resample": Weighted sample with replacement using the person weights (equal background
+        weights). High-weight respondents may appear more than once.
+      - "kmeans": Weighted k-means in the model-ready feature space extended by the predicted
+        cost (_summarization_space). Each cluster is represented by its member closest to the
+        weighted centroid (averaged MEPS codes are not valid preprocessor inputs) and weighted by
+        the cluster's population weight.
+      - "kmedoids": Weighted k-medoids in the same space. Each medoid is weighted by the
+        population weight of the rows assigned to it.
+
+    Summarized backgrounds cover the population with far fewer rows than resampling, and
+    SHAP cost scales linearly with the number of background rows.
+
+    Args:
+        X (pd.DataFrame): Training rows with the SHAP_INPUT_FEATURES columns (numeric codes).
+        weights (array-like): Person weights (PERWT23F) of the rows.
+        background_n (int): Number of background rows.
+        method (str): "resample", "kmeans", or "kmedoids".
+        preprocessor (Pipeline, optional): Fitted preprocessing pipeline (required for "kmeans" and "kmedoids").
+        model (TransformedTargetRegressor, optional): Fitted XGBoost quantile model (required for "kmeans" and "kmedoids").
+        random_state (int): Random seed.
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: Background rows and their weights (normalized to sum to 1).
+
+    Raises:
+        ValueError: If the method is unknown or a summarization method has no preprocessor or model.
+    """
+    if method not in SHAP_BACKGROUND_METHODS:
+        raise ValueError(f"Unknown SHAP background method '{method}'. Expected one of {SHAP_BACKGROUND_METHODS}.")
+    X = X.loc[:, SHAP_INPUT_FEATURES]
+    weights = np.asarray(weights, dtype=float)
+    if method == "resample":
+        background = X.sample(n=background_n, weights=weights, replace=True, random_state=random_state)
+        return background, np.full(background_n, 1 / background_n)
+    if preprocessor is None or model is None:
+        raise ValueError(f"The '{method}' SHAP background method requires the fitted preprocessor and model.")
+
+    Z = _summarization_space(X, weights, preprocessor, model)
+    if method == "kmeans":
+        kmeans = KMeans(n_clusters=background_n, n_init=1, random_state=random_state).fit(Z, sample_weight=weights)
+        labels = kmeans.labels_
+        representatives = np.empty(background_n, dtype=np.int64)
+        for cluster in range(background_n):
+            members = np.flatnonzero(labels == cluster)
+            distances = euclidean_distances(Z[members], kmeans.cluster_centers_[[cluster]])[:, 0]
+            representatives[cluster] = members[np.argmin(distances)]
+    else:
+        representatives, labels = _weighted_kmedoids(Z, weights, background_n, random_state)
+    background_weights = np.bincount(labels, weights=weights, minlength=background_n)
+    return X.iloc[representatives], background_weights / background_weights.sum()
+
+
+def save_shap_background(background, background_weights, filepath):
+    """Save background rows with their weights (SHAP_BACKGROUND_WEIGHT_COLUMN) as Parquet."""
+    background.assign(**{SHAP_BACKGROUND_WEIGHT_COLUMN: background_weights}).to_parquet(filepath)
+
+
+def load_shap_background(filepath):
+    """
+    Load a SHAP background saved by save_shap_background.
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: Background rows (SHAP_INPUT_FEATURES) and their weights.
+    """
+    df_background = pd.read_parquet(filepath)
+    if SHAP_BACKGROUND_WEIGHT_COLUMN not in df_background:  # Unweighted (resampled) background
+        return df_background.loc[:, SHAP_INPUT_FEATURES], np.full(len(df_background), 1 / len(df_background))
+    return df_background.loc[:, SHAP_INPUT_FEATURES], df_background[SHAP_BACKGROUND_WEIGHT_COLUMN].to_numpy()
+
+
+def validate_shap_background(background_baseline, training_baseline, max_abs_relative_difference=SHAP_BASELINE_REL_DIFF_MAX):
+    """
+    Compare the SHAP baseline of a background with the weighted training baseline.
+
+    Args:
+        background_baseline (float): (Weighted) mean postprocessed q50 of the background rows.
+        training_baseline (float): Weighted mean postprocessed q50 of the training data.
+        max_abs_relative_difference (float): Acceptance threshold.
+
+    Returns:
+        dict: "background_validation" block of the SHAP metadata artifact.
+    """
+    relative_difference = float(background_baseline / training_baseline - 1)
+    return {
+        "method": "baseline_relative_difference",
+        "comparison": "compare mean postprocessed q50 of background vs. full training data",
+        "background_baseline_2023_usd": float(background_baseline),
+        "weighted_training_baseline_2023_usd": float(training_baseline),
+        "relative_difference": relative_difference,
+        "absolute_relative_difference": abs(relative_difference),
+        "max_allowed_absolute_relative_difference": max_abs_relative_difference,
+        "passed": abs(relative_difference) <= max_abs_relative_difference,
+    }
+
+
+def create_shap_metadata(artifacts, background_n, background_method, background_validation, max_evals, configuration_benchmark=None, explanation_mode=SHAP_EXPLANATION_MODE):
+    """
+    Create the SHAP metadata artifact (technical specifications: SHAP Metadata Artifact Contract).
+
+    Args:
+        artifacts (dict): Paths of the "model", "preprocessor", and "background" artifacts.
+        background_n (int): Number of background rows.
+        background_method (str): build_shap_background method.
+        background_validation (dict): Result of validate_shap_background.
+        max_evals (int): Evaluation budget per explanation (partition mode: distinct coalitions per explanation).
+        configuration_benchmark (dict, optional): Benchmark summary of the selected configuration (scripts/benchmark_shap.py).
+        explanation_mode (str): "permutation" (PermutationShapExplainer) or "partition" (PartitionShapExplainer).
+
+    Returns:
+        dict: SHAP metadata.
+    """
+    shap_metadata = {
+        "schema_version": 1,
+        "artifacts": artifacts,
+        "data_source": "MEPS 2023 (HC-251), training split",
+        "reference_population": "U.S. civilian noninstitutionalized adults represented by MEPS training rows",
+        "explained_output": {
+            "quantile": "q50",
+            "meaning": "plan-around estimate, predicted median out-of-pocket cost",
+            "unit": "USD",
+            "currency_year": 2023,
+            "postprocessed": True,
+            "inflation_adjusted": False,
+        },
+        "background_sample": {
+            "feature_set": "preprocessor_input",
+            "feature_count": len(SHAP_INPUT_FEATURES),
+            "rows": background_n,
+            "method": background_method,
+            "sampling_method": SHAP_BACKGROUND_SAMPLING_DESCRIPTIONS[background_method],
+            "weight_column": SHAP_BACKGROUND_WEIGHT_COLUMN,
+            "random_state": RANDOM_STATE,
+        },
+        "explainer_contract": {
+            "algorithm": explanation_mode,
+            "prediction_function": "predict_median_cost",
+            "input_feature_set": "preprocessor_input",
+            "input_feature_count": len(SHAP_INPUT_FEATURES),
+            "max_evals": max_evals,
+            "seed": RANDOM_STATE,
+            "prediction_pipeline": [
+                {"operation": "preprocess", "artifact_ref": "preprocessor", "output_feature_set": "model_ready", "output_feature_count": 40},
+                {"operation": "predict_quantiles", "artifact_ref": "model", "outputs": ["q25", "q50", "q75", "q90"], "includes_inverse_target_transformation": True},
+                {"operation": "postprocess_quantiles", "rules": ["non_negative", "monotonic"]},
+                {"operation": "select_quantile", "quantile": "q50"},
+            ],
+        },
+        "background_validation": background_validation,
+    }
+    if explanation_mode == "partition":
+        shap_metadata["explainer_contract"]["feature_hierarchy"] = SHAP_FEATURE_HIERARCHY
+    if configuration_benchmark is not None:
+        shap_metadata["configuration_benchmark"] = configuration_benchmark
+    return shap_metadata
+
+
+# =========================
+# Configuration Benchmark
+# =========================
+
+def estimate_mask_evaluations(max_evals, n_features=len(SHAP_INPUT_FEATURES)):
+    """Permutation rounds and mask evaluations of an evaluation budget (2 * n_features + 1 masks per round)."""
+    masks_per_round = 2 * n_features + 1
+    rounds = max_evals // masks_per_round
+    return rounds, rounds * masks_per_round
+
+
+def calculate_top_k_stability(values, reference_values, top_k=SHAP_TOP_K):
+    """
+    Evaluate the user-facing top-k drivers of a candidate configuration against the reference.
+
+    Args:
+        values (np.ndarray): Candidate SHAP values with shape (n_profiles, n_features).
+        reference_values (np.ndarray): Reference SHAP values of the same profiles.
+        top_k (int): Number of drivers shown to users.
+
+    Returns:
+        dict: Top-k overlap, sign stability of material shared drivers, dollar drift of shared
+            drivers, and whether each acceptance criterion passed.
+    """
+    overlap_counts, matched_abs_deltas = [], []
+    sign_comparisons, sign_reversals = 0, 0
+    for row_values, row_reference in zip(values, reference_values):
+        reference_top = np.argsort(np.abs(row_reference), kind="stable")[::-1][:top_k]
+        candidate_top = np.argsort(np.abs(row_values), kind="stable")[::-1][:top_k]
+        shared_top = np.intersect1d(reference_top, candidate_top)
+        overlap_counts.append(len(shared_top))
+        matched_abs_deltas.extend(np.abs(row_values[shared_top] - row_reference[shared_top]))
+
+        material_shared = shared_top[np.abs(row_reference[shared_top]) >= SHAP_MATERIAL_CONTRIBUTION_MIN_2023_USD]
+        sign_comparisons += len(material_shared)
+        sign_reversals += int(np.count_nonzero(np.sign(row_values[material_shared]) != np.sign(row_reference[material_shared])))
+
+    match_row_share = float(np.mean(np.asarray(overlap_counts) >= SHAP_MIN_TOP_K_MATCHES))
+    median_matched_abs_delta = float(np.median(matched_abs_deltas)) if matched_abs_deltas else float("nan")
+    top_k_overlap_passed = match_row_share >= SHAP_MIN_TOP_K_MATCH_ROW_SHARE
+    sign_stability_passed = sign_reversals == 0
+    dollar_drift_passed = bool(median_matched_abs_delta <= SHAP_MEDIAN_TOP_K_ABS_DELTA_MAX_2023_USD)  # False for NaN
+    return {
+        "mean_top_k_overlap": float(np.mean(overlap_counts)),
+        "share_rows_with_min_top_k_matches": match_row_share,
+        "top_k_overlap_passed": top_k_overlap_passed,
+        "material_sign_comparison_count": sign_comparisons,
+        "material_sign_reversal_count": sign_reversals,
+        "sign_stability_passed": sign_stability_passed,
+        "median_matched_top_k_abs_delta_2023_usd": median_matched_abs_delta,
+        "dollar_drift_passed": dollar_drift_passed,
+        "explanation_stability_passed": top_k_overlap_passed and sign_stability_passed and dollar_drift_passed,
+    }
+
+
+def summarize_shap_configuration(values, base_values, predictions, latencies, reference_values, reference_base_values):
+    """
+    Latency, stability, drift, and additivity of one SHAP configuration against the reference.
+
+    Args:
+        values (np.ndarray): SHAP values with shape (n_profiles, n_features).
+        base_values (np.ndarray): SHAP baselines per profile.
+        predictions (np.ndarray): Postprocessed q50 predictions of the profiles (predict_median_cost).
+        latencies (np.ndarray): Per-profile explanation latency in seconds.
+        reference_values (np.ndarray): Reference SHAP values of the same profiles.
+        reference_base_values (np.ndarray): Reference SHAP baselines.
+
+    Returns:
+        dict: Summary metrics (JSON-serializable).
+    """
+    additivity_abs_error = np.abs(predictions - (base_values + values.sum(axis=1)))
+    return {
+        "p50_latency_s": float(np.percentile(latencies, 50)),
+        "p90_latency_s": float(np.percentile(latencies, 90)),
+        "p95_latency_s": float(np.percentile(latencies, 95)),
+        **calculate_top_k_stability(values, reference_values),
+        "mean_all_feature_abs_delta_2023_usd": float(np.mean(np.abs(values - reference_values))),
+        "median_baseline_abs_delta_2023_usd": float(np.median(np.abs(base_values - reference_base_values))),
+        "median_additivity_abs_error_2023_usd": float(np.median(additivity_abs_error)),
+        "p95_additivity_abs_error_2023_usd": float(np.percentile(additivity_abs_error, 95)),
+        "additivity_passed": bool(np.percentile(additivity_abs_error, 95) <= SHAP_ADDITIVITY_ABS_ERROR_MAX_2023_USD),
+    }
+
+
+def evaluate_tree_shap_fidelity(values, postprocessing_adjustments, latencies, reference_values):
+    """
+    Fidelity of the hybrid TreeSHAP explanations (TreeShapExplainer) against permutation SHAP.
+
+    The app may switch to TreeSHAP only if its top-k drivers agree with the permutation SHAP
+    reference: the top-k overlap and sign stability criteria of calculate_top_k_stability. The
+    dollar drift is reported but not required, because the two explainers use different baselines.
+
+    Args:
+        values (np.ndarray): TreeSHAP values in 2023 dollars with shape (n_profiles, n_features).
+        postprocessing_adjustments (np.ndarray): TreeSHAP postprocessing adjustments per profile.
+        latencies (np.ndarray): Per-profile TreeSHAP latency in seconds.
+        reference_values (np.ndarray): Permutation SHAP values of the same profiles.
+
+    Returns:
+        dict: Fidelity report (JSON-serializable) with switch_allowed.
+    """
+    stability = calculate_top_k_stability(values, reference_values)
+    return {
+        "p50_latency_s": float(np.percentile(latencies, 50)),
+        "p95_latency_s": float(np.percentile(latencies, 95)),
+        **stability,
+        "mean_all_feature_abs_delta_2023_usd": float(np.mean(np.abs(values - reference_values))),
+        "share_rows_with_postprocessing_adjustment": float(np.mean(np.abs(postprocessing_adjustments) > SHAP_ADDITIVITY_ABS_ERROR_MAX_2023_USD)),
+        "switch_allowed": bool(stability["top_k_overlap_passed"] and stability["sign_stability_passed"]),
+    }
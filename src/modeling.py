@@ -1,26 +1,48 @@
 # Standard library imports
 import contextlib  # to train model without MLflow tracking using a null context
+import hashlib
 import json
+import os
+import queue
+import re
+import shutil
+import threading
 import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from pathlib import Path
 
 # Third-party library imports
 import joblib
 import mlflow
+from mlflow import MlflowClient
+from mlflow.data.dataset_source_registry import resolve_dataset_source
+from mlflow.data.meta_dataset import MetaDataset
+from mlflow.entities import Metric, Param
+from mlflow.types import Schema
 import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.base import clone
 from sklearn.compose import TransformedTargetRegressor
-from sklearn.preprocessing import PolynomialFeatures
+from sklearn.preprocessing import PolynomialFeatures, FunctionTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.dummy import DummyRegressor  # for median baseline prediction
 from sklearn.linear_model import LinearRegression, ElasticNet
-from sklearn.svm import SVR
+from sklearn.svm import SVR, LinearSVR
+from sklearn.kernel_approximation import Nystroem
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.ensemble import RandomForestRegressor
+import xgboost
 from xgboost import XGBRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split, StratifiedKFold
 
 # Local imports
-from src.constants import TARGET_COLUMN, RANDOM_STATE
+from src.constants import RANDOM_STATE, TARGET_COLUMN, WEIGHT_COLUMN
+from src.stats import create_stratification_bins
+from src.pipeline import postprocess_quantile_predictions  # Re-exported for training scripts and notebooks
 
 # Paths (relative to project root)
 RAW_DATA_PATH = "data/h251.sas7bdat"
@@ -30,17 +52,143 @@ TEST_PREPROCESSOR_INPUT_DATA_PATH = "data/test_data_preprocessor_input.parquet"
 TRAIN_MODEL_READY_DATA_PATH = "data/training_data_model_ready.parquet"
 VAL_MODEL_READY_DATA_PATH = "data/validation_data_model_ready.parquet"
 TEST_MODEL_READY_DATA_PATH = "data/test_data_model_ready.parquet"
+FEATURE_CACHE_DIR = "data/feature_cache"  # Memory-mapped model-ready splits (see load_split)
+
+
+# =========================
+# Data Loading
+# =========================
+
+def _read_split(filepath, dtype):
+    """Read the features of a model-ready Parquet file into one C-contiguous 2D array, plus target and weights."""
+    parquet_file = pq.ParquetFile(filepath)
+    # Stored index columns are listed as names (a RangeIndex is stored as metadata only)
+    index_columns = [
+        name for name in (parquet_file.schema_arrow.pandas_metadata or {}).get("index_columns", []) 
+        if isinstance(name, str)
+    ]
+    feature_columns = [
+        name for name in parquet_file.schema_arrow.names
+        if name not in (TARGET_COLUMN, WEIGHT_COLUMN, *index_columns)
+    ]
+
+    # Target, weights, and index (pandas metadata restores the index, including RangeIndex)
+    labels = pq.read_table(filepath, columns=[TARGET_COLUMN, WEIGHT_COLUMN], use_pandas_metadata=True).to_pandas()
+
+    table = parquet_file.read(columns=feature_columns)
+    X_values = np.empty((table.num_rows, table.num_columns), dtype=dtype)
+    for i, column in enumerate(table.columns):
+        X_values[:, i] = column.to_numpy()
+
+    X = pd.DataFrame(X_values, index=labels.index, columns=feature_columns, copy=False)
+    return X, labels[TARGET_COLUMN], labels[WEIGHT_COLUMN]
+
+
+def _write_feature_cache(entry_dir, X, y, w, md5):
+    """Write a split as aligned .npy files with a JSON sidecar (atomically, so concurrent writers are safe)."""
+    entry_dir = Path(entry_dir)
+    tmp_dir = entry_dir.with_name(f".{entry_dir.name}.{os.getpid()}.tmp")
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    np.save(tmp_dir / "X.npy", X.to_numpy())
+    np.save(tmp_dir / "y.npy", y.to_numpy())
+    np.save(tmp_dir / "w.npy", w.to_numpy())
+    if isinstance(X.index, pd.RangeIndex):
+        index = {"start": X.index.start, "stop": X.index.stop, "step": X.index.step}
+    else:
+        index = X.index.tolist()
+    sidecar = {
+        "md5": md5,
+        "columns": X.columns.tolist(),
+        "target": y.name,
+        "weight": w.name,
+        "index_name": X.index.name,
+        "index_dtype": str(X.index.dtype),
+        "index": index,
+    }
+    with open(tmp_dir / "sidecar.json", "w", encoding="utf-8") as f:
+        json.dump(sidecar, f)
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # Another process wrote the same entry first
+
+
+def _open_feature_cache(entry_dir):
+    """Memory-map a cached split read-only (pages are shared by concurrent processes)."""
+    entry_dir = Path(entry_dir)
+    with open(entry_dir / "sidecar.json", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    if isinstance(sidecar["index"], dict):
+        index = pd.RangeIndex(**sidecar["index"], name=sidecar["index_name"])
+    else:
+        index = pd.Index(sidecar["index"], dtype=sidecar["index_dtype"], name=sidecar["index_name"])
+    X = pd.DataFrame(np.load(entry_dir / "X.npy", mmap_mode="r"), index=index, columns=sidecar["columns"], copy=False)
+    y = pd.Series(np.load(entry_dir / "y.npy", mmap_mode="r"), index=index, name=sidecar["target"], copy=False)
+    w = pd.Series(np.load(entry_dir / "w.npy", mmap_mode="r"), index=index, name=sidecar["weight"], copy=False)
+    return X, y, w
+
+
+def load_split(filepath, dtype=np.float64, cache_dir=None):
+    """
+    Load a model-ready split as features, target variable, and sample weights.
+
+    Reads the feature columns with pyarrow directly into one C-contiguous 2D array, instead of 
+    loading the full DataFrame and dropping the target and weight columns (which copies the whole 
+    feature block). The returned DataFrame and Series are views of those arrays.
+
+    With a cache directory, the split is stored once per Parquet content (md5 of the file bytes, not the 
+    possibly stale md5 in dvc.lock, see get_dataset_digest) as aligned X, y, and w 
+    .npy files with a JSON sidecar for the column names and index, and later loads memory-map these 
+    files read-only instead of parsing the Parquet file. Entries of older versions of the same file 
+    are removed when a new entry is written.
+
+    Args:
+        filepath (str or Path): Model-ready Parquet file (e.g., TRAIN_MODEL_READY_DATA_PATH).
+        dtype (type, optional): Feature dtype (np.float64 or np.float32). Defaults to np.float64.
+        cache_dir (str or Path, optional): Feature cache directory (e.g., FEATURE_CACHE_DIR). 
+            Defaults to None (no cache).
+
+    Returns:
+        tuple: (X, y, w) with X as a DataFrame of features indexed like the Parquet file, y as the 
+            target variable Series, and w as the sample weights Series. Cached splits are read-only.
+    """
+    if cache_dir is None:
+        return _read_split(filepath, dtype)
+
+    # Content key: md5 of the file bytes from the digest cache (rehashed only when the file's size or modification time changes)
+    md5 = get_dataset_digest(filepath, cache_path=Path(cache_dir) / "digests.json")["md5"]
+    stem = Path(filepath).stem
+    entry_dir = Path(cache_dir) / f"{stem}_{md5}_{np.dtype(dtype).name}"
+    if not (entry_dir / "sidecar.json").exists():
+        X, y, w = _read_split(filepath, dtype)
+        _write_feature_cache(entry_dir, X, y, w, md5)
+        del X, y, w
+        # Remove entries of previous file versions (skipped while memory-mapped on Windows)
+        for stale_dir in Path(cache_dir).glob(f"{stem}_*"):
+            match = re.fullmatch(rf"{re.escape(stem)}_([0-9a-f]{{32}})_\w+", stale_dir.name)
+            if match and match.group(1) != md5:
+                shutil.rmtree(stale_dir, ignore_errors=True)
+    return _open_feature_cache(entry_dir)
 
 
 # =========================
 # Model Definitions
 # =========================
 
-def get_baseline_models():
+# Number of Nystroem components (landmark rows) of the approximate-kernel SVM baseline.
+# Training cost grows linearly with rows (vs. quadratically to cubically for the exact-kernel SVR);
+# more components approximate the RBF kernel more closely at higher fit and predict cost.
+SVR_APPROX_N_COMPONENTS = 1000
+
+
+def get_baseline_models(svr_approx_n_components=SVR_APPROX_N_COMPONENTS):
     """
     Define baseline machine learning models to predict out-of-pocket medical costs with distribution-aware 
     hyperparameters.
 
+    Args:
+        svr_approx_n_components (int): Number of Nystroem components of the approximate-kernel SVM.
+
     Returns:
         dict: A dictionary mapping model names (str) to Scikit-learn estimators or pipelines.
     """
@@ -109,6 +257,24 @@ def get_baseline_models():
             ),
             func=np.log1p,
             inverse_func=np.expm1
+        ),
+        "Approximate SVM": TransformedTargetRegressor(
+            regressor=Pipeline([
+                ("kernel", Nystroem(
+                    kernel="rbf",  # Low-rank approximation of the exact SVR's RBF kernel (gamma=None: 1/n_features)
+                    n_components=svr_approx_n_components,  # Landmark rows sampled from the training data (Default: 100)
+                    random_state=RANDOM_STATE
+                )),
+                ("model", LinearSVR(
+                    C=10.0,          # Same regularization strength as the exact SVR (Default: 1.0)
+                    epsilon=0.1,     # Same epsilon-tube as the exact SVR (Default: 0.0)
+                    dual=True,       # Dual solver required for the exact SVR's epsilon-insensitive loss (Default: "auto")
+                    max_iter=5000,   # More iterations for convergence on log-costs (Default: 1000)
+                    random_state=RANDOM_STATE
+                ))
+            ]),
+            func=np.log1p,
+            inverse_func=np.expm1
         )
     }
     
@@ -147,6 +313,42 @@ def weighted_median_absolute_error(y_true, y_pred, sample_weight):
     return errors_sorted[np.searchsorted(cumulative_weight, cutoff)]
 
 
+def weighted_regression_metrics_batch(y_true, y_preds, sample_weight):
+    """
+    Computes weighted MdAE, MAE, and R² for many candidate predictions in one vectorized pass.
+
+    Equivalent to calling weighted_median_absolute_error, mean_absolute_error, and r2_score
+    once per column of y_preds, e.g., to score every alpha of a regularization path at once.
+
+    Args:
+        y_true (array-like): True target variable values of shape (n_samples,).
+        y_preds (array-like): Predicted values of shape (n_samples, n_candidates).
+        sample_weight (array-like): Weights for population-level estimates.
+
+    Returns:
+        dict: "mdae", "mae", and "r2" arrays of shape (n_candidates,).
+    """
+    y_true = np.asarray(y_true, dtype=float)
+    y_preds = np.asarray(y_preds, dtype=float)
+    weights = np.asarray(sample_weight, dtype=float)
+
+    # Weighted median of absolute errors per column (same cutoff rule as weighted_median_absolute_error)
+    abs_errors = np.abs(y_true[:, None] - y_preds)
+    sorted_idx = np.argsort(abs_errors, axis=0)
+    errors_sorted = np.take_along_axis(abs_errors, sorted_idx, axis=0)
+    cumulative_weight = np.cumsum(weights[sorted_idx], axis=0)
+    cutoff = 0.5 * np.sum(weights)
+    median_idx = np.sum(cumulative_weight < cutoff, axis=0)  # first position where cumulative weight reaches cutoff
+    mdae = errors_sorted[median_idx, np.arange(y_preds.shape[1])]
+
+    mae = np.average(abs_errors, axis=0, weights=weights)
+    residual_ss = np.average((y_true[:, None] - y_preds) ** 2, axis=0, weights=weights)
+    total_ss = np.average((y_true - np.average(y_true, weights=weights)) ** 2, weights=weights)
+    r2 = 1 - residual_ss / total_ss
+
+    return {"mdae": mdae, "mae": mae, "r2": r2}
+
+
 # =============================
 # Model Training & Evaluation
 # =============================
@@ -159,7 +361,10 @@ def train_and_evaluate(
     track_mlflow=False,
     model_name="model", 
     log_model=False,
-    calculate_train_metrics=True
+    calculate_train_metrics=True,
+    train_metrics_indices=None,
+    train_data_path=None,
+    val_data_path=None
 ):
     """
     Train and evaluate a single machine learning model with optional MLflow experiment tracking.
@@ -176,6 +381,12 @@ def train_and_evaluate(
         model_name (str, optional): Display name of the model for MLflow experiment tracking. Defaults to "model".
         log_model (bool, optional): Whether to log the fitted model as an artifact to MLflow. Defaults to False.
         calculate_train_metrics (bool, optional): Whether to calculate training performance metrics. Defaults to True.
+        train_metrics_indices (np.ndarray, optional): Positional indices of the training rows used for training metrics 
+            (e.g., a fixed stratified subsample from get_train_metrics_indices). Defaults to None (all training rows).
+        train_data_path (str or Path, optional): Parquet file that X_train/y_train were loaded from in full, logged as the 
+            run's training input (cached digest, see log_dataset_input). Defaults to None (no training input logged).
+        val_data_path (str or Path, optional): Parquet file that X_val/y_val were loaded from in full, logged as the 
+            run's validation input. Defaults to None (no validation input logged).
 
     Returns:
         dict: A dictionary containing the evaluation results:
@@ -208,27 +419,7 @@ def train_and_evaluate(
 
     with run_context:
         if track_mlflow:
-            # Tag raw data source
-            mlflow.set_tag("data_source", RAW_DATA_PATH.split("/")[-1])
-
-            # Log data lineage
-            data_train = mlflow.data.from_pandas(
-                X_train.assign(**{TARGET_COLUMN: y_train}), 
-                targets=TARGET_COLUMN,
-                source=TRAIN_MODEL_READY_DATA_PATH,
-                name="training_data"
-            )
-            data_val = mlflow.data.from_pandas(
-                X_val.assign(**{TARGET_COLUMN: y_val}), 
-                targets=TARGET_COLUMN,
-                source=VAL_MODEL_READY_DATA_PATH,
-                name="validation_data"
-            )
-            mlflow.log_input(data_train, context="training")
-            mlflow.log_input(data_val, context="validation")
-
-            # Log model hyperparameters
-            mlflow.log_params(model.get_params())
+            _log_run_inputs(model.get_params(), train_data_path, val_data_path)
 
         # Fit model on training data
         start_time = time.time()  # Measure training time
@@ -254,10 +445,15 @@ def train_and_evaluate(
 
         # Calculate evaluation metrics on training data for overfitting analysis
         if calculate_train_metrics:
-            y_train_pred = model.predict(X_train)
-            train_mdae = weighted_median_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_mae = mean_absolute_error(y_train, y_train_pred, sample_weight=w_train)
-            train_r2 = r2_score(y_train, y_train_pred, sample_weight=w_train)
+            X_train_eval, y_train_eval, w_train_eval = X_train, y_train, w_train
+            if train_metrics_indices is not None:
+                X_train_eval = X_train.iloc[train_metrics_indices]
+                y_train_eval = y_train.iloc[train_metrics_indices]
+                w_train_eval = w_train.iloc[train_metrics_indices] if w_train is not None else None
+            y_train_pred = model.predict(X_train_eval)
+            train_mdae = weighted_median_absolute_error(y_train_eval, y_train_pred, sample_weight=w_train_eval)
+            train_mae = mean_absolute_error(y_train_eval, y_train_pred, sample_weight=w_train_eval)
+            train_r2 = r2_score(y_train_eval, y_train_pred, sample_weight=w_train_eval)
             
             results.update({
                 "train_mdae": train_mdae,
@@ -287,27 +483,200 @@ def train_and_evaluate(
     return results
 
 
-# =========================
-# Model Predictions
-# =========================
+def _log_run_inputs(params, train_data_path=None, val_data_path=None):
+    """Log the raw data source tag, data lineage, and hyperparameters of the active MLflow run."""
+    # Tag raw data source
+    mlflow.set_tag("data_source", RAW_DATA_PATH.split("/")[-1])
+
+    # Log data lineage only for data the caller loaded from a file (cached Parquet digests, see log_dataset_input)
+    if train_data_path is not None:
+        log_dataset_input(train_data_path, name="training_data", context="training")
+    if val_data_path is not None:
+        log_dataset_input(val_data_path, name="validation_data", context="validation")
+
+    # Log model hyperparameters
+    mlflow.log_params(params)
+
+
+def log_training_run(model_name, params, results, train_data_path=None, val_data_path=None):
+    """
+    Log a finished train_and_evaluate result as one MLflow run (same tags, inputs, params, and metrics as track_mlflow=True).
+
+    Lets callers that train in worker processes log from the parent process, so only one process 
+    writes to the tracking store (the SQLite fallback store of resolve_tracking_uri does not support 
+    concurrent writers).
+
+    Args:
+        model_name (str): Display name of the run.
+        params (dict): Model hyperparameters (e.g., model.get_params() of the unfitted model).
+        results (dict): Output of train_and_evaluate(..., track_mlflow=False).
+        train_data_path (str or Path, optional): Parquet file of the training data. Defaults to None (no training input logged).
+        val_data_path (str or Path, optional): Parquet file of the validation data. Defaults to None (no validation input logged).
+    """
+    metric_names = ["val_mdae", "val_mae", "val_r2", "training_time", "train_mdae", "train_mae", "train_r2"]
+    with mlflow.start_run(run_name=model_name):
+        _log_run_inputs(params, train_data_path, val_data_path)
+        mlflow.log_metrics({name: results[name] for name in metric_names if name in results})
+
+
+def get_train_metrics_indices(y_train, strategy, n_samples, random_state=RANDOM_STATE):
+    """
+    Select the training rows on which tuning trials calculate training metrics.
+
+    The "subsample" strategy draws a stratified subsample using the same cost bins as the 
+    train-validation-test split (create_stratification_bins), so the zero-cost hurdle and the 
+    extreme tail stay represented. The subsample is deterministic for a given random_state, 
+    so every trial is evaluated on the same rows.
+
+    Args:
+        y_train (pd.Series): Target variable for training data.
+        strategy (str): "full" (all rows), "subsample" (fixed stratified subsample), or "off" (no training metrics).
+        n_samples (int): Number of rows in the subsample (ignored unless strategy is "subsample").
+        random_state (int, optional): Random seed for the subsample. Defaults to RANDOM_STATE.
+
+    Returns:
+        np.ndarray or None: Sorted positional indices of the subsample, or None for "full" and "off".
+
+    Raises:
+        ValueError: If strategy is not "full", "subsample", or "off".
+    """
+    if strategy not in ("full", "subsample", "off"):
+        raise ValueError(f"Unknown train metrics strategy '{strategy}'. Expected 'full', 'subsample', or 'off'.")
+    if strategy != "subsample":
+        return None
+    if n_samples >= len(y_train):
+        return np.arange(len(y_train))
 
-def postprocess_quantile_predictions(y_pred):
+    strata = create_stratification_bins(y_train).to_numpy()
+    positions = np.arange(len(y_train))
+    indices, _ = train_test_split(positions, train_size=n_samples, stratify=strata, random_state=random_state)
+    return np.sort(indices)
+
+
+# =============================
+# Cross-Validation
+# =============================
+
+def _cross_validate_fold(model, X_spec, y, w, train_idx, val_idx, fold):
+    """
+    Fit and score one cross-validation fold (runs in a worker process).
+
+    The feature matrix is attached from shared memory instead of being pickled to every 
+    worker. Only metrics and out-of-fold predictions are returned to the parent process.
+    """
+    shm = shared_memory.SharedMemory(name=X_spec["name"]) if X_spec["name"] else None
+    try:
+        X_values = X_spec["values"] if shm is None else np.ndarray(X_spec["shape"], dtype=X_spec["dtype"], buffer=shm.buf)
+        X = pd.DataFrame(X_values, columns=X_spec["columns"], copy=False)
+        # Row selection copies the fold data, so the fitted model holds no reference to shared memory
+        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+        del X, X_values
+        result = train_and_evaluate(
+            model,
+            X_train, pd.Series(y[train_idx]),
+            X_val, pd.Series(y[val_idx]),
+            pd.Series(w[train_idx]), pd.Series(w[val_idx]),
+            calculate_train_metrics=False
+        )
+    finally:
+        if shm is not None:
+            shm.close()
+
+    return {
+        "fold": fold,
+        "n_train": len(train_idx),
+        "n_val": len(val_idx),
+        "val_mdae": result["val_mdae"],
+        "val_mae": result["val_mae"],
+        "val_r2": result["val_r2"],
+        "training_time": result["training_time"],
+        "y_val_pred": result["y_val_pred"],
+    }
+
+
+def cross_validate_weighted(model, X, y, w=None, n_splits=5, n_jobs=None, random_state=RANDOM_STATE):
     """
-    Ensure quantile predictions are valid for cost planning.
+    Survey-weighted stratified K-fold cross-validation with folds fitted in parallel processes.
 
-    Applies two constraints:
-      1. Predicted costs must be non-negative.
-      2. Quantiles must be monotonic: q25 <= q50 <= q75 <= q90.
+    Folds are stratified on the same cost bins as the train-validation-test split 
+    (create_stratification_bins), so every fold keeps the zero-cost share and the extreme tail. 
+    Each fold is trained with weights normalized to mean 1.0 on its training rows and scored 
+    with raw survey weights (same as train_and_evaluate). The feature matrix is placed in shared 
+    memory once and attached by every worker process, and estimator n_jobs parameters are capped 
+    so that parallel folds share the CPU cores instead of oversubscribing them.
 
     Args:
-        y_pred (array-like): Quantile predictions with shape (n_samples, n_quantiles).
+        model (estimator): Unfitted Scikit-learn estimator or pipeline (cloned for every fold).
+        X (pd.DataFrame): Preprocessed features (numeric).
+        y (pd.Series): Target variable.
+        w (pd.Series, optional): Sample weights. Defaults to None (equal weights).
+        n_splits (int, optional): Number of folds. Defaults to 5.
+        n_jobs (int, optional): Number of folds fitted in parallel processes. Defaults to None (min(n_splits, CPU count)).
+        random_state (int, optional): Random seed for the fold assignment. Defaults to RANDOM_STATE.
 
     Returns:
-        np.ndarray: Postprocessed quantile predictions.
+        dict: Cross-validation results:
+            - "val_mdae", "val_mae", "val_r2" (float): Mean metrics across folds.
+            - "val_mdae_std", "val_mae_std", "val_r2_std" (float): Standard deviation of metrics across folds.
+            - "oof_mdae" (float): Weighted MdAE of the pooled out-of-fold predictions.
+            - "training_time" (float): Total training time of all folds in seconds.
+            - "cv_time" (float): Wall time of the cross-validation in seconds.
+            - "folds" (list[dict]): Per-fold sizes, metrics, and training time.
+            - "y_oof_pred" (np.ndarray): Out-of-fold predictions aligned with X.
     """
-    y_pred = np.asarray(y_pred, dtype=float)
-    y_pred = np.maximum(y_pred, 0)
-    return np.maximum.accumulate(y_pred, axis=1)
+    cv_start = time.time()
+    y_values = np.asarray(y, dtype=float)
+    w_values = np.ones(len(y_values)) if w is None else np.asarray(w, dtype=float)
+    strata = create_stratification_bins(pd.Series(y_values))
+    splits = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X, strata))
+
+    n_jobs = min(n_splits, os.cpu_count() or 1) if n_jobs is None else n_jobs
+    model = clone(model)
+    if n_jobs > 1:
+        # Share CPU cores between parallel folds (e.g., n_jobs=-1 of RandomForest or XGBoost)
+        threads_per_fold = max(1, (os.cpu_count() or 1) // n_jobs)
+        model.set_params(**{name: threads_per_fold for name in model.get_params() if name.split("__")[-1] == "n_jobs"})
+
+    X_values = np.ascontiguousarray(X, dtype=np.float64)
+    X_spec = {"name": None, "values": X_values, "shape": X_values.shape, "dtype": X_values.dtype.str, "columns": list(X.columns)}
+    if n_jobs <= 1:
+        fold_results = [
+            _cross_validate_fold(clone(model), X_spec, y_values, w_values, train_idx, val_idx, fold)
+            for fold, (train_idx, val_idx) in enumerate(splits)
+        ]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, X_values.nbytes))
+        try:
+            np.ndarray(X_values.shape, dtype=X_values.dtype, buffer=shm.buf)[:] = X_values
+            X_spec.update(name=shm.name, values=None)
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_cross_validate_fold, clone(model), X_spec, y_values, w_values, train_idx, val_idx, fold)
+                    for fold, (train_idx, val_idx) in enumerate(splits)
+                ]
+                fold_results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # Pool out-of-fold predictions for a single population-weighted estimate over all rows
+    y_oof_pred = np.empty(len(y_values))
+    for (_, val_idx), fold_result in zip(splits, fold_results):
+        y_oof_pred[val_idx] = fold_result.pop("y_val_pred")
+
+    results = {}
+    for metric in ["val_mdae", "val_mae", "val_r2"]:
+        values = [fold_result[metric] for fold_result in fold_results]
+        results[metric] = float(np.mean(values))
+        results[f"{metric}_std"] = float(np.std(values))
+    results.update({
+        "oof_mdae": weighted_median_absolute_error(y_values, y_oof_pred, sample_weight=w_values),
+        "training_time": sum(fold_result["training_time"] for fold_result in fold_results),
+        "cv_time": time.time() - cv_start,
+        "folds": fold_results,
+        "y_oof_pred": y_oof_pred,
+    })
+    return results
 
 
 # =========================
@@ -335,43 +704,260 @@ def get_core_model_params(fitted_model):
     return core_model.get_params(deep=False)
 
 
+# =========================
+# Compact Random Forest
+# =========================
+
+class CompactForestRegressor:
+    """
+    Inference-only random forest stored in packed arrays.
+
+    All trees are concatenated into flat node arrays (interleaved left/right child indices, split features, 
+    float32 thresholds, and float32 leaf values); training-only state such as impurities, node sample counts, 
+    and estimator parameters is dropped. Thresholds are rounded toward -inf to float32, which keeps every split 
+    decision identical to scikit-learn (trees compare float32 features), so predictions differ only by the 
+    float32 leaf values. Prediction descends all trees at once, one vectorized step per tree level.
+
+    Build from a fitted RandomForestRegressor, optionally wrapped in a TransformedTargetRegressor 
+    with func/inverse_func from TARGET_TRANSFORMS:
+        compact_model = CompactForestRegressor.from_model(fitted_model)
+    """
+
+    CHUNK_SIZE = 2_000  # Rows per prediction chunk (bounds the rows x trees node-index arrays)
+
+    def __init__(self, roots, children, feature, threshold, value, missing_go_to_left, max_depth, 
+                 feature_names_in=None, inverse_func=None):
+        self.roots = roots
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.missing_go_to_left = missing_go_to_left
+        self.max_depth = max_depth
+        self.feature_names_in = feature_names_in
+        self.inverse_func = inverse_func
+
+    @classmethod
+    def from_model(cls, model):
+        """Compact a fitted RandomForestRegressor or TransformedTargetRegressor(RandomForestRegressor)."""
+        forest = getattr(model, "regressor_", model)
+        if not isinstance(forest, RandomForestRegressor) or forest.n_outputs_ != 1:
+            raise TypeError(f"Expected a fitted single-output RandomForestRegressor, got {type(forest).__name__}.")
+        inverse_func = None
+        if isinstance(model, TransformedTargetRegressor):
+            transform_names = {func: name for name, func in TARGET_TRANSFORMS.items()}
+            if model.transformer is not None or model.inverse_func not in transform_names:
+                raise TypeError(f"Expected inverse_func from TARGET_TRANSFORMS ({', '.join(TARGET_TRANSFORMS)}).")
+            inverse_func = transform_names[model.inverse_func]
+
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        index_dtype = np.int32 if 2 * offsets[-1] < np.iinfo(np.int32).max else np.int64
+        feature_dtype = np.int16 if forest.n_features_in_ < np.iinfo(np.int16).max else np.int32
+
+        children, feature, threshold, value, missing_go_to_left = [], [], [], [], []
+        for offset, tree in zip(offsets, trees):
+            is_leaf = tree.children_left < 0
+            # Leaves point to themselves, so finished rows stay in place while deeper trees descend
+            own_index = np.arange(tree.node_count) + offset
+            children.append(np.column_stack([
+                np.where(is_leaf, own_index, tree.children_left + offset),
+                np.where(is_leaf, own_index, tree.children_right + offset),
+            ]).ravel())
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            # Round toward -inf: for float32 x, x <= float64 t exactly when x <= the largest float32 <= t
+            threshold_32 = tree.threshold.astype(np.float32)
+            rounded_up = threshold_32.astype(np.float64) > tree.threshold
+            threshold_32[rounded_up] = np.nextafter(threshold_32[rounded_up], np.float32(-np.inf))
+            threshold.append(np.where(is_leaf, np.inf, threshold_32))
+            value.append(tree.value[:, 0, 0])
+            missing_go_to_left.append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8)))
+
+        return cls(
+            roots=offsets[:-1].astype(index_dtype),
+            children=np.concatenate(children).astype(index_dtype),
+            feature=np.concatenate(feature).astype(feature_dtype),
+            threshold=np.concatenate(threshold).astype(np.float32),
+            value=np.concatenate(value).astype(np.float32),
+            missing_go_to_left=np.concatenate(missing_go_to_left).astype(bool),
+            max_depth=max(tree.max_depth for tree in trees),
+            feature_names_in=getattr(forest, "feature_names_in_", None),
+            inverse_func=inverse_func,
+        )
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def _predict_chunk(self, X, has_missing):
+        """Mean leaf value over all trees for one chunk of float32 rows."""
+        n_rows, n_features = X.shape
+        # One (row, tree) pair per entry; pairs at a leaf stay there (children of leaves are the leaf itself)
+        node = np.tile(self.roots.astype(np.intp), n_rows)
+        row_start = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_estimators)
+        X_flat = X.ravel()
+        for _ in range(self.max_depth):
+            x = X_flat[row_start + self.feature[node]]
+            go_right = x > self.threshold[node]
+            if has_missing:
+                go_right |= np.isnan(x) & ~self.missing_go_to_left[node]
+            node = self.children[2 * node + go_right]
+        return self.value[node].reshape(n_rows, self.n_estimators).mean(axis=1, dtype=np.float64)
+
+    def predict(self, X):
+        """
+        Predict like the original model (including the inverse target transformation, if any).
+
+        Args:
+            X (pd.DataFrame or array-like): Features; DataFrame columns are matched by name.
+
+        Returns:
+            np.ndarray: Predicted values with shape (n_samples,).
+        """
+        if isinstance(X, pd.DataFrame) and self.feature_names_in is not None:
+            X = X[list(self.feature_names_in)]
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        has_missing = bool(np.isnan(X).any())
+        y_pred = np.concatenate([
+            self._predict_chunk(X[start:start + self.CHUNK_SIZE], has_missing) 
+            for start in range(0, max(len(X), 1), self.CHUNK_SIZE)
+        ])[:len(X)]
+        if self.inverse_func is not None:
+            y_pred = TARGET_TRANSFORMS[self.inverse_func](y_pred)
+        return y_pred
+
+
 # =========================
 # Model Persistence
 # =========================
 
+# Target transformations that native XGBoost artifacts record by name (see save_model)
+TARGET_TRANSFORMS = {"log1p": np.log1p, "expm1": np.expm1}
+
+
+def _save_xgboost_native(model, filepath):
+    """Save an XGBoost model as a UBJSON booster plus a JSON sidecar with the target-transform wrapper metadata."""
+    regressor = getattr(model, "regressor_", model)
+    if not isinstance(regressor, XGBRegressor):
+        raise TypeError(f"Native .ubj format requires a fitted XGBRegressor (optionally in a TransformedTargetRegressor), got {type(regressor).__name__}.")
+    quantiles = regressor.get_params().get("quantile_alpha")
+    metadata = {
+        "format": "xgboost_ubjson",
+        "booster": Path(filepath).name,
+        "xgboost_version": xgboost.__version__,
+        "feature_names": regressor.get_booster().feature_names,
+        "quantiles": np.atleast_1d(quantiles).tolist() if quantiles is not None else None,
+        "target_transform": None,
+    }
+    if isinstance(model, TransformedTargetRegressor):
+        transform_names = {func: name for name, func in TARGET_TRANSFORMS.items()}
+        if model.transformer is not None or model.func not in transform_names or model.inverse_func not in transform_names:
+            raise TypeError(f"Native .ubj format supports func/inverse_func from TARGET_TRANSFORMS ({', '.join(TARGET_TRANSFORMS)}).")
+        metadata["target_transform"] = {
+            "func": transform_names[model.func],
+            "inverse_func": transform_names[model.inverse_func],
+            "training_dim": model._training_dim,
+        }
+
+    regressor.save_model(filepath)
+    with open(Path(filepath).with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=4)
+
+
+def _load_xgboost_native(filepath):
+    """Reconstruct a fitted XGBoost model (and its target-transform wrapper) from a .ubj booster and JSON sidecar."""
+    with open(Path(filepath).with_suffix(".json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    regressor = XGBRegressor()
+    regressor.load_model(filepath)  # Restores the booster and the scikit-learn parameters
+    if metadata["quantiles"] is not None:
+        regressor.set_params(quantile_alpha=np.array(metadata["quantiles"]))  # Booster-only parameter, not restored by load_model
+
+    transform = metadata["target_transform"]
+    if transform is None:
+        return regressor
+    func, inverse_func = TARGET_TRANSFORMS[transform["func"]], TARGET_TRANSFORMS[transform["inverse_func"]]
+    model = TransformedTargetRegressor(regressor=XGBRegressor(**regressor.get_params()), func=func, inverse_func=inverse_func)
+    # Fitted state as set by TransformedTargetRegressor.fit
+    model.transformer_ = FunctionTransformer(func=func, inverse_func=inverse_func, validate=True, check_inverse=False)
+    model.transformer_.set_output(transform="default").fit(np.zeros((1, 1)))
+    model.regressor_ = regressor
+    model._training_dim = transform["training_dim"]
+    if hasattr(regressor, "feature_names_in_"):
+        model.feature_names_in_ = regressor.feature_names_in_
+    return model
+
+
 def save_model(model, filepath, verbose=True):
     """
     Save a trained model or pipeline or a results dictionary to a file using joblib.
 
+    Files with a .ubj extension use XGBoost's native format instead: the booster is stored as UBJSON 
+    and the TransformedTargetRegressor metadata (target transformation, quantiles, feature names) as 
+    a JSON sidecar with the same name (e.g., 'models/xgb_quantile_model.json'). Native artifacts 
+    load faster, are smaller, and do not depend on the pickled library versions.
+
+    Predictions are stored without pickling: arrays as .npy files (rows in the order of the evaluated 
+    split, memory-mapped by load_model) and Series/DataFrames as .parquet files that keep their index 
+    (e.g., DUPERSID), so rows can be aligned by ID instead of by position.
+
     Args:
         model: The model object or pipeline object or results dictionary to be saved.
-        filepath (str or Path): The destination file path (e.g., 'models/baseline.joblib').
+        filepath (str or Path): The destination file path (e.g., 'models/baseline.joblib', 'models/xgb_quantile_model.ubj',
+            'models/xgb_quantile_predictions.npy', or 'models/llm_benchmark_predictions.parquet').
         verbose (bool): Whether to print a success message.
     """
     try:
         # Ensure the parent directory exists
         Path(filepath).parent.mkdir(parents=True, exist_ok=True)
 
-        joblib.dump(model, filepath)
+        suffix = Path(filepath).suffix
+        if suffix == ".ubj":
+            _save_xgboost_native(model, filepath)
+        elif suffix == ".npy":
+            np.save(filepath, np.asarray(model), allow_pickle=False)
+        elif suffix == ".parquet":
+            model = model.to_frame() if isinstance(model, pd.Series) else model
+            model.to_parquet(filepath)
+        else:
+            joblib.dump(model, filepath)
         if verbose:
             print(f"Successfully saved model to '{filepath}'.")
     except Exception as e:
         print(f"Error while saving model: {e}")
 
 
-def load_model(filepath, verbose=True):
+def load_model(filepath, verbose=True, mmap_mode="r"):
     """
     Load a trained model or pipeline or a results dictionary from a file using joblib.
 
+    Files with a .ubj extension are native XGBoost artifacts (see save_model) and are reconstructed 
+    as an equivalent fitted predictor. Files with a .npy extension are loaded as (memory-mapped) arrays 
+    and files with a .parquet extension as DataFrames. If a .npy or .parquet file does not exist but 
+    a pickled file with the same name and a .joblib extension does, the legacy file is loaded instead.
+
     Args:
         filepath (str or Path): The file path to load from.
         verbose (bool): Whether to print a success message.
+        mmap_mode (str or None): Memory-map mode for .npy files ('r' for read-only, None to load into memory).
 
     Returns:
-        The loaded object (model, pipeline, or dictionary).
+        The loaded object (model, pipeline, dictionary, array, or DataFrame).
     """
     try:
-        model = joblib.load(filepath)
+        filepath = Path(filepath)
+        legacy_filepath = filepath.with_suffix(".joblib")
+        if filepath.suffix in (".npy", ".parquet") and not filepath.exists() and legacy_filepath.exists():
+            filepath = legacy_filepath
+        
+        if filepath.suffix == ".ubj":
+            model = _load_xgboost_native(filepath)
+        elif filepath.suffix == ".npy":
+            model = np.load(filepath, mmap_mode=mmap_mode, allow_pickle=False)
+        elif filepath.suffix == ".parquet":
+            model = pd.read_parquet(filepath)
+        else:
+            model = joblib.load(filepath)
         if verbose:
             print(f"Successfully loaded model from '{filepath}'.")
         return model
@@ -433,3 +1019,266 @@ def load_metrics(filepath, verbose=True):
     except Exception as e:
         print(f"Error while loading metrics: {e}")
         return None
+
+
+# =========================
+# Experiment Tracking
+# =========================
+
+MLFLOW_TRACKING_URI = "http://127.0.0.1:5000"
+MLFLOW_OFFLINE_URI = "sqlite:///mlflow_offline.db"  # Local fallback store (upload later with scripts/sync_mlflow_runs.py)
+SYNCED_RUN_TAG = "offline_sync.target_run_id"  # Set on offline runs after upload to the tracking server
+DATASET_DIGEST_CACHE_PATH = "data/dataset_digests.json"
+
+
+def get_dataset_digest(filepath, cache_path=DATASET_DIGEST_CACHE_PATH):
+    """
+    Return the cached MLflow dataset digest, schema, and row count of a Parquet file.
+
+    The cache is keyed by the file's content hash, the md5 of the file bytes. A file whose size 
+    and modification time are unchanged since the last lookup is not hashed again, so lookups 
+    after the first run are O(1). The md5 recorded in dvc.lock is not used: it is stale when a 
+    file is regenerated outside `dvc repro`, even if the size happens to match. The schema and 
+    row count come from the Parquet metadata without loading the data.
+
+    Args:
+        filepath (str or Path): Parquet file (e.g., TRAIN_MODEL_READY_DATA_PATH).
+        cache_path (str or Path, optional): JSON digest cache. Defaults to DATASET_DIGEST_CACHE_PATH.
+
+    Returns:
+        dict: "md5", "digest" (first 8 md5 characters, like MLflow digests), "schema" (MLflow schema JSON), 
+            "num_rows", "size", and "mtime_ns".
+    """
+    key = Path(filepath).as_posix()
+    stat = Path(filepath).stat()
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        cache = {}
+
+    entry = cache.get(key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry
+
+    with open(filepath, "rb") as f:
+        md5 = hashlib.file_digest(f, "md5").hexdigest()
+    if not entry or entry["md5"] != md5:
+        parquet_file = pq.ParquetFile(filepath)
+        empty_frame = parquet_file.schema_arrow.empty_table().to_pandas()
+        entry = {
+            "md5": md5,
+            "digest": md5[:8],
+            "schema": mlflow.data.from_pandas(empty_frame).schema.to_json(),
+            "num_rows": parquet_file.metadata.num_rows,
+        }
+    entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+
+    cache[key] = entry
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(cache_path).with_name(f".{Path(cache_path).name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, cache_path)
+    return entry
+
+
+def log_dataset_input(filepath, name, context):
+    """
+    Log a Parquet file as an MLflow dataset input of the active run using the cached digest.
+
+    Replaces mlflow.data.from_pandas(df, ...) + mlflow.log_input(...), which copies and hashes 
+    the DataFrame on every run (see get_dataset_digest).
+
+    Args:
+        filepath (str or Path): Parquet file (e.g., TRAIN_MODEL_READY_DATA_PATH).
+        name (str): Dataset name (e.g., "training_data").
+        context (str): Input context (e.g., "training" or "validation").
+    """
+    entry = get_dataset_digest(filepath)
+    dataset = MetaDataset(
+        source=resolve_dataset_source(Path(filepath).as_posix()),
+        name=name,
+        digest=entry["digest"],
+        schema=Schema.from_json(entry["schema"])
+    )
+    mlflow.log_input(dataset, context=context)
+
+
+def resolve_tracking_uri(tracking_uri=MLFLOW_TRACKING_URI, fallback_uri=MLFLOW_OFFLINE_URI, timeout=2.0):
+    """
+    Return the tracking URI if the MLflow tracking server is reachable, otherwise the local fallback store.
+
+    Args:
+        tracking_uri (str, optional): MLflow tracking server URI. Defaults to MLFLOW_TRACKING_URI.
+        fallback_uri (str, optional): Local file or SQLite store used when the server is unreachable. 
+            Defaults to MLFLOW_OFFLINE_URI.
+        timeout (float, optional): Health check timeout in seconds. Defaults to 2.0.
+
+    Returns:
+        str: The URI to pass to mlflow.set_tracking_uri() and AsyncMlflowLogger.
+    """
+    if not tracking_uri.startswith(("http://", "https://")):
+        return tracking_uri
+    try:
+        with urllib.request.urlopen(f"{tracking_uri.rstrip('/')}/health", timeout=timeout):
+            return tracking_uri
+    except OSError:  # Includes URLError, connection refused, and timeouts
+        print(f"  ⚠️ MLflow tracking server '{tracking_uri}' is unreachable. Logging to '{fallback_uri}' instead "
+              f"(upload later with scripts/sync_mlflow_runs.py).")
+        return fallback_uri
+
+
+class AsyncMlflowLogger:
+    """
+    Buffered MLflow logging on a background thread.
+
+    Tuning loops hand complete child runs (params, metrics, tags) to log_run(), which returns 
+    immediately. A background thread creates each run and writes its buffered params, metrics, 
+    and tags with MlflowClient.log_batch, so trial wall time does not include tracking latency. 
+    Tracking errors are reported as warnings instead of stopping the search.
+
+    Usage:
+        with AsyncMlflowLogger(mlflow.get_tracking_uri(), experiment_id) as tracker:
+            tracker.log_run("Trial 001", params=params, metrics=metrics, parent_run_id=parent_run_id)
+    """
+
+    # MLflow log_batch accepts at most 100 params (and 1000 metrics) per request
+    BATCH_SIZE = 100
+
+    def __init__(self, tracking_uri, experiment_id):
+        """
+        Args:
+            tracking_uri (str): Tracking URI (e.g., from resolve_tracking_uri()).
+            experiment_id (str): Experiment in which the runs are created.
+        """
+        self.client = MlflowClient(tracking_uri=tracking_uri)
+        self.experiment_id = experiment_id
+        self.errors = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="mlflow-logger", daemon=True)
+        self._thread.start()
+
+    def log_run(self, run_name, params=None, metrics=None, tags=None, parent_run_id=None):
+        """
+        Enqueue a complete run (returns immediately).
+
+        Args:
+            run_name (str): Display name of the run.
+            params (dict, optional): Hyperparameters. Defaults to None.
+            metrics (dict, optional): Metric values (logged with the current timestamp). Defaults to None.
+            tags (dict, optional): Run tags. Defaults to None.
+            parent_run_id (str, optional): Parent run for nested display in the MLflow UI. Defaults to None.
+        """
+        timestamp = int(time.time() * 1000)
+        tags = dict(tags or {})
+        if parent_run_id is not None:
+            tags["mlflow.parentRunId"] = parent_run_id
+        self._queue.put({
+            "run_name": run_name,
+            "start_time": timestamp,
+            "params": [Param(key, str(value)) for key, value in (params or {}).items()],
+            "metrics": [Metric(key, float(value), timestamp, 0) for key, value in (metrics or {}).items()],
+            "tags": tags,
+        })
+
+    def flush(self):
+        """Block until all enqueued runs are written."""
+        self._queue.join()
+
+    def close(self):
+        """Write all enqueued runs and stop the background thread."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.errors:
+            print(f"  ⚠️ {len(self.errors)} MLflow runs could not be logged (first error: {self.errors[0]})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _worker(self):
+        while True:
+            run = self._queue.get()
+            try:
+                if run is None:
+                    return
+                self._write_run(run)
+            except Exception as e:
+                self.errors.append(f"{run['run_name']}: {type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_run(self, run):
+        run_id = self.client.create_run(
+            self.experiment_id, start_time=run["start_time"], tags=run["tags"], run_name=run["run_name"]
+        ).info.run_id
+        params, metrics = run["params"], run["metrics"]
+        for start in range(0, max(len(params), len(metrics)), self.BATCH_SIZE):
+            self.client.log_batch(
+                run_id,
+                metrics=metrics[start:start + self.BATCH_SIZE],
+                params=params[start:start + self.BATCH_SIZE],
+            )
+        self.client.set_terminated(run_id, status="FINISHED")
+
+
+def sync_offline_runs(source_uri=MLFLOW_OFFLINE_URI, target_uri=MLFLOW_TRACKING_URI):
+    """
+    Upload runs from the local fallback store to the MLflow tracking server.
+
+    Recreates experiments by name and runs with their names, start/end times, status, params, 
+    tags, and full metric histories, and maps parent-child relations to the new run ids. Uploaded 
+    runs are tagged in the source store, so repeated syncs skip them. Artifacts (e.g., logged 
+    models) and dataset inputs are not uploaded.
+
+    Args:
+        source_uri (str, optional): Local fallback store. Defaults to MLFLOW_OFFLINE_URI.
+        target_uri (str, optional): MLflow tracking server. Defaults to MLFLOW_TRACKING_URI.
+
+    Returns:
+        int: Number of uploaded runs.
+    """
+    source = MlflowClient(tracking_uri=source_uri)
+    target = MlflowClient(tracking_uri=target_uri)
+    n_synced = 0
+    for experiment in source.search_experiments():
+        target_experiment = target.get_experiment_by_name(experiment.name)
+        target_experiment_id = (
+            target_experiment.experiment_id if target_experiment else target.create_experiment(experiment.name)
+        )
+
+        # Parents start before their children, so their new run ids are known when children are uploaded
+        runs = source.search_runs([experiment.experiment_id], order_by=["attributes.start_time ASC"], max_results=50_000)
+        run_id_map = {run.info.run_id: run.data.tags[SYNCED_RUN_TAG] for run in runs if SYNCED_RUN_TAG in run.data.tags}
+        for run in runs:
+            if SYNCED_RUN_TAG in run.data.tags:
+                continue
+            tags = {key: value for key, value in run.data.tags.items() if key != "mlflow.runName"}
+            if "mlflow.parentRunId" in tags:
+                tags["mlflow.parentRunId"] = run_id_map.get(tags["mlflow.parentRunId"], tags["mlflow.parentRunId"])
+            target_run_id = target.create_run(
+                target_experiment_id, start_time=run.info.start_time, tags=tags, run_name=run.info.run_name
+            ).info.run_id
+
+            metrics = [
+                metric
+                for key in run.data.metrics
+                for metric in source.get_metric_history(run.info.run_id, key)
+            ]
+            params = [Param(key, value) for key, value in run.data.params.items()]
+            batch_size = AsyncMlflowLogger.BATCH_SIZE
+            for start in range(0, max(len(metrics), len(params)), batch_size):
+                target.log_batch(
+                    target_run_id,
+                    metrics=metrics[start:start + batch_size],
+                    params=params[start:start + batch_size],
+                )
+            target.set_terminated(target_run_id, status=run.info.status, end_time=run.info.end_time)
+
+            source.set_tag(run.info.run_id, SYNCED_RUN_TAG, target_run_id)
+            run_id_map[run.info.run_id] = target_run_id
+            n_synced += 1
+    return n_synced
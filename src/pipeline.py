@@ -1,4 +1,5 @@
 # Third-party library imports
+import numpy as np
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 
@@ -129,3 +130,23 @@ def create_missing_value_handling_pipeline(
         ))
     ])
     return pipeline.set_output(transform="pandas")
+
+
+# --- Postprocessing of model outputs ---
+def postprocess_quantile_predictions(y_pred):
+    """
+    Ensure quantile predictions are valid for cost planning.
+
+    Applies two constraints:
+      1. Predicted costs must be non-negative.
+      2. Quantiles must be monotonic: q25 <= q50 <= q75 <= q90.
+
+    Args:
+        y_pred (array-like): Quantile predictions with shape (n_samples, n_quantiles).
+
+    Returns:
+        np.ndarray: Postprocessed quantile predictions.
+    """
+    y_pred = np.asarray(y_pred, dtype=float)
+    y_pred = np.maximum(y_pred, 0)
+    return np.maximum.accumulate(y_pred, axis=1)
@@ -0,0 +1,671 @@
+"""
+Hyperparameter search samplers.
+
+This module provides the trial samplers used by the tuning scripts
+(e.g., scripts/tune_xgboost.py). All samplers read the same distribution dicts
+defined in src/params.py and share an ask/tell interface, so a tuning loop can
+switch between plain random search and sequential model-based search without
+changing its structure:
+
+    sampler = get_param_sampler(XGB_PARAM_DISTRIBUTIONS, n_iter=XGB_N_ITER, sampler="tpe")
+    for _ in range(XGB_N_ITER):
+        trial_id, params = sampler.ask()
+        val_mdae = ...  # train and evaluate
+        sampler.tell(trial_id, val_mdae)
+
+Samplers:
+  - RandomSearchSampler: Wraps ParameterSampler and reproduces the original
+    randomized search trial-for-trial.
+  - TPESampler: Self-contained Tree-structured Parzen Estimator. Splits the
+    finished trials into a "good" and a "bad" group by validation MdAE, models
+    each group with a Parzen (kernel density) estimator per hyperparameter, and
+    proposes the candidate that maximizes the density ratio good/bad.
+
+Both samplers are thread-safe. Trials that were asked but not yet told are
+treated as "bad" observations (constant liar strategy), so several asynchronous
+workers do not keep proposing the same region of the search space.
+
+Search utilities:
+  - Elastic Net regularization path: Solves all alphas of a weighted Elastic Net
+    along one warm-started coordinate descent path (used by scripts/tune_elastic_net.py).
+  - Shared-filesystem trial queue: Lets worker processes on several hosts that
+    mount the same directory run the trials of one search (used by
+    scripts/tune_xgboost.py with --queue-dir).
+"""
+
+# Standard library imports
+import abc
+import contextlib
+import json
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Third-party library imports
+import numpy as np
+from scipy.special import logsumexp
+from scipy.stats import truncnorm
+from sklearn.linear_model import enet_path
+from sklearn.model_selection import ParameterSampler
+
+# Local imports
+from src.constants import RANDOM_STATE
+
+# Names of the scipy.stats distributions that are sampled on a log scale
+LOG_SCALE_DISTRIBUTIONS = ("loguniform", "reciprocal")
+
+
+# =========================
+# Search Space
+# =========================
+
+def describe_search_space(param_distributions):
+    """
+    Convert a distribution dict from src/params.py into bounded search dimensions.
+
+    Supported distributions:
+      - Lists: Categorical choices (e.g., ["sqrt", "log2", 0.3]).
+      - Discrete scipy.stats distributions (e.g., randint): Integer ranges.
+      - Bounded continuous scipy.stats distributions (e.g., uniform, loguniform):
+        Float ranges, with loguniform searched on a log scale.
+
+    Args:
+        param_distributions (dict): Maps parameter names to lists or frozen scipy.stats distributions.
+
+    Returns:
+        list[dict]: One dimension per parameter with keys "name", "kind" ("categorical", "int", or "float"),
+            "distribution", and either "choices" or the internal "low"/"high" bounds and "log" flag.
+    """
+    dimensions = []
+    for name, distribution in param_distributions.items():
+        if isinstance(distribution, (list, tuple)):
+            dimensions.append({
+                "name": name,
+                "kind": "categorical",
+                "distribution": list(distribution),
+                "choices": list(distribution),
+            })
+            continue
+
+        if not hasattr(distribution, "rvs"):
+            raise TypeError(f"Parameter '{name}' must be a list or a frozen scipy.stats distribution.")
+
+        low, high = (float(bound) for bound in distribution.support())
+        if not (np.isfinite(low) and np.isfinite(high)):
+            raise ValueError(f"Parameter '{name}' must have a bounded distribution for model-based search.")
+
+        if hasattr(distribution.dist, "pmf"):
+            # Discrete: Widen by half a step so each integer has an equally wide interval
+            dimensions.append({
+                "name": name,
+                "kind": "int",
+                "distribution": distribution,
+                "low": low - 0.5,
+                "high": high + 0.5,
+                "log": False,
+            })
+        else:
+            log = distribution.dist.name in LOG_SCALE_DISTRIBUTIONS
+            dimensions.append({
+                "name": name,
+                "kind": "float",
+                "distribution": distribution,
+                "low": math.log(low) if log else low,
+                "high": math.log(high) if log else high,
+                "log": log,
+            })
+    return dimensions
+
+
+def _to_internal(dimension, value):
+    """Map a parameter value to the sampler's internal numeric representation."""
+    if dimension["kind"] == "categorical":
+        return float(dimension["choices"].index(value))
+    if dimension["log"]:
+        return math.log(value)
+    return float(value)
+
+
+def _from_internal(dimension, x):
+    """Map an internal numeric value back to a JSON-friendly parameter value."""
+    if dimension["kind"] == "categorical":
+        return dimension["choices"][int(x)]
+    if dimension["kind"] == "int":
+        return int(np.clip(round(x), dimension["low"] + 0.5, dimension["high"] - 0.5))
+    if dimension["log"]:
+        return float(math.exp(x))
+    return float(x)
+
+
+# =========================
+# Samplers
+# =========================
+
+class _BaseSampler(abc.ABC):
+    """Shared ask/tell bookkeeping and the asynchronous parallel search loop."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_trial_id = 0
+        self._pending = {}    # trial_id -> params
+        self._completed = []  # (trial_id, params, value)
+
+    def ask(self):
+        """
+        Propose the next hyperparameter configuration.
+
+        Returns:
+            tuple: (trial_id, params) where params is a dict of JSON-friendly parameter values.
+        """
+        with self._lock:
+            trial_id = self._next_trial_id
+            params = self._propose(trial_id)
+            self._next_trial_id += 1
+            self._pending[trial_id] = params
+            return trial_id, params
+
+    def tell(self, trial_id, value):
+        """
+        Report the objective value (lower is better, e.g., validation MdAE) of a finished trial.
+
+        Args:
+            trial_id (int): Identifier returned by ask().
+            value (float): Objective value. NaN or infinite values are treated as the worst possible result.
+        """
+        with self._lock:
+            params = self._pending.pop(trial_id)
+            value = float(value) if np.isfinite(value) else np.inf
+            self._completed.append((trial_id, params, value))
+
+    @property
+    def best_trial(self):
+        """dict: The finished trial with the lowest objective value ("trial_id", "params", "value")."""
+        with self._lock:
+            if not self._completed:
+                return None
+            trial_id, params, value = min(self._completed, key=lambda trial: trial[2])
+            return {"trial_id": trial_id, "params": params, "value": value}
+
+    def optimize(self, objective, n_trials, n_workers=1):
+        """
+        Run a search with asynchronous parallel workers.
+
+        A new trial is asked as soon as any worker finishes, so fast configurations
+        never wait for slow ones. Uses threads, because model fitting in scikit-learn
+        and XGBoost releases the GIL.
+
+        Args:
+            objective (callable): Maps a params dict to an objective value (lower is better).
+            n_trials (int): Total number of trials to run.
+            n_workers (int, optional): Number of concurrent trials. Defaults to 1.
+
+        Returns:
+            list[dict]: Finished trials in completion order with keys "trial_id", "params", and "value".
+        """
+        results = []
+        running = {}
+        n_submitted = 0
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            while n_submitted < n_trials or running:
+                while n_submitted < n_trials and len(running) < n_workers:
+                    trial_id, params = self.ask()
+                    running[executor.submit(objective, params)] = (trial_id, params)
+                    n_submitted += 1
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial_id, params = running.pop(future)
+                    value = future.result()
+                    self.tell(trial_id, value)
+                    results.append({"trial_id": trial_id, "params": params, "value": value})
+        return results
+
+    @abc.abstractmethod
+    def _propose(self, trial_id):
+        """Return the params dict of a new trial (called under the sampler lock)."""
+
+
+class RandomSearchSampler(_BaseSampler):
+    """
+    Randomized search with the ask/tell interface.
+
+    Pre-samples all configurations with ParameterSampler, so the trials are identical
+    to list(ParameterSampler(param_distributions, n_iter, random_state)).
+
+    Args:
+        param_distributions (dict): Search space from src/params.py.
+        n_iter (int): Number of configurations to sample.
+        random_state (int, optional): Seed for reproducible sampling. Defaults to RANDOM_STATE.
+    """
+
+    def __init__(self, param_distributions, n_iter, random_state=RANDOM_STATE):
+        super().__init__()
+        self.param_list = list(ParameterSampler(param_distributions, n_iter=n_iter, random_state=random_state))
+
+    def _propose(self, trial_id):
+        if trial_id >= len(self.param_list):
+            raise ValueError(f"RandomSearchSampler: All {len(self.param_list)} sampled configurations have been asked.")
+        return self.param_list[trial_id]
+
+
+class TPESampler(_BaseSampler):
+    """
+    Tree-structured Parzen Estimator (TPE) for sequential model-based search.
+
+    The first n_startup_trials configurations are drawn from the prior distributions
+    in src/params.py. Afterwards, each proposal splits the finished trials into the
+    best gamma fraction ("good") and the rest plus pending trials ("bad"), fits an
+    independent Parzen estimator per hyperparameter to each group, draws
+    n_ei_candidates from the good densities, and returns the candidate with the
+    highest log l(x) - log g(x) (equivalent to maximizing expected improvement).
+
+    Numeric dimensions use truncated Gaussian kernels (on a log scale for loguniform),
+    with bandwidths set by the distance to neighboring observations. Categorical
+    dimensions use smoothed category frequencies.
+
+    Args:
+        param_distributions (dict): Search space from src/params.py.
+        n_startup_trials (int, optional): Random trials before the model is used. Defaults to 10.
+        n_ei_candidates (int, optional): Candidates scored per proposal. Defaults to 24.
+        gamma (float, optional): Fraction of finished trials considered "good". Defaults to 0.25.
+        random_state (int, optional): Seed for reproducible proposals. Defaults to RANDOM_STATE.
+    """
+
+    def __init__(self, param_distributions, n_startup_trials=10, n_ei_candidates=24, gamma=0.25, random_state=RANDOM_STATE):
+        super().__init__()
+        if not 0 < gamma < 1:
+            raise ValueError("TPESampler: 'gamma' must be between 0 and 1.")
+        self.dimensions = describe_search_space(param_distributions)
+        self.n_startup_trials = max(n_startup_trials, 2)  # Both groups need at least one observation
+        self.n_ei_candidates = n_ei_candidates
+        self.gamma = gamma
+        self.rng = np.random.default_rng(random_state)
+
+    def _propose(self, trial_id):
+        if len(self._completed) < self.n_startup_trials:
+            return self._sample_prior()
+
+        # Split finished trials by objective value; pending trials count as bad (constant liar)
+        ranked = sorted(self._completed, key=lambda trial: trial[2])
+        n_good = max(1, math.ceil(self.gamma * len(ranked)))
+        good = [params for _, params, _ in ranked[:n_good]]
+        bad = [params for _, params, _ in ranked[n_good:]] + list(self._pending.values())
+
+        candidates = np.empty((self.n_ei_candidates, len(self.dimensions)))
+        scores = np.zeros(self.n_ei_candidates)
+        for j, dimension in enumerate(self.dimensions):
+            good_values = np.array([_to_internal(dimension, params[dimension["name"]]) for params in good])
+            bad_values = np.array([_to_internal(dimension, params[dimension["name"]]) for params in bad])
+            if dimension["kind"] == "categorical":
+                good_probs = self._categorical_probs(dimension, good_values)
+                bad_probs = self._categorical_probs(dimension, bad_values)
+                draws = self.rng.choice(len(good_probs), size=self.n_ei_candidates, p=good_probs)
+                scores += np.log(good_probs[draws]) - np.log(bad_probs[draws])
+            else:
+                good_kernels = self._parzen_kernels(dimension, good_values)
+                bad_kernels = self._parzen_kernels(dimension, bad_values)
+                draws = self._sample_kernels(good_kernels)
+                scores += self._kernel_logpdf(good_kernels, draws) - self._kernel_logpdf(bad_kernels, draws)
+            candidates[:, j] = draws
+
+        best = candidates[np.argmax(scores)]
+        return {dimension["name"]: _from_internal(dimension, x) for dimension, x in zip(self.dimensions, best)}
+
+    def _sample_prior(self):
+        """Draw one configuration from the prior distributions (as in randomized search)."""
+        params = {}
+        for dimension in self.dimensions:
+            if dimension["kind"] == "categorical":
+                x = float(self.rng.integers(len(dimension["choices"])))
+            else:
+                x = _to_internal(dimension, dimension["distribution"].rvs(random_state=self.rng))
+            params[dimension["name"]] = _from_internal(dimension, x)
+        return params
+
+    @staticmethod
+    def _categorical_probs(dimension, values):
+        """Category frequencies with one pseudo-count per category (uniform prior)."""
+        counts = np.bincount(values.astype(int), minlength=len(dimension["choices"])) + 1.0
+        return counts / counts.sum()
+
+    @staticmethod
+    def _parzen_kernels(dimension, values):
+        """Gaussian kernel centers and bandwidths, including one wide prior kernel."""
+        low, high = dimension["low"], dimension["high"]
+        span = high - low
+        mus = np.append(values, 0.5 * (low + high))
+
+        # Bandwidth: Distance to the farther neighbor, clipped to a sensible range
+        order = np.argsort(mus)
+        padded = np.concatenate([[low], mus[order], [high]])
+        sigmas = np.empty_like(mus)
+        sigmas[order] = np.maximum(padded[1:-1] - padded[:-2], padded[2:] - padded[1:-1])
+        sigmas = np.clip(sigmas, span / min(100, len(mus) + 1), span)
+        sigmas[-1] = span  # Prior kernel covers the whole range
+        return {"mus": mus, "sigmas": sigmas, "low": low, "high": high}
+
+    def _sample_kernels(self, kernels):
+        """Draw n_ei_candidates values from an equally weighted mixture of truncated Gaussians."""
+        idx = self.rng.integers(len(kernels["mus"]), size=self.n_ei_candidates)
+        mus, sigmas = kernels["mus"][idx], kernels["sigmas"][idx]
+        a, b = (kernels["low"] - mus) / sigmas, (kernels["high"] - mus) / sigmas
+        return truncnorm.rvs(a, b, loc=mus, scale=sigmas, random_state=self.rng)
+
+    @staticmethod
+    def _kernel_logpdf(kernels, x):
+        """Log density of the kernel mixture at each value in x."""
+        mus, sigmas = kernels["mus"][None, :], kernels["sigmas"][None, :]
+        a, b = (kernels["low"] - mus) / sigmas, (kernels["high"] - mus) / sigmas
+        log_pdfs = truncnorm.logpdf(x[:, None], a, b, loc=mus, scale=sigmas)
+        return logsumexp(log_pdfs, axis=1) - np.log(len(kernels["mus"]))
+
+
+# ==================================
+# Elastic Net Regularization Path
+# ==================================
+
+def prepare_weighted_design(X, y, sample_weight):
+    """
+    Center and rescale a design matrix the same way ElasticNet.fit does for sample weights.
+
+    Weights are normalized to sum to n_samples, features and target are centered on their
+    weighted means, and rows are multiplied by sqrt(weight). Solving an unweighted Elastic Net
+    path on the result is equivalent to ElasticNet(...).fit(X, y, sample_weight=sample_weight).
+    The design, including its Gram matrix, is computed once and reused for every
+    (l1_ratio, alpha) combination.
+
+    Args:
+        X (np.ndarray): Feature matrix (e.g., polynomial-expanded training features).
+        y (np.ndarray): Target variable (e.g., log1p-transformed costs).
+        sample_weight (array-like): Sample weights.
+
+    Returns:
+        dict: "X" and "y" (rescaled, Fortran-ordered for coordinate descent), their "gram" (X^T X)
+            and "Xy" (X^T y) products, and the "X_offset" and "y_offset" needed to recover the intercept.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(sample_weight, dtype=np.float64)
+    w = w * (len(w) / w.sum())
+
+    X_offset = np.average(X, axis=0, weights=w)
+    y_offset = np.average(y, weights=w)
+    sqrt_w = np.sqrt(w)
+    X_rescaled = np.asfortranarray((X - X_offset) * sqrt_w[:, None])
+    y_rescaled = (y - y_offset) * sqrt_w
+    return {
+        "X": X_rescaled,
+        "y": y_rescaled,
+        "gram": np.ascontiguousarray(X_rescaled.T @ X_rescaled),
+        "Xy": X_rescaled.T @ y_rescaled,
+        "X_offset": X_offset,
+        "y_offset": y_offset,
+    }
+
+
+def weighted_elastic_net_path(design, l1_ratio, alphas, coef_init=None, max_iter=2000, tol=1e-4):
+    """
+    Solve a warm-started Elastic Net regularization path on a weighted design.
+
+    Coordinate descent solves the alphas from largest to smallest, starting each solve from
+    the previous solution, which converges much faster than independent cold-start fits.
+    Each coordinate update runs on the precomputed Gram matrix, so its cost depends on the
+    number of features rather than the number of training rows.
+
+    Args:
+        design (dict): Output of prepare_weighted_design().
+        l1_ratio (float): Penalty mix (0=Ridge, 1=Lasso).
+        alphas (array-like): Regularization strengths, in any order.
+        coef_init (np.ndarray, optional): Starting coefficients for the largest alpha. Defaults to zeros.
+        max_iter (int, optional): Maximum coordinate descent iterations per alpha. Defaults to 2000.
+        tol (float, optional): Convergence tolerance (same meaning as in ElasticNet). Defaults to 1e-4.
+
+    Returns:
+        tuple: (coefs, intercepts) with coefs of shape (n_features, n_alphas) and intercepts of
+            shape (n_alphas,), both in the order of the input alphas.
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    order = np.argsort(alphas)[::-1]  # Path runs from strongest to weakest regularization
+    _, coefs_sorted, _ = enet_path(
+        design["X"], design["y"],
+        l1_ratio=l1_ratio,
+        alphas=alphas[order],
+        precompute=design["gram"],
+        Xy=design["Xy"],
+        coef_init=coef_init,
+        max_iter=max_iter,
+        tol=tol,
+        check_input=False,
+    )
+    coefs = np.empty_like(coefs_sorted)
+    coefs[:, order] = coefs_sorted
+    intercepts = design["y_offset"] - design["X_offset"] @ coefs
+    return coefs, intercepts
+
+
+# =========================
+# Sampler Factory
+# =========================
+
+def get_param_sampler(param_distributions, n_iter, sampler="random", random_state=RANDOM_STATE):
+    """
+    Create a hyperparameter sampler for a search space from src/params.py.
+
+    Args:
+        param_distributions (dict): Search space (e.g., XGB_PARAM_DISTRIBUTIONS).
+        n_iter (int): Number of trials the search will run.
+        sampler (str, optional): "random" for randomized search or "tpe" for
+            Tree-structured Parzen Estimator search. Defaults to "random".
+        random_state (int, optional): Seed for reproducible sampling. Defaults to RANDOM_STATE.
+
+    Returns:
+        RandomSearchSampler or TPESampler: Sampler with ask/tell interface.
+    """
+    if sampler == "random":
+        return RandomSearchSampler(param_distributions, n_iter=n_iter, random_state=random_state)
+    if sampler == "tpe":
+        # Spend ~20% of the budget (at least 10 trials) on random exploration before modeling
+        return TPESampler(param_distributions, n_startup_trials=max(10, n_iter // 5), random_state=random_state)
+    raise ValueError(f"Unknown sampler '{sampler}'. Expected 'random' or 'tpe'.")
+
+
+# ==================================
+# Shared-Filesystem Trial Queue
+# ==================================
+
+def _json_default(value):
+    """Convert NumPy scalars (e.g., sampled by scipy.stats) to native Python types for JSON."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temporary file next to path and rename it, so readers never see partial files."""
+    tmp_path = path.with_name(f".{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=_json_default)
+    os.replace(tmp_path, path)
+
+
+class FileTrialQueue:
+    """
+    Trial queue on a shared filesystem (e.g., an NFS mount) for multi-node hyperparameter search.
+
+    A coordinator puts sampled configurations into the queue, and any number of worker 
+    processes on any host that mounts the same directory claim, run, and complete them. 
+    No broker is required: claims are serialized by an exclusive lock file (created with 
+    O_CREAT | O_EXCL, which is atomic on local filesystems and NFSv3+), and every state 
+    file is written to a temporary file and renamed into place.
+
+    Directory layout:
+        queue.lock              Lock file held while claiming or enqueuing trials (holds the owner's unique token).
+        closed                  Marker written by the coordinator once all trials are enqueued.
+        pending/00001.json      Trials waiting for a worker.
+        running/00001.json      Claimed trials (with worker id and claim time).
+        results/00001.json      Finished trials (metrics or error message).
+    """
+
+    def __init__(self, queue_dir, lock_timeout=60.0, poll_interval=0.2):
+        """
+        Args:
+            queue_dir (str or Path): Shared queue directory (created if missing).
+            lock_timeout (float, optional): Age in seconds after which a lock file left behind by a 
+                crashed process is removed. Defaults to 60.0.
+            poll_interval (float, optional): Seconds between lock acquisition attempts. Defaults to 0.2.
+        """
+        self.queue_dir = Path(queue_dir)
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        for state in ["pending", "running", "results"]:
+            (self.queue_dir / state).mkdir(parents=True, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        lock_path = self.queue_dir / "queue.lock"
+        token = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}"
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                # Break locks left behind by crashed processes
+                with contextlib.suppress(FileNotFoundError):
+                    if time.time() - lock_path.stat().st_mtime > self.lock_timeout:
+                        lock_path.unlink()
+                        continue
+                time.sleep(self.poll_interval)
+        try:
+            os.write(fd, token.encode())
+            os.close(fd)
+            yield
+        finally:
+            # Remove only our own lock: a slow holder's lock may have been broken as stale and taken by another process
+            with contextlib.suppress(FileNotFoundError):
+                if lock_path.read_text(encoding="utf-8") == token:
+                    lock_path.unlink()
+
+    def _path(self, state, trial_id):
+        return self.queue_dir / state / f"{trial_id:05d}.json"
+
+    def _trial_ids(self, state):
+        return sorted(int(path.stem) for path in (self.queue_dir / state).glob("*.json"))
+
+    def put(self, trial_id, params):
+        """Enqueue a trial."""
+        with self._lock():
+            _write_json_atomic(self._path("pending", trial_id), {"trial_id": trial_id, "params": params})
+
+    def close(self):
+        """Mark that no more trials will be enqueued (idle workers exit once the queue is empty)."""
+        (self.queue_dir / "closed").touch()
+
+    @property
+    def closed(self):
+        """bool: Whether the coordinator has finished enqueuing trials."""
+        return (self.queue_dir / "closed").exists()
+
+    def claim(self, worker_id):
+        """
+        Claim the pending trial with the lowest trial id.
+
+        Returns:
+            tuple or None: (trial_id, params), or None if no trial is pending.
+        """
+        with self._lock():
+            pending_ids = self._trial_ids("pending")
+            if not pending_ids:
+                return None
+            trial_id = pending_ids[0]
+            with open(self._path("pending", trial_id), encoding="utf-8") as f:
+                trial = json.load(f)
+            _write_json_atomic(self._path("running", trial_id), {**trial, "worker": worker_id, "claimed_at": time.time()})
+            self._path("pending", trial_id).unlink()
+        return trial_id, trial["params"]
+
+    def complete(self, trial_id, params, worker_id, metrics=None, error=None):
+        """Record the metrics (or error message) of a claimed trial."""
+        result = {"trial_id": trial_id, "params": params, "worker": worker_id, "metrics": metrics, "error": error, "finished_at": time.time()}
+        _write_json_atomic(self._path("results", trial_id), result)
+        with contextlib.suppress(FileNotFoundError):
+            self._path("running", trial_id).unlink()
+
+    def results(self, exclude=()):
+        """
+        Read finished trials.
+
+        Args:
+            exclude (Iterable[int], optional): Trial ids already read by the caller. Defaults to ().
+
+        Returns:
+            list[dict]: Finished trials sorted by trial id ("trial_id", "params", "worker", "metrics", "error").
+        """
+        exclude = set(exclude)
+        results = []
+        for trial_id in self._trial_ids("results"):
+            if trial_id not in exclude:
+                with open(self._path("results", trial_id), encoding="utf-8") as f:
+                    results.append(json.load(f))
+        return results
+
+    def counts(self):
+        """dict: Number of pending, running, and finished trials."""
+        return {state: len(self._trial_ids(state)) for state in ["pending", "running", "results"]}
+
+    def requeue_stale(self, max_age):
+        """
+        Move trials claimed more than max_age seconds ago back to pending (e.g., after a worker crashed).
+
+        Returns:
+            list[int]: Requeued trial ids.
+        """
+        requeued = []
+        with self._lock():
+            for trial_id in self._trial_ids("running"):
+                running_path = self._path("running", trial_id)
+                with open(running_path, encoding="utf-8") as f:
+                    trial = json.load(f)
+                if time.time() - trial["claimed_at"] > max_age and not self._path("results", trial_id).exists():
+                    _write_json_atomic(self._path("pending", trial_id), {"trial_id": trial_id, "params": trial["params"]})
+                    running_path.unlink()
+                    requeued.append(trial_id)
+        return requeued
+
+
+def run_queue_worker(queue, objective, worker_id=None, poll_interval=1.0):
+    """
+    Claim and run trials from a FileTrialQueue until the coordinator has closed an empty queue.
+
+    Args:
+        queue (FileTrialQueue): Shared trial queue.
+        objective (callable): Maps a params dict to a dict of metrics (e.g., including "val_mdae").
+        worker_id (str, optional): Worker name recorded with each trial. Defaults to "<hostname>-<pid>".
+        poll_interval (float, optional): Seconds to wait before polling an empty queue again. Defaults to 1.0.
+
+    Returns:
+        int: Number of trials run by this worker.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    n_trials = 0
+    while True:
+        trial = queue.claim(worker_id)
+        if trial is None:
+            if queue.closed:
+                return n_trials
+            time.sleep(poll_interval)
+            continue
+
+        trial_id, params = trial
+        try:
+            metrics = objective(params)
+        except Exception as e:
+            # Record the failure, so the coordinator does not wait for this trial forever
+            queue.complete(trial_id, params, worker_id, error=f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(trial_id, params, worker_id, metrics=metrics)
+        n_trials += 1
@@ -0,0 +1,76 @@
+"""Unit tests for the global SHAP importance stage.
+
+These tests focus on resumability and the columnar results: checkpoints are kept only
+for the same artifact fingerprint, checkpoint writes are atomic, and every chunk frame
+holds the input values, SHAP values, and a prediction equal to baseline plus values.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_compute_global_shap.py
+"""
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("xgboost")
+
+import numpy as np
+import pandas as pd
+
+from scripts import compute_global_shap as stage
+from src.constants import WEIGHT_COLUMN
+from src.explainability import SHAP_INPUT_FEATURES
+
+pytestmark = pytest.mark.unit
+
+
+def test_checkpoints_are_kept_only_for_the_same_fingerprint(tmp_path):
+    checkpoint_dir = tmp_path / "shap_checkpoints"
+
+    assert not stage.prepare_checkpoint_dir(checkpoint_dir, "model-a")
+    checkpoint_path = stage.get_checkpoint_path(checkpoint_dir, "validation", 0)
+    stage.write_checkpoint(pd.DataFrame({"value": [1.0]}), checkpoint_path)
+
+    assert stage.prepare_checkpoint_dir(checkpoint_dir, "model-a")
+    assert checkpoint_path.exists()
+    assert not list(checkpoint_dir.glob(".*.tmp"))
+
+    assert not stage.prepare_checkpoint_dir(checkpoint_dir, "model-b")
+    assert not checkpoint_path.exists()
+
+
+def test_artifact_fingerprint_changes_with_artifacts_and_configuration(tmp_path):
+    artifact = tmp_path / "model.ubj"
+    artifact.write_bytes(b"trees-v1")
+    configuration = {"explanation_mode": "permutation", "max_evals": 165}
+
+    fingerprint = stage.get_artifact_fingerprint([artifact], configuration)
+
+    assert stage.get_artifact_fingerprint([artifact], dict(configuration)) == fingerprint
+    assert stage.get_artifact_fingerprint([artifact], {**configuration, "max_evals": 330}) != fingerprint
+    artifact.write_bytes(b"trees-v2")
+    assert stage.get_artifact_fingerprint([artifact], configuration) != fingerprint
+
+
+def test_artifact_fingerprint_covers_the_explained_splits():
+    for path in stage.SPLITS.values():
+        assert path in stage.FINGERPRINT_ARTIFACT_PATHS
+
+
+def test_artifact_fingerprint_covers_the_quantile_model_sidecar():
+    assert stage.QUANTILE_MODEL_PATH.with_suffix(".json") in stage.FINGERPRINT_ARTIFACT_PATHS
+
+
+def test_chunk_frame_holds_inputs_shap_values_and_prediction():
+    index = pd.Index(["10001101", "10001102"], name="DUPERSID")
+    df_chunk = pd.DataFrame(np.arange(2 * len(SHAP_INPUT_FEATURES), dtype=float).reshape(2, -1), index=index, columns=SHAP_INPUT_FEATURES)
+    df_chunk[WEIGHT_COLUMN] = [1500.0, 2500.0]
+    values = np.full((2, len(SHAP_INPUT_FEATURES)), 2.0)
+    base_values = np.array([500.0, 500.0])
+
+    df_frame = stage.create_chunk_frame(df_chunk, "test", values, base_values)
+
+    assert df_frame.index.equals(index)
+    assert (df_frame[stage.SPLIT_COLUMN] == "test").all()
+    pd.testing.assert_frame_equal(df_frame[SHAP_INPUT_FEATURES], df_chunk[SHAP_INPUT_FEATURES])
+    np.testing.assert_allclose(df_frame[stage.PREDICTION_COLUMN], 500.0 + 2.0 * len(SHAP_INPUT_FEATURES))
+    np.testing.assert_allclose(df_frame[f"{stage.SHAP_COLUMN_PREFIX}AGE23X"], 2.0)
@@ -0,0 +1,628 @@
+"""Unit tests for the batched SHAP explanation engine.
+
+These tests focus on keeping the fast explanation path interchangeable with the
+specified one: the compiled preprocessor must reproduce the fitted preprocessing
+pipeline column for column (including imputation), the sliced quantile booster
+must predict the same q25/q50 values as the full model, and the batched
+permutation explainer must return the same SHAP values, baselines, and top
+drivers as shap.Explainer over the full q50 callable. The configuration benchmark
+metrics (top-k overlap, sign stability, background validation) are checked on
+hand-made SHAP values, and summarized (k-medoids) backgrounds must keep the
+weighted training baseline and carry their weights through the explainer. Incremental
+what-if sessions must return the same quantiles and SHAP values as a full recomputation. Counterfactual
+sweeps must predict the grid like the fitted pipeline, with inflation applied once.
+Explanation jobs must return each result once, reject submissions when full, and
+expire unread results after their TTL. Batch explanations must return top drivers in
+request order independent of chunking, and enforce the row budget and concurrency cap.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_explainability.py
+"""
+
+import itertools
+import logging
+import subprocess
+import sys
+import threading
+import warnings
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("xgboost")
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import TransformedTargetRegressor
+from xgboost import DMatrix, XGBRegressor
+
+from src.constants import (
+    PIPELINE_BINARY_FEATURES,
+    PIPELINE_NOMINAL_FEATURES,
+    PIPELINE_NUMERICAL_FEATURES,
+    PIPELINE_OPTIONAL_FEATURES,
+    PIPELINE_REQUIRED_FEATURES,
+    RANDOM_STATE,
+)
+from src.explainability import (
+    SHAP_FEATURE_HIERARCHY,
+    SHAP_INPUT_FEATURES,
+    BatchExplainer,
+    CompiledPreprocessor,
+    CounterfactualSweep,
+    ExplanationJobQueue,
+    PartitionShapExplainer,
+    PermutationShapExplainer,
+    TreeShapExplainer,
+    WhatIfSession,
+    build_shap_background,
+    calculate_top_k_stability,
+    create_shap_explainer,
+    evaluate_tree_shap_fidelity,
+    get_top_drivers,
+    load_shap_background,
+    save_shap_background,
+    slice_quantile_booster,
+    summarize_global_importance,
+    validate_shap_background,
+)
+from src.pipeline import create_preprocessing_pipeline, postprocess_quantile_predictions
+from src.transformers import MedicalFeatureDeriver
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture(scope="module")
+def preprocessor_input_data():
+    rng = np.random.default_rng(0)
+    n = 1500
+    X = pd.DataFrame({
+        "AGE23X": rng.integers(18, 86, n),
+        "FAMSZE23": rng.integers(1, 8, n),
+        "RTHLTH31": rng.integers(1, 6, n),
+        "MNHLTH31": rng.integers(1, 6, n),
+        "POVCAT23": rng.integers(1, 6, n),
+        "REGION23": rng.integers(1, 5, n),
+        "MARRY31X_GRP": rng.integers(1, 6, n),
+        "INSCOV23": rng.integers(1, 4, n),
+        "HIDEG": rng.integers(1, 8, n),
+    }).astype(float)
+    for feature in PIPELINE_BINARY_FEATURES:
+        X[feature] = (rng.random(n) < 0.2).astype(float)
+    X = X[SHAP_INPUT_FEATURES]
+    for feature in ["FAMSZE23", "MNHLTH31", "HIDEG", "MARRY31X_GRP", "DIABDX_M18", "ADLHLP31"]:
+        X.loc[rng.random(n) < 0.05, feature] = np.nan  # Optional inputs the pipeline imputes
+    risk = 0.03 * X["AGE23X"] + X[["HIBPDX", "CHOLDX", "ARTHDX"]].sum(axis=1) + (X["INSCOV23"] == 1)
+    # Zero-inflated, heavy-tailed costs as in MEPS
+    y = pd.Series(np.where(rng.random(n) < 0.25, 0.0, np.exp(3 + risk + rng.normal(0, 1, n))))
+    w = pd.Series(rng.uniform(500, 20_000, n))
+    return X, y, w
+
+
+@pytest.fixture(scope="module")
+def fitted_artifacts(preprocessor_input_data):
+    X, y, w = preprocessor_input_data
+    preprocessor = create_preprocessing_pipeline(
+        PIPELINE_REQUIRED_FEATURES,
+        PIPELINE_OPTIONAL_FEATURES,
+        PIPELINE_NUMERICAL_FEATURES,
+        PIPELINE_NOMINAL_FEATURES,
+        PIPELINE_BINARY_FEATURES,
+        strict=False,
+    )
+    logging.disable(logging.WARNING)  # MissingValueChecker logs the imputed optional inputs
+    try:
+        X_model_ready = preprocessor.fit_transform(X)
+    finally:
+        logging.disable(logging.NOTSET)
+    model = TransformedTargetRegressor(
+        regressor=XGBRegressor(objective="reg:quantileerror", quantile_alpha=np.array([0.25, 0.5, 0.75, 0.9]), n_estimators=30, max_depth=4, n_jobs=1),
+        func=np.log1p,
+        inverse_func=np.expm1
+    ).fit(X_model_ready, y, sample_weight=w)
+    return preprocessor, model
+
+
+def _predict_median_cost(preprocessor, model, X):
+    """q50 callable as specified in notebooks/2_modeling.py."""
+    if not isinstance(X, pd.DataFrame):
+        X = pd.DataFrame(np.asarray(X), columns=SHAP_INPUT_FEATURES)
+    logging.disable(logging.WARNING)
+    try:
+        X_model_ready = preprocessor.transform(X.loc[:, SHAP_INPUT_FEATURES])
+    finally:
+        logging.disable(logging.NOTSET)
+    return postprocess_quantile_predictions(model.predict(X_model_ready))[:, 1]
+
+
+def test_explainability_imports_without_training_stack():
+    code = "import sys, src.explainability; print(sorted({'mlflow', 'yaml', 'src.modeling'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_compiled_preprocessor_matches_fitted_pipeline(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, _ = fitted_artifacts
+    compiled_preprocessor = CompiledPreprocessor(preprocessor)
+
+    logging.disable(logging.WARNING)
+    try:
+        X_expected = preprocessor.transform(X)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    assert compiled_preprocessor.feature_names_out == list(X_expected.columns)
+    np.testing.assert_allclose(compiled_preprocessor.transform(X.to_numpy()), X_expected.to_numpy(), rtol=0, atol=1e-12)
+
+
+def test_compiled_preprocessor_rejects_unknown_nominal_codes(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    compiled_preprocessor = CompiledPreprocessor(fitted_artifacts[0])
+
+    with pytest.raises(ValueError, match="unknown codes \\[9.0\\] in 'INSCOV23'"):
+        compiled_preprocessor.transform(X.head(3).assign(INSCOV23=9.0))
+
+
+def test_compiled_preprocessor_recomputes_only_affected_columns(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    compiled_preprocessor = CompiledPreprocessor(fitted_artifacts[0])
+    X_model_ready = compiled_preprocessor.transform(X.to_numpy())
+
+    for column, feature in enumerate(SHAP_INPUT_FEATURES):
+        positions, values = compiled_preprocessor.transform_columns(X.to_numpy(), [column])
+        affected = {compiled_preprocessor.feature_names_out[position] for position in positions}
+        np.testing.assert_array_equal(values, X_model_ready[:, positions])
+        if feature in MedicalFeatureDeriver.CHRONIC_CONDITION_FEATURES:
+            assert affected == {feature, "CHRONIC_COUNT"}
+        elif feature in MedicalFeatureDeriver.FUNCTIONAL_LIMITATION_FEATURES:
+            assert affected == {feature, "LIMITATION_COUNT"}
+        elif feature in PIPELINE_NOMINAL_FEATURES:
+            assert affected and all(name.startswith(f"{feature}_") for name in affected)
+        else:
+            assert affected == {feature}
+
+
+def test_sliced_quantile_booster_predicts_selected_quantiles(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    X_model_ready = CompiledPreprocessor(preprocessor).transform(X)
+    booster = model.regressor_.get_booster()
+
+    sliced_booster = slice_quantile_booster(booster, [0, 1])
+
+    np.testing.assert_array_equal(sliced_booster.inplace_predict(X_model_ready), booster.inplace_predict(X_model_ready)[:, :2])
+
+
+def test_permutation_explainer_matches_shap_explainer(preprocessor_input_data, fitted_artifacts):
+    shap = pytest.importorskip("shap")
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=50, weights=w, replace=True, random_state=42)
+    X_profiles = X.iloc[:3]
+
+    explainer = PermutationShapExplainer(preprocessor, model, background, max_evals=165, seed=42)
+    shap_explainer = shap.Explainer(
+        lambda X_masked: _predict_median_cost(preprocessor, model, X_masked),
+        shap.maskers.Independent(background, max_samples=len(background)),
+        algorithm="permutation",
+        seed=42,
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        shap_explanation = shap_explainer(X_profiles, max_evals=165, silent=True)
+    explanation = explainer.explain(X_profiles)
+
+    np.testing.assert_allclose(explanation["values"], shap_explanation.values, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(explanation["base_values"], shap_explanation.base_values, rtol=0, atol=1e-9)
+    for values, shap_values in zip(explanation["values"], shap_explanation.values):
+        assert [feature for feature, _ in get_top_drivers(values)] == [feature for feature, _ in get_top_drivers(shap_values)]
+
+
+def test_permutation_explainer_is_additive(preprocessor_input_data, fitted_artifacts):
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=50, weights=w, replace=True, random_state=42)
+    X_profiles = X.iloc[3:6]
+
+    explanation = PermutationShapExplainer(preprocessor, model, background, max_evals=110).explain(X_profiles)
+
+    np.testing.assert_allclose(
+        explanation["base_values"] + explanation["values"].sum(axis=1),
+        _predict_median_cost(preprocessor, model, X_profiles),
+        rtol=1e-9,
+    )
+    assert explanation["base_values"] == pytest.approx(_predict_median_cost(preprocessor, model, background).mean())
+
+
+def _owen_values(preprocessor, model, background, x, feature_hierarchy):
+    """Owen values of one profile by enumerating the sibling contexts of every feature in the binarized hierarchy."""
+    def binarize(nodes):
+        nodes = [binarize(list(node.values()) if isinstance(node, dict) else node) if not isinstance(node, str) else node for node in nodes]
+        while len(nodes) > 2:
+            nodes = [binarize(nodes[: len(nodes) // 2]), binarize(nodes[len(nodes) // 2:])]
+        return nodes[0] if len(nodes) == 1 else tuple(nodes)
+
+    def leaves(node):
+        return [node] if isinstance(node, str) else leaves(node[0]) + leaves(node[1])
+
+    def sibling_paths(node, siblings):
+        if isinstance(node, str):
+            yield node, siblings
+        else:
+            yield from sibling_paths(node[0], siblings + [leaves(node[1])])
+            yield from sibling_paths(node[1], siblings + [leaves(node[0])])
+
+    feature_contexts = {}
+    for feature, siblings in sibling_paths(binarize(list(feature_hierarchy.values())), []):
+        feature_contexts[feature] = [
+            frozenset(f for switched_on, group in zip(switches, siblings) if switched_on for f in group)
+            for switches in itertools.product([False, True], repeat=len(siblings))
+        ]
+    coalitions = sorted({c for feature, contexts in feature_contexts.items() for context in contexts for c in (context, context | {feature})}, key=sorted)
+
+    # One pipeline call for all masked rows of all coalitions
+    masked_rows = []
+    for coalition in coalitions:
+        X_masked = background.copy()
+        X_masked.loc[:, sorted(coalition)] = x[sorted(coalition)].to_numpy()
+        masked_rows.append(X_masked)
+    outputs = _predict_median_cost(preprocessor, model, pd.concat(masked_rows)).reshape(len(coalitions), -1).mean(axis=1)
+    output_by_coalition = dict(zip(coalitions, outputs))
+    return np.array([
+        np.mean([output_by_coalition[context | {feature}] - output_by_coalition[context] for context in feature_contexts[feature]])
+        for feature in SHAP_INPUT_FEATURES
+    ])
+
+
+def test_partition_explainer_matches_owen_values(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=8, random_state=42).reset_index(drop=True)
+    x = X.iloc[7]
+
+    explanation = PartitionShapExplainer(preprocessor, model, background).explain(x.to_frame().T)
+
+    expected = _owen_values(preprocessor, model, background, x, SHAP_FEATURE_HIERARCHY)
+    np.testing.assert_allclose(explanation["values"][0], expected, rtol=1e-9, atol=1e-9)
+
+
+def test_partition_explainer_is_additive_and_reports_group_values(preprocessor_input_data, fitted_artifacts):
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=50, weights=w, replace=True, random_state=42)
+    X_profiles = X.iloc[3:6]
+
+    explainer = PartitionShapExplainer(preprocessor, model, background)
+    explanation = explainer.explain(X_profiles)
+
+    np.testing.assert_allclose(
+        explanation["base_values"] + explanation["values"].sum(axis=1),
+        _predict_median_cost(preprocessor, model, X_profiles),
+        rtol=1e-9,
+    )
+    assert explanation["group_names"] == ["Chronic conditions", "Functional limitations", "Health status", "Socioeconomic", "Demographic"]
+    np.testing.assert_allclose(explanation["group_values"].sum(axis=1), explanation["values"].sum(axis=1), rtol=1e-9)
+    chronic_index = [SHAP_INPUT_FEATURES.index(feature) for feature in SHAP_FEATURE_HIERARCHY["Health"]["Chronic conditions"]]
+    np.testing.assert_allclose(explanation["group_values"][:, 0], explanation["values"][:, chronic_index].sum(axis=1), rtol=1e-9)
+    assert explainer.max_evals == 556  # Distinct coalitions of the binarized hierarchy
+
+
+def test_partition_explainer_values_depend_on_the_binarization_order(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=8, random_state=42).reset_index(drop=True)
+    x = X.iloc[7].to_frame().T
+    # Same declared 3-way top-level grouping, other listed order: Demographic | (Health | Socioeconomic)
+    reordered = {group: SHAP_FEATURE_HIERARCHY[group] for group in ["Demographic", "Health", "Socioeconomic"]}
+
+    values = PartitionShapExplainer(preprocessor, model, background).explain(x)["values"][0]
+    reordered_values = PartitionShapExplainer(preprocessor, model, background, feature_hierarchy=reordered).explain(x)["values"][0]
+
+    np.testing.assert_allclose(reordered_values.sum(), values.sum(), rtol=1e-9)
+    assert not np.allclose(reordered_values, values)
+
+
+def test_partition_explainer_rejects_incomplete_hierarchy(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    hierarchy = {"Health": SHAP_FEATURE_HIERARCHY["Health"], "Demographic": SHAP_FEATURE_HIERARCHY["Demographic"]}
+
+    with pytest.raises(ValueError, match="every SHAP input feature exactly once"):
+        PartitionShapExplainer(preprocessor, model, X.iloc[:5], feature_hierarchy=hierarchy)
+
+
+def test_tree_shap_explainer_is_additive_in_dollars(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    X_profiles = X.iloc[:20]
+
+    explanation = TreeShapExplainer(preprocessor, model).explain(X_profiles)
+
+    np.testing.assert_allclose(
+        explanation["base_values"] + explanation["values"].sum(axis=1) + explanation["postprocessing_adjustments"],
+        _predict_median_cost(preprocessor, model, X_profiles),
+        rtol=1e-5,
+    )
+    np.testing.assert_array_equal(np.sign(explanation["values"]), np.sign(explanation["log_values"]))
+
+
+def test_tree_shap_explainer_maps_contributions_back_to_inputs(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    X_profiles = X.iloc[:20]
+    X_model_ready = preprocessor.transform(X_profiles)
+    booster = model.regressor_.get_booster()
+    contributions = pd.DataFrame(
+        booster.predict(DMatrix(X_model_ready), pred_contribs=True, strict_shape=True)[:, 1, :-1],
+        columns=X_model_ready.columns,
+    )
+
+    log_values = pd.DataFrame(TreeShapExplainer(preprocessor, model).explain(X_profiles)["log_values"], columns=SHAP_INPUT_FEATURES)
+
+    np.testing.assert_allclose(log_values.sum(axis=1), contributions.sum(axis=1), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(log_values["AGE23X"], contributions["AGE23X"], rtol=1e-6)
+    np.testing.assert_allclose(log_values["REGION23"], contributions.filter(like="REGION23_").sum(axis=1), rtol=1e-5, atol=1e-7)
+    chronic = X_profiles[MedicalFeatureDeriver.CHRONIC_CONDITION_FEATURES].fillna(0).eq(1)
+    recipients = chronic.where(chronic.any(axis=1), True, axis=0)
+    np.testing.assert_allclose(
+        log_values["HIBPDX"],
+        contributions["HIBPDX"] + contributions["CHRONIC_COUNT"] * recipients["HIBPDX"] / recipients.sum(axis=1),
+        rtol=1e-5,
+        atol=1e-7,
+    )
+
+
+@pytest.mark.parametrize("explanation_mode", ["permutation", "partition"])
+def test_what_if_session_matches_full_recomputation(preprocessor_input_data, fitted_artifacts, explanation_mode):
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background = X.sample(n=30, weights=w, replace=True, random_state=42)
+    explainer = create_shap_explainer(explanation_mode, preprocessor, model, background, max_evals=110)
+    profile = X.iloc[7].to_dict()
+    session = WhatIfSession(explainer, model, profile, seed=7)
+
+    for changes in [{"HIBPDX": 1 - profile["HIBPDX"]}, {"INSCOV23": 2.0}, {"AGE23X": 61.0, "WLKLIM31": 1.0}, {"MNHLTH31": np.nan}]:
+        result = session.update(changes)
+        profile.update(changes)
+        X_profile = pd.DataFrame([profile])[SHAP_INPUT_FEATURES]
+        expected = create_shap_explainer(explanation_mode, preprocessor, model, background, max_evals=110, seed=7).explain(X_profile)
+
+        np.testing.assert_allclose(result["values"], expected["values"][0], rtol=0, atol=1e-9)
+        assert result["base_value"] == pytest.approx(expected["base_values"][0])
+        np.testing.assert_allclose(result["quantiles"], postprocess_quantile_predictions(model.predict(preprocessor.transform(X_profile)))[0], rtol=1e-6)
+        assert result["evaluation"]["reused_rows"] > 0
+        if explanation_mode == "partition":
+            np.testing.assert_allclose(result["group_values"], expected["group_values"][0], rtol=0, atol=1e-9)
+
+    assert session.update({"AGE23X": profile["AGE23X"]}) is result
+
+
+def test_what_if_session_rejects_unknown_features(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    session = WhatIfSession(PermutationShapExplainer(preprocessor, model, X.iloc[:20], max_evals=110), model, X.iloc[0])
+
+    with pytest.raises(ValueError, match="Unknown input features \\['PERWT23F'\\]"):
+        session.update({"PERWT23F": 1.0})
+    with pytest.raises(ValueError, match="missing the input features \\['AGE23X'\\]"):
+        WhatIfSession(session.explainer, model, X.iloc[0].drop("AGE23X"))
+
+
+def test_counterfactual_sweep_matches_pipeline_predictions_with_inflation(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    medical_inflation = {"medical_cost_inflation_factor": 1.08, "target_period": "2026-05"}
+    profile = X.iloc[11].to_dict()
+
+    curve = CounterfactualSweep(preprocessor, model, medical_inflation).sweep(profile, ["AGE23X", "INSCOV23"], quantiles=["q50", "q90"])
+
+    X_grid = pd.DataFrame([{**profile, "AGE23X": age, "INSCOV23": insurance} for age in range(18, 86) for insurance in [1.0, 2.0, 3.0]])
+    expected = postprocess_quantile_predictions(model.predict(preprocessor.transform(X_grid[SHAP_INPUT_FEATURES])))
+    assert curve["currency_context"] == {"currency": "USD", "model_price_year": 2023, "output_price_year": 2026, "inflation_factor": 1.08}
+    assert curve["values"] == {"AGE23X": list(range(18, 86)), "INSCOV23": [1.0, 2.0, 3.0]}
+    np.testing.assert_allclose(curve["q50"], np.round(expected[:, 1] * 1.08).reshape(68, 3), atol=1)
+    np.testing.assert_allclose(curve["q90"], np.round(expected[:, 3] * 1.08).reshape(68, 3), atol=1)
+    assert "q25" not in curve
+
+
+def test_counterfactual_sweep_rejects_invalid_features(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    sweep = CounterfactualSweep(*fitted_artifacts)
+    profile = X.iloc[0].to_dict()
+
+    with pytest.raises(ValueError, match="one or two distinct features"):
+        sweep.sweep(profile, ["AGE23X", "INSCOV23", "RTHLTH31"])
+    with pytest.raises(ValueError, match="Unknown sweep features \\['SEX'\\]"):
+        sweep.sweep(profile, ["SEX"])
+    with pytest.raises(ValueError, match="unknown codes \\[9.0\\] in 'INSCOV23'"):
+        sweep.sweep(profile, ["INSCOV23"], values={"INSCOV23": [1.0, 9.0]})
+
+
+def test_explanation_job_returns_explanation_once(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    explainer = PermutationShapExplainer(*fitted_artifacts, X.iloc[:20], max_evals=110)
+    x = X.iloc[[3]]
+    expected = get_top_drivers(PermutationShapExplainer(*fitted_artifacts, X.iloc[:20], max_evals=110).explain(x)["values"][0])
+
+    with ExplanationJobQueue(lambda X_profile: get_top_drivers(explainer.explain(X_profile)["values"][0]), n_workers=1) as jobs:
+        handle = jobs.submit(x)
+        result = jobs.result(handle, timeout=30)
+
+        assert result == {"status": "ready", "explanation": expected}
+        assert jobs.result(handle) == {"status": "unavailable"}  # Removed on first read
+        metrics = jobs.metrics()
+    assert metrics["submitted"] == metrics["completed"] == 1
+    assert metrics["queue_depth"] == metrics["stored_results"] == 0
+    assert metrics["latency_p50"] is not None
+
+
+def test_explanation_jobs_are_rejected_when_queue_is_full():
+    release = threading.Event()
+    with ExplanationJobQueue(lambda X: release.wait(), n_workers=1, max_pending=2) as jobs:
+        handles = [jobs.submit(None) for _ in range(3)]
+
+        assert handles[2] is None
+        assert jobs.result(handles[0]) == {"status": "pending"}
+        assert jobs.metrics()["queue_depth"] == 2
+        assert jobs.metrics()["rejected"] == 1
+        release.set()
+        assert jobs.result(handles[1], timeout=30)["status"] == "ready"
+        assert jobs.submit(None) is not None  # Capacity is released when jobs finish
+
+
+def test_explanation_results_expire_after_ttl():
+    now = [0.0]
+    with ExplanationJobQueue(lambda X: X, result_ttl=60.0, clock=lambda: now[0]) as jobs:
+        kept, expired = jobs.submit("kept"), jobs.submit("expired")
+        jobs._jobs[expired]["future"].result(timeout=30)
+        jobs._jobs[kept]["future"].result(timeout=30)
+
+        now[0] = 30.0
+        assert jobs.result(kept) == {"status": "ready", "explanation": "kept"}
+        now[0] = 61.0
+        assert jobs.result(expired) == {"status": "unavailable"}
+        assert jobs.metrics()["expired"] == 1
+
+
+def test_failed_explanation_job_hides_error_details():
+    def explain(X):
+        raise ValueError("profile value 42")
+
+    with ExplanationJobQueue(explain) as jobs:
+        handle = jobs.submit(None)
+
+        assert jobs.result(handle, timeout=30) == {"status": "failed"}
+        assert jobs.metrics()["failed"] == 1
+
+
+def test_batch_explainer_returns_top_drivers_in_request_order(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+    background = X.iloc[:20]
+    X_batch = X.iloc[30:37]
+    reference = PermutationShapExplainer(*fitted_artifacts, background, max_evals=110)
+    expected = [
+        get_top_drivers(reference._explain_row(x, 110, random_state=np.random.RandomState(RANDOM_STATE + i))[0])
+        for i, x in enumerate(X_batch[SHAP_INPUT_FEATURES].to_numpy())
+    ]
+
+    with BatchExplainer(*fitted_artifacts, background, max_evals=110, n_workers=2) as batch_explainer:
+        drivers = batch_explainer.explain_batch(X_batch)
+        single_row_drivers = batch_explainer.explain_batch(X_batch.iloc[:1])
+
+    assert drivers == expected  # Independent of chunking across workers
+    assert single_row_drivers == expected[:1]
+    assert all(len(row_drivers) == 5 for row_drivers in drivers)
+
+
+def test_batch_explainer_enforces_row_budget_and_concurrency_cap(preprocessor_input_data, fitted_artifacts):
+    X, _, _ = preprocessor_input_data
+
+    with BatchExplainer(*fitted_artifacts, X.iloc[:10], max_evals=110, n_workers=1, max_rows_per_request=5, max_concurrent_rows=8) as batch_explainer:
+        with pytest.raises(ValueError, match="6 rows exceed the per-request budget of 5"):
+            batch_explainer.explain_batch(X.iloc[:6])
+        batch_explainer._active_rows = 4  # Rows of another running request
+        with pytest.raises(TimeoutError):
+            batch_explainer.explain_batch(X.iloc[:5], timeout=0.1)
+        assert len(batch_explainer.explain_batch(X.iloc[:4], timeout=30)) == 4
+        assert batch_explainer._active_rows == 4
+    with pytest.raises(ValueError, match="must not exceed max_concurrent_rows"):
+        BatchExplainer(*fitted_artifacts, X.iloc[:10], max_rows_per_request=10, max_concurrent_rows=5)
+
+
+def test_tree_shap_fidelity_allows_switch_only_if_top_k_drivers_agree():
+    reference = np.array([[100.0, -80.0, 60.0, 40.0, 30.0, 5.0, 1.0]])
+    agreeing = reference * 1.5
+    disagreeing = reference[:, ::-1].copy()
+    latencies = np.array([0.002])
+
+    assert evaluate_tree_shap_fidelity(agreeing, np.zeros(1), latencies, reference)["switch_allowed"]
+    assert not evaluate_tree_shap_fidelity(disagreeing, np.zeros(1), latencies, reference)["switch_allowed"]
+    assert not evaluate_tree_shap_fidelity(-agreeing, np.zeros(1), latencies, reference)["switch_allowed"]
+
+
+def test_top_k_stability_counts_overlap_sign_reversals_and_dollar_drift():
+    reference_values = np.array([
+        [300.0, -200.0, 100.0, 50.0, 40.0, 1.0, 0.0],
+        [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 0.0],
+    ])
+    values = np.array([
+        [310.0, -190.0, 110.0, 60.0, 0.0, 45.0, 0.0],  # 4 of 5 shared, same signs, $10 drift
+        [10.0, 20.0, 30.0, 40.0, -50.0, 60.0, 70.0],  # 4 of 5 shared, one material sign reversal
+    ])
+
+    stability = calculate_top_k_stability(values, reference_values)
+
+    assert stability["share_rows_with_min_top_k_matches"] == 1.0
+    assert stability["material_sign_comparison_count"] == 8
+    assert stability["material_sign_reversal_count"] == 1
+    assert stability["median_matched_top_k_abs_delta_2023_usd"] == pytest.approx(10.0)
+    assert stability["top_k_overlap_passed"] and stability["dollar_drift_passed"]
+    assert not stability["sign_stability_passed"]
+    assert not stability["explanation_stability_passed"]
+
+
+def test_global_importance_is_survey_weighted_and_ranked():
+    feature_names = ["AGE23X", "HIBPDX", "CHOLDX"]
+    values = np.array([[10.0, 100.0, -50.0], [-30.0, 0.0, 50.0]])
+    weights = np.array([1.0, 3.0])
+
+    summary = summarize_global_importance(values, weights, feature_names, {"Chronic conditions": ["HIBPDX", "CHOLDX"], "Demographic": ["AGE23X"]})
+
+    assert summary["rows"] == 2 and summary["population"] == 4.0
+    assert [entry["name"] for entry in summary["features"]] == ["CHOLDX", "AGE23X", "HIBPDX"]
+    assert summary["features"][0]["mean_abs_shap_2023_usd"] == pytest.approx(50.0)
+    assert summary["features"][1]["mean_abs_shap_2023_usd"] == pytest.approx(25.0)
+    assert summary["features"][1]["mean_shap_2023_usd"] == pytest.approx(-20.0)
+    assert summary["groups"][0] == {"name": "Chronic conditions", "rank": 1, "mean_abs_shap_2023_usd": pytest.approx(50.0), "mean_shap_2023_usd": pytest.approx(50.0)}
+
+
+def test_background_validation_uses_absolute_relative_difference():
+    assert validate_shap_background(540.0, 500.0)["passed"]
+    validation = validate_shap_background(440.0, 500.0)
+    assert validation["relative_difference"] == pytest.approx(-0.12)
+    assert validation["absolute_relative_difference"] == pytest.approx(0.12)
+    assert not validation["passed"]
+
+
+@pytest.mark.parametrize("method", ["kmeans", "kmedoids"])
+def test_summarized_background_keeps_weighted_training_baseline(preprocessor_input_data, fitted_artifacts, method):
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    training_baseline = np.average(_predict_median_cost(preprocessor, model, X), weights=w)
+
+    background, background_weights = build_shap_background(X, w, 40, method=method, preprocessor=preprocessor, model=model)
+
+    assert len(background) == 40 and background.index.isin(X.index).all()
+    assert background_weights.sum() == pytest.approx(1.0)
+    background_baseline = np.average(_predict_median_cost(preprocessor, model, background), weights=background_weights)
+    assert validate_shap_background(background_baseline, training_baseline, max_abs_relative_difference=0.05)["passed"]
+
+
+def test_weighted_background_is_saved_and_explained_with_its_weights(preprocessor_input_data, fitted_artifacts, tmp_path):
+    X, _, w = preprocessor_input_data
+    preprocessor, model = fitted_artifacts
+    background, background_weights = build_shap_background(X, w, 30, method="kmedoids", preprocessor=preprocessor, model=model)
+    save_shap_background(background, background_weights, tmp_path / "shap_background.parquet")
+
+    loaded_background, loaded_weights = load_shap_background(tmp_path / "shap_background.parquet")
+    explanation = PermutationShapExplainer(preprocessor, model, loaded_background, loaded_weights, max_evals=110).explain(X.iloc[:3])
+
+    pd.testing.assert_frame_equal(loaded_background, background)
+    np.testing.assert_allclose(loaded_weights, background_weights)
+    assert explanation["base_values"][0] == pytest.approx(np.average(_predict_median_cost(preprocessor, model, background), weights=background_weights))
+    np.testing.assert_allclose(
+        explanation["base_values"] + explanation["values"].sum(axis=1),
+        _predict_median_cost(preprocessor, model, X.iloc[:3]),
+        rtol=1e-9,
+    )
+
+
+def test_summarized_background_requires_fitted_artifacts(preprocessor_input_data):
+    X, _, w = preprocessor_input_data
+
+    with pytest.raises(ValueError, match="requires the fitted preprocessor and model"):
+        build_shap_background(X, w, 10, method="kmedoids")
+    with pytest.raises(ValueError, match="Unknown SHAP background method"):
+        build_shap_background(X, w, 10, method="kmodes")
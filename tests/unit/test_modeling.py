@@ -0,0 +1,338 @@
+"""Unit tests for the shared model training and evaluation utilities.
+
+These tests focus on keeping tuning diagnostics comparable: the training-metric
+subsample must be identical across trials, preserve the stratified cost
+distribution, training metrics must only be computed on the selected rows,
+parallel cross-validation folds must match sequential folds, offline MLflow
+runs must keep their params, metrics, and parent-child relations when uploaded,
+runs logged from a parent process must match tracked train_and_evaluate runs,
+cached dataset digests must change whenever the Parquet content changes, the
+approximate-kernel SVM must keep the log-target wrapper with configurable components,
+and the split loader must return the same data as loading the full DataFrame, from
+a memory-mapped cache that follows the Parquet content. Native XGBoost artifacts must
+reload as a predictor equivalent to the pickled model, and compact random forests must
+predict like the scikit-learn forest (including missing values) from a smaller artifact.
+Predictions must round-trip through .npy and Parquet files, with legacy .joblib fallback.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_modeling.py
+"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("mlflow")
+pytest.importorskip("xgboost")
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from xgboost import XGBRegressor
+
+from mlflow import MlflowClient
+
+from src.modeling import (
+    AsyncMlflowLogger,
+    CompactForestRegressor,
+    cross_validate_weighted,
+    get_baseline_models,
+    get_dataset_digest,
+    get_train_metrics_indices,
+    log_training_run,
+    load_model,
+    load_split,
+    resolve_tracking_uri,
+    save_model,
+    sync_offline_runs,
+    train_and_evaluate,
+    weighted_median_absolute_error,
+)
+
+pytestmark = [
+    pytest.mark.unit,
+    pytest.mark.filterwarnings("ignore:The filesystem tracking backend:FutureWarning"),
+]
+
+
+@pytest.fixture
+def cost_data():
+    rng = np.random.default_rng(0)
+    n = 2000
+    X = pd.DataFrame({"age": rng.integers(18, 86, n), "chronic_count": rng.integers(0, 8, n)}).astype(float)
+    # Zero-inflated, heavy-tailed costs as in MEPS
+    y = pd.Series(np.where(rng.random(n) < 0.3, 0.0, np.exp(rng.normal(6, 1.5, n))).round(2))
+    w = pd.Series(rng.uniform(500, 20_000, n))
+    return X, y, w
+
+
+def test_train_metrics_subsample_is_fixed_and_stratified(cost_data):
+    _, y, _ = cost_data
+
+    indices = get_train_metrics_indices(y, "subsample", n_samples=500)
+
+    np.testing.assert_array_equal(indices, get_train_metrics_indices(y, "subsample", n_samples=500))
+    assert len(indices) == 500
+    assert np.all(np.diff(indices) > 0)
+    assert (y.iloc[indices] == 0).mean() == pytest.approx((y == 0).mean(), abs=0.01)
+
+
+@pytest.mark.parametrize("strategy", ["full", "off"])
+def test_train_metrics_full_and_off_use_no_subsample(cost_data, strategy):
+    _, y, _ = cost_data
+
+    assert get_train_metrics_indices(y, strategy, n_samples=500) is None
+
+
+def test_train_metrics_rejects_unknown_strategy(cost_data):
+    _, y, _ = cost_data
+
+    with pytest.raises(ValueError, match="Unknown train metrics strategy"):
+        get_train_metrics_indices(y, "sample", n_samples=500)
+
+
+def test_train_and_evaluate_computes_train_metrics_on_subsample(cost_data):
+    X, y, w = cost_data
+    indices = get_train_metrics_indices(y, "subsample", n_samples=500)
+
+    result = train_and_evaluate(LinearRegression(), X, y, X, y, w, w, train_metrics_indices=indices)
+
+    y_pred = result["fitted_model"].predict(X.iloc[indices])
+    expected_mdae = weighted_median_absolute_error(y.iloc[indices], y_pred, sample_weight=w.iloc[indices])
+    assert result["train_mdae"] == pytest.approx(expected_mdae)
+
+
+def test_train_and_evaluate_logs_dataset_inputs_only_for_passed_paths(tmp_path, monkeypatch, cost_data):
+    import mlflow
+
+    X, y, w = cost_data
+    monkeypatch.chdir(tmp_path)  # Default digest cache (data/dataset_digests.json)
+    X.assign(cost=y).to_parquet(tmp_path / "train.parquet")
+    mlflow.set_tracking_uri(f"file:{tmp_path / 'mlruns'}")
+    try:
+        mlflow.set_experiment("Lineage")
+        train_and_evaluate(LinearRegression(), X.head(500), y.head(500), X, y, w.head(500), w, track_mlflow=True, model_name="Subsample")
+        train_and_evaluate(LinearRegression(), X, y, X, y, w, w, track_mlflow=True, model_name="Full", train_data_path="train.parquet")
+        runs = {run.info.run_name: run for run in mlflow.search_runs(output_format="list")}
+    finally:
+        mlflow.set_tracking_uri(None)
+
+    assert runs["Subsample"].inputs.dataset_inputs == []
+    [dataset_input] = runs["Full"].inputs.dataset_inputs
+    assert dataset_input.dataset.name == "training_data"
+    assert dataset_input.dataset.digest == get_dataset_digest("train.parquet")["digest"]
+
+
+def test_log_training_run_matches_tracked_train_and_evaluate(tmp_path, monkeypatch, cost_data):
+    import mlflow
+
+    X, y, w = cost_data
+    monkeypatch.chdir(tmp_path)
+    X.assign(cost=y).to_parquet(tmp_path / "train.parquet")
+    mlflow.set_tracking_uri(f"file:{tmp_path / 'mlruns'}")
+    try:
+        mlflow.set_experiment("Parent Logging")
+        train_and_evaluate(LinearRegression(), X, y, X, y, w, w, track_mlflow=True, model_name="Tracked", train_data_path="train.parquet")
+        result = train_and_evaluate(LinearRegression(), X, y, X, y, w, w)
+        log_training_run("Parent", LinearRegression().get_params(), result, train_data_path="train.parquet")
+        runs = {run.info.run_name: run for run in mlflow.search_runs(output_format="list")}
+    finally:
+        mlflow.set_tracking_uri(None)
+
+    tracked, parent = runs["Tracked"].data, runs["Parent"].data
+    assert parent.params == tracked.params
+    assert parent.metrics.keys() == tracked.metrics.keys()
+    assert parent.metrics["val_mdae"] == pytest.approx(tracked.metrics["val_mdae"])
+    assert parent.tags["data_source"] == tracked.tags["data_source"]
+    assert [i.dataset.digest for i in runs["Parent"].inputs.dataset_inputs] == [i.dataset.digest for i in runs["Tracked"].inputs.dataset_inputs]
+
+
+def test_approximate_svm_uses_configured_components_in_log_target_wrapper(cost_data):
+    X, y, w = cost_data
+
+    model = get_baseline_models(svr_approx_n_components=50)["Approximate SVM"]
+    result = train_and_evaluate(model, X, y, X, y, w, w, calculate_train_metrics=False)
+
+    fitted_pipeline = result["fitted_model"].regressor_
+    assert fitted_pipeline.named_steps["kernel"].components_.shape == (50, X.shape[1])
+    assert result["fitted_model"].func is np.log1p
+    assert np.all(result["fitted_model"].predict(X) > -1)  # expm1 of log-cost predictions
+
+
+def test_cross_validate_weighted_parallel_matches_sequential(cost_data):
+    X, y, w = cost_data
+
+    sequential = cross_validate_weighted(LinearRegression(), X, y, w, n_splits=3, n_jobs=1)
+    parallel = cross_validate_weighted(LinearRegression(), X, y, w, n_splits=3, n_jobs=2)
+
+    assert [fold["n_val"] for fold in sequential["folds"]] == [667, 667, 666]
+    for metric in ["val_mdae", "val_mae", "val_r2", "oof_mdae"]:
+        assert parallel[metric] == pytest.approx(sequential[metric])
+    np.testing.assert_allclose(parallel["y_oof_pred"], sequential["y_oof_pred"])
+
+
+def test_cross_validate_weighted_scores_folds_with_survey_weights(cost_data):
+    X, y, w = cost_data
+
+    result = cross_validate_weighted(LinearRegression(), X, y, w, n_splits=3, n_jobs=1)
+
+    assert result["oof_mdae"] == pytest.approx(weighted_median_absolute_error(y, result["y_oof_pred"], sample_weight=w))
+    assert result["val_mdae"] == pytest.approx(np.mean([fold["val_mdae"] for fold in result["folds"]]))
+
+
+def test_resolve_tracking_uri_falls_back_when_server_is_unreachable():
+    assert resolve_tracking_uri("http://127.0.0.1:9", fallback_uri="sqlite:///offline.db", timeout=0.5) == "sqlite:///offline.db"
+    assert resolve_tracking_uri("file:./mlruns") == "file:./mlruns"
+
+
+def test_async_logger_runs_are_uploaded_with_parent_relation(tmp_path):
+    source_uri, target_uri = f"file:{tmp_path / 'offline'}", f"file:{tmp_path / 'server'}"
+    source = MlflowClient(tracking_uri=source_uri)
+    experiment_id = source.create_experiment("Tuning")
+    parent_run_id = source.create_run(experiment_id, run_name="Search").info.run_id
+
+    with AsyncMlflowLogger(source_uri, experiment_id) as tracker:
+        for i in range(3):
+            tracker.log_run(f"Trial {i}", params={"max_depth": i}, metrics={"val_mdae": 100.0 + i}, parent_run_id=parent_run_id)
+    assert tracker.errors == []
+
+    assert sync_offline_runs(source_uri, target_uri) == 4
+    assert sync_offline_runs(source_uri, target_uri) == 0  # Uploaded runs are skipped
+
+    target = MlflowClient(tracking_uri=target_uri)
+    runs = target.search_runs([target.get_experiment_by_name("Tuning").experiment_id])
+    new_parent_id = next(run.info.run_id for run in runs if run.info.run_name == "Search")
+    trials = sorted((run for run in runs if run.info.run_name.startswith("Trial")), key=lambda run: run.info.run_name)
+    assert [run.data.params["max_depth"] for run in trials] == ["0", "1", "2"]
+    assert [run.data.metrics["val_mdae"] for run in trials] == [100.0, 101.0, 102.0]
+    assert all(run.data.tags["mlflow.parentRunId"] == new_parent_id for run in trials)
+
+
+def test_dataset_digest_is_cached_and_follows_content(tmp_path, cost_data):
+    X, y, _ = cost_data
+    parquet_path, cache_path = tmp_path / "train.parquet", tmp_path / "digests.json"
+    X.assign(cost=y).to_parquet(parquet_path)
+    md5 = hashlib.md5(parquet_path.read_bytes()).hexdigest()
+
+    entry = get_dataset_digest(parquet_path, cache_path)
+
+    assert entry["md5"] == md5  # Hash of the file bytes (dvc.lock may be stale)
+    assert entry["num_rows"] == len(X)
+    assert get_dataset_digest(parquet_path, cache_path) == entry
+
+    X.head(100).assign(cost=y.head(100)).to_parquet(parquet_path)  # New content
+    changed_entry = get_dataset_digest(parquet_path, cache_path)
+    assert changed_entry["digest"] != entry["digest"]
+    assert changed_entry["num_rows"] == 100
+
+
+def _write_model_ready_split(path, X, y, w):
+    df = X.assign(TOTSLF23=y, PERWT23F=w).rename_axis("DUPERSID")
+    df.index = df.index + 10_000
+    df.to_parquet(path)
+    return df
+
+
+def test_load_split_matches_full_dataframe(tmp_path, cost_data):
+    df = _write_model_ready_split(tmp_path / "train.parquet", *cost_data)
+
+    X, y, w = load_split(tmp_path / "train.parquet")
+
+    pd.testing.assert_frame_equal(X, df.drop(columns=["TOTSLF23", "PERWT23F"]))
+    pd.testing.assert_series_equal(y, df["TOTSLF23"])
+    pd.testing.assert_series_equal(w, df["PERWT23F"])
+    assert X.to_numpy().flags["C_CONTIGUOUS"]
+
+
+def test_load_split_cache_is_memory_mapped_and_keyed_by_content(tmp_path, cost_data):
+    parquet_path, cache_dir = tmp_path / "train.parquet", tmp_path / "cache"
+    df = _write_model_ready_split(parquet_path, *cost_data)
+
+    load_split(parquet_path, cache_dir=cache_dir)  # Writes the cache entry
+    X, y, w = load_split(parquet_path, cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(X, df.drop(columns=["TOTSLF23", "PERWT23F"]))
+    pd.testing.assert_series_equal(y, df["TOTSLF23"])
+    pd.testing.assert_series_equal(w, df["PERWT23F"])
+    assert not X.to_numpy().flags["WRITEABLE"]  # Read-only view of the memory-mapped .npy file
+    [entry_dir] = [path for path in cache_dir.iterdir() if path.is_dir()]
+
+    _write_model_ready_split(parquet_path, *(data.head(100) for data in cost_data))  # New content
+    X_changed, _, _ = load_split(parquet_path, cache_dir=cache_dir)
+
+    assert len(X_changed) == 100
+    assert not entry_dir.exists()  # Entry of the previous file version is removed
+
+
+def test_load_split_cache_follows_same_size_rewrite(tmp_path, cost_data):
+    parquet_path, cache_dir = tmp_path / "train.parquet", tmp_path / "cache"
+    X, y, w = cost_data
+    write_options = {"compression": None, "use_dictionary": False}  # Fixed-width pages: same size for new values
+    X.assign(TOTSLF23=y, PERWT23F=w).to_parquet(parquet_path, **write_options)
+    size = parquet_path.stat().st_size
+    load_split(parquet_path, cache_dir=cache_dir)
+
+    X.assign(TOTSLF23=y + 1.0, PERWT23F=w).to_parquet(parquet_path, **write_options)  # Regenerated outside dvc repro
+    os.utime(parquet_path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    _, y_loaded, _ = load_split(parquet_path, cache_dir=cache_dir)
+
+    assert parquet_path.stat().st_size == size
+    np.testing.assert_array_equal(y_loaded, y + 1.0)
+
+
+def test_native_xgboost_artifact_reloads_equivalent_quantile_predictor(tmp_path, cost_data):
+    X, y, w = cost_data
+    model = TransformedTargetRegressor(
+        regressor=XGBRegressor(objective="reg:quantileerror", quantile_alpha=np.array([0.25, 0.5, 0.9]), n_estimators=20, n_jobs=1),
+        func=np.log1p,
+        inverse_func=np.expm1
+    ).fit(X, y, sample_weight=w)
+
+    save_model(model, tmp_path / "xgb_quantile_model.ubj", verbose=False)
+    loaded_model = load_model(tmp_path / "xgb_quantile_model.ubj", verbose=False)
+
+    np.testing.assert_array_equal(loaded_model.predict(X), model.predict(X))
+    assert loaded_model.regressor_.get_params()["quantile_alpha"] == pytest.approx([0.25, 0.5, 0.9])
+    assert list(loaded_model.feature_names_in_) == list(X.columns)
+
+
+def test_compact_forest_matches_random_forest_predictions(tmp_path, cost_data):
+    X, y, w = cost_data
+    X_missing = X.copy()
+    X_missing.iloc[::5, 1] = np.nan
+    model = TransformedTargetRegressor(
+        regressor=RandomForestRegressor(n_estimators=20, min_samples_leaf=5, random_state=0, n_jobs=1),
+        func=np.log1p,
+        inverse_func=np.expm1
+    ).fit(X_missing, y, sample_weight=w)
+
+    compact_model = CompactForestRegressor.from_model(model)
+    save_model(model, tmp_path / "rf_model.joblib", verbose=False)
+    save_model(compact_model, tmp_path / "rf_compact_model.joblib", verbose=False)
+    loaded_model = load_model(tmp_path / "rf_compact_model.joblib", verbose=False)
+
+    for X_eval in [X, X_missing]:
+        np.testing.assert_allclose(np.log1p(loaded_model.predict(X_eval)), np.log1p(model.predict(X_eval)), rtol=0, atol=1e-5)
+    np.testing.assert_array_equal(loaded_model.predict(X_missing[X.columns[::-1]]), loaded_model.predict(X_missing))  # Columns matched by name
+    assert (tmp_path / "rf_compact_model.joblib").stat().st_size < (tmp_path / "rf_model.joblib").stat().st_size / 2
+
+
+def test_predictions_are_stored_without_pickle_and_legacy_files_still_load(tmp_path, cost_data):
+    _, y, _ = cost_data
+    y_pred = np.column_stack([y * 0.5, y, y * 2])
+    y_pred_by_id = pd.Series(y.to_numpy(), index=pd.Index(y.index + 10_000, name="DUPERSID"), name="y_pred")
+
+    save_model(y_pred, tmp_path / "quantile_predictions.npy", verbose=False)
+    save_model(y_pred_by_id, tmp_path / "llm_predictions.parquet", verbose=False)
+    save_model(y_pred, tmp_path / "legacy_predictions.joblib", verbose=False)
+
+    loaded_pred = load_model(tmp_path / "quantile_predictions.npy", verbose=False)
+    np.testing.assert_array_equal(loaded_pred, y_pred)
+    assert isinstance(loaded_pred, np.memmap)
+    pd.testing.assert_frame_equal(load_model(tmp_path / "llm_predictions.parquet", verbose=False), y_pred_by_id.to_frame())
+    np.testing.assert_array_equal(load_model(tmp_path / "legacy_predictions.npy", verbose=False), y_pred)  # Falls back to .joblib
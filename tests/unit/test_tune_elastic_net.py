@@ -0,0 +1,40 @@
+"""Unit tests for the regularization path mode of the Elastic Net tuning script.
+
+These tests focus on trials actually sharing regularization paths: snapped l1_ratios
+must lie on the path grid with all other parameters unchanged, so the sampled
+configurations collapse onto a few (interaction_only, l1_ratio) paths.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_tune_elastic_net.py
+"""
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("mlflow")
+
+from collections import Counter
+
+from scripts import tune_elastic_net as tuning_script
+from src.params import EN_PARAM_DISTRIBUTIONS
+from src.tuning import get_param_sampler
+
+pytestmark = pytest.mark.unit
+
+
+def test_snapped_l1_ratios_lie_on_grid_and_keep_other_params():
+    param_list = get_param_sampler(EN_PARAM_DISTRIBUTIONS, n_iter=50).param_list
+    snapped = tuning_script.snap_l1_ratios(param_list)
+
+    for params, snapped_params in zip(param_list, snapped):
+        assert snapped_params["model__l1_ratio"] in tuning_script.PATH_L1_RATIO_GRID
+        assert abs(snapped_params["model__l1_ratio"] - params["model__l1_ratio"]) <= 0.1 + 1e-12
+        assert {k: v for k, v in snapped_params.items() if k != "model__l1_ratio"} == {k: v for k, v in params.items() if k != "model__l1_ratio"}
+
+
+def test_snapped_configurations_share_regularization_paths():
+    snapped = tuning_script.snap_l1_ratios(get_param_sampler(EN_PARAM_DISTRIBUTIONS, n_iter=50).param_list)
+    path_sizes = Counter((params["polynomials__interaction_only"], params["model__l1_ratio"]) for params in snapped)
+
+    assert len(path_sizes) <= 2 * len(tuning_script.PATH_L1_RATIO_GRID)
+    assert sum(size for size in path_sizes.values() if size > 1) > 40
@@ -0,0 +1,60 @@
+"""Unit tests for the warm-start mode of the Random Forest tuning script.
+
+These tests focus on keeping the randomized search budget and the tree reuse
+honest: the warm-start mode and out-of-bag signal are opt-in, warm-start groups
+must hold exactly N_ITER configurations, every group must share its base
+configuration across ascending candidate tree counts, and growing a group's
+forest with warm_start must match fitting each tree count from scratch.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_tune_random_forest.py
+"""
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("mlflow")
+
+import numpy as np
+import pandas as pd
+
+from scripts import tune_random_forest as tuning_script
+from src.params import RF_PARAM_DISTRIBUTIONS
+
+pytestmark = pytest.mark.unit
+
+
+def test_warm_start_groups_hold_exactly_n_iter_configurations():
+    groups = tuning_script.sample_warm_start_trials(RF_PARAM_DISTRIBUTIONS, n_iter=50)
+
+    assert sum(len(tree_counts) for _, tree_counts in groups) == 50
+    assert len(groups) == 17
+    assert all(tree_counts == [200, 300, 400] for _, tree_counts in groups[:-1])
+    assert groups[-1][1] == [200, 300]
+    assert all("n_estimators" not in base_params for base_params, _ in groups)
+    assert len({tuple(sorted(base_params.items())) for base_params, _ in groups}) == len(groups)
+
+
+def test_warm_start_and_oob_signal_are_opt_in():
+    assert tuning_script.USE_WARM_START is False
+    assert tuning_script.OVERFITTING_SIGNAL == "train"
+
+
+def test_warm_start_forest_matches_forests_fitted_from_scratch(monkeypatch):
+    monkeypatch.setattr(tuning_script, "OVERFITTING_SIGNAL", "oob")
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 4)), columns=["a", "b", "c", "d"])
+    y = pd.Series(np.exp(X["a"] + rng.normal(0, 0.5, 300)))
+    w = pd.Series(rng.uniform(1, 5, 300))
+    base_params = {"max_depth": 4, "min_samples_split": 20, "min_samples_leaf": 10, "max_features": 0.5, "max_samples": 0.8}
+
+    results = list(tuning_script.evaluate_with_warm_start([(base_params, [20, 40])], X, y, w, X, y, w))
+
+    assert [params["n_estimators"] for params, _ in results] == [20, 40]
+    assert [result["trees_built"] for _, result in results] == [20, 20]
+    assert results[0][1]["cumulative_training_time"] == results[0][1]["training_time"]
+    assert results[1][1]["cumulative_training_time"] == pytest.approx(results[0][1]["training_time"] + results[1][1]["training_time"])
+    for params, result in results:
+        expected = tuning_script.fit_and_evaluate_trial(params, X, y, w, X, y, w)
+        assert result["val_mdae"] == pytest.approx(expected["val_mdae"])
+        assert result["oob_mdae"] == pytest.approx(expected["oob_mdae"])
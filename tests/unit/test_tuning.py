@@ -0,0 +1,148 @@
+"""Unit tests for the hyperparameter search samplers.
+
+These tests focus on keeping tuning runs comparable: random search must reproduce
+the original ParameterSampler trials, TPE proposals must stay inside the search
+spaces defined in src/params.py, the Elastic Net regularization path must
+select the same models as independent ElasticNet fits, and the shared-filesystem
+trial queue must run every trial exactly once across worker processes.
+
+Run from the project root:
+    .venv-test/Scripts/python -m pytest tests/unit/test_tuning.py
+"""
+
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("scipy")
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.linear_model import ElasticNet
+from sklearn.model_selection import ParameterSampler
+
+from src.params import EN_PARAM_DISTRIBUTIONS, RF_PARAM_DISTRIBUTIONS, XGB_PARAM_DISTRIBUTIONS
+from src.tuning import FileTrialQueue, _BaseSampler, get_param_sampler, prepare_weighted_design, run_queue_worker, weighted_elastic_net_path
+
+pytestmark = pytest.mark.unit
+
+
+def test_random_sampler_reproduces_parameter_sampler():
+    sampler = get_param_sampler(RF_PARAM_DISTRIBUTIONS, n_iter=10, sampler="random", random_state=42)
+
+    asked_params = [sampler.ask()[1] for _ in range(10)]
+
+    assert asked_params == list(ParameterSampler(RF_PARAM_DISTRIBUTIONS, n_iter=10, random_state=42))
+
+
+@pytest.mark.parametrize("param_distributions", [EN_PARAM_DISTRIBUTIONS, RF_PARAM_DISTRIBUTIONS, XGB_PARAM_DISTRIBUTIONS])
+def test_tpe_sampler_proposals_stay_inside_search_space(param_distributions):
+    sampler = get_param_sampler(param_distributions, n_iter=30, sampler="tpe", random_state=42)
+
+    trials = sampler.optimize(lambda params: sum(hash(str(value)) % 97 for value in params.values()), n_trials=30, n_workers=3)
+
+    assert len(trials) == 30
+    for trial in trials:
+        for name, value in trial["params"].items():
+            distribution = param_distributions[name]
+            if isinstance(distribution, list):
+                assert value in distribution
+            else:
+                low, high = distribution.support()
+                assert low <= value <= high
+
+
+def test_tpe_sampler_concentrates_on_better_region():
+    sampler = get_param_sampler(XGB_PARAM_DISTRIBUTIONS, n_iter=60, sampler="tpe", random_state=42)
+
+    sampler.optimize(lambda params: abs(params["max_depth"] - 4) + abs(params["learning_rate"] - 0.05) * 10, n_trials=60)
+
+    assert sampler.best_trial["params"]["max_depth"] == 4
+
+
+def test_get_param_sampler_rejects_unknown_sampler():
+    with pytest.raises(ValueError, match="Unknown sampler"):
+        get_param_sampler(XGB_PARAM_DISTRIBUTIONS, n_iter=10, sampler="grid")
+
+
+def test_sampler_without_propose_fails_at_instantiation():
+    class IncompleteSampler(_BaseSampler):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSampler()
+
+
+def test_weighted_elastic_net_path_matches_independent_elastic_net_fits():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 8))
+    y = X @ rng.normal(size=8) + rng.normal(size=500)
+    w = rng.uniform(0.5, 3.0, size=500)
+    alphas = [0.3, 0.01, 0.1]  # Unsorted on purpose: results must follow input order
+
+    coefs, intercepts = weighted_elastic_net_path(prepare_weighted_design(X, y, w), l1_ratio=0.4, alphas=alphas, tol=1e-10)
+
+    for k, alpha in enumerate(alphas):
+        model = ElasticNet(alpha=alpha, l1_ratio=0.4, tol=1e-10, max_iter=10_000).fit(X, y, sample_weight=w)
+        np.testing.assert_allclose(coefs[:, k], model.coef_, atol=1e-6)
+        assert intercepts[k] == pytest.approx(model.intercept_, abs=1e-6)
+
+
+def _queue_objective(params):
+    if params["max_depth"] == 3:
+        raise ValueError("diverged")
+    return {"val_mdae": params["max_depth"] * params["learning_rate"]}
+
+
+def _run_queue_worker(queue_dir, worker_id):
+    return run_queue_worker(FileTrialQueue(queue_dir), _queue_objective, worker_id=worker_id, poll_interval=0.01)
+
+
+def test_file_trial_queue_runs_each_trial_once_across_processes(tmp_path):
+    queue = FileTrialQueue(tmp_path, poll_interval=0.01)
+    sampler = get_param_sampler(XGB_PARAM_DISTRIBUTIONS, n_iter=40, sampler="random", random_state=42)
+    trials = [sampler.ask() for _ in range(40)]
+    for trial_id, params in trials:
+        queue.put(trial_id, params)
+    queue.close()
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        n_trials_per_worker = list(executor.map(_run_queue_worker, [tmp_path] * 4, [f"worker-{k}" for k in range(4)]))
+
+    results = queue.results()
+    assert sum(n_trials_per_worker) == 40
+    assert [result["trial_id"] for result in results] == list(range(40))
+    assert queue.counts() == {"pending": 0, "running": 0, "results": 40}
+    for (_, params), result in zip(trials, results):
+        assert result["params"] == pytest.approx(params)
+        if params["max_depth"] == 3:
+            assert result["metrics"] is None and result["error"] == "ValueError: diverged"
+        else:
+            assert result["metrics"]["val_mdae"] == pytest.approx(params["max_depth"] * params["learning_rate"])
+
+
+def test_file_trial_queue_requeues_stale_claims(tmp_path):
+    queue = FileTrialQueue(tmp_path)
+    queue.put(0, {"max_depth": 4})
+    assert queue.claim("crashed-worker") == (0, {"max_depth": 4})
+
+    assert queue.requeue_stale(max_age=3600) == []
+    assert queue.requeue_stale(max_age=0) == [0]
+    assert queue.claim("worker") == (0, {"max_depth": 4})
+
+
+def test_file_trial_queue_slow_holder_keeps_lock_taken_after_stale_break(tmp_path):
+    slow_queue, queue = FileTrialQueue(tmp_path, lock_timeout=60.0), FileTrialQueue(tmp_path, lock_timeout=60.0, poll_interval=0.01)
+    lock_path = tmp_path / "queue.lock"
+
+    with slow_queue._lock():
+        os.utime(lock_path, (time.time() - 120, time.time() - 120))  # Held longer than lock_timeout
+        lock = queue._lock()
+        lock.__enter__()  # Breaks the stale lock and takes it
+        new_token = lock_path.read_text(encoding="utf-8")
+
+    assert lock_path.read_text(encoding="utf-8") == new_token  # Slow holder did not remove the new owner's lock
+    lock.__exit__(None, None, None)
+    assert not lock_path.exists()